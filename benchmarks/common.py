@@ -0,0 +1,123 @@
+"""
+Shared utilities of the benchmarks: the synthetic cases, which are built from the
+structures in `egxc.systems.examples`, the timing of jitted and host functions and the
+JSON report.
+"""
+
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+from dataclasses import dataclass, asdict
+
+import jax
+import numpy as onp
+
+from egxc.dataloading.base import RawSample, Targets
+from egxc.systems import examples
+from egxc.utils.typing import Alignment
+
+from typing import Any, Callable, Dict, List
+
+Result = Dict[str, Any]
+
+
+@dataclass(frozen=True)
+class Case:
+    molecule: str  # neutral molecule of `egxc.systems.examples`
+    basis: str
+    grid_level: int
+    # of the atoms and basis functions, the grid is aligned to 128 times this value
+    # (cf. `egxc.systems.examples`)
+    alignment: int
+
+    @property
+    def name(self) -> str:
+        return f'{self.molecule}/{self.basis}/grid-{self.grid_level}/align-{self.alignment}'
+
+    @property
+    def padding(self) -> Alignment:
+        if self.alignment > 1:
+            return Alignment(self.alignment, self.alignment, 128 * self.alignment)
+        return Alignment()
+
+    def raw_sample(self) -> RawSample:
+        """The sample as it is returned by a dataset, i.e., before preloading."""
+        psys = examples.get_preloaded(
+            self.molecule, 'sto-3g', alignment=1, include_grid=False
+        )
+        atom_z = onp.asarray(psys.atom_z.array)  # type: ignore
+        spin = int(atom_z.sum()) % 2
+        return (onp.asarray(psys.nuc_pos), atom_z, 0, spin), Targets(None, None, None)
+
+
+def time_host(fn: Callable[[], Any], repeats: int) -> Result:
+    """Wall time of a host (python) function."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {'mean [s]': float(onp.mean(times)), 'min [s]': float(onp.min(times))}
+
+
+def time_jitted(fn: Callable, *args: Any, repeats: int) -> Result:
+    """
+    Compile time, execution time and peak memory of the jitted function. The peak memory
+    is the sum of the argument, output and temporary buffers of the compiled executable.
+    """
+    start = time.perf_counter()
+    compiled = jax.jit(fn).lower(*args).compile()
+    compile_time = time.perf_counter() - start
+    jax.block_until_ready(compiled(*args))  # warm up
+    result = {'compile [s]': compile_time}
+    result.update(time_host(lambda: jax.block_until_ready(compiled(*args)), repeats))
+    memory = compiled.memory_analysis()
+    if memory is not None:
+        peak = memory.temp_size_in_bytes + memory.argument_size_in_bytes
+        peak += memory.output_size_in_bytes
+        result['peak [MiB]'] = peak / 2**20
+    return result
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata() -> Dict[str, Any]:
+    return {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'jax': jax.__version__,
+        'backend': jax.default_backend(),
+        'device': str(jax.devices()[0]),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'x64': bool(jax.config.read('jax_enable_x64')),
+    }
+
+
+def write_report(path: str, config: Dict[str, Any], cases: List[Dict[str, Any]]) -> None:
+    report = {
+        'metadata': metadata(),
+        'config': config,
+        # of the whole process, including pyscf
+        'max rss [MiB]': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10,
+        'cases': cases,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def case_to_dict(case: Case) -> Dict[str, Any]:
+    return {'name': case.name, **asdict(case)}
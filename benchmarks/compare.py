@@ -0,0 +1,65 @@
+"""
+Compares two benchmark reports of run.py, e.g., of two commits:
+    python benchmarks/compare.py old.json new.json --threshold 0.1
+Prints the relative change of every metric of the cases and stages present in both
+reports and exits with a non-zero status if any metric regressed by more than the
+threshold.
+"""
+
+import argparse
+import json
+import sys
+
+from typing import Any, Dict, Iterator, Tuple
+
+METRICS = ('compile [s]', 'min [s]', 'peak [MiB]')
+
+
+def flatten(report: Dict[str, Any]) -> Dict[Tuple[str, str, str], float]:
+    return {
+        (case['name'], stage, metric): timing[metric]
+        for case in report['cases']
+        for stage, timing in case['stages'].items()
+        for metric in METRICS
+        if metric in timing
+    }
+
+
+def compare(
+    old: Dict[str, Any], new: Dict[str, Any]
+) -> Iterator[Tuple[Tuple[str, str, str], float, float, float]]:
+    old_values, new_values = flatten(old), flatten(new)
+    for key in old_values.keys() & new_values.keys():
+        before, after = old_values[key], new_values[key]
+        yield key, before, after, after / before - 1 if before > 0 else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f'{old["metadata"]["commit"]} -> {new["metadata"]["commit"]}')
+
+    regressions = 0
+    print(f'{"case":>40} {"stage":>16} {"metric":>12} {"old":>10} {"new":>10} {"change":>8}')
+    for (case, stage, metric), before, after, change in sorted(compare(old, new)):
+        flag = ' !' if change > args.threshold else ''
+        regressions += change > args.threshold
+        print(
+            f'{case:>40} {stage:>16} {metric:>12} {before:>10.4g} {after:>10.4g}'
+            f' {change:>+8.1%}{flag}'
+        )
+    print(f'{regressions} regression(s) above {args.threshold:.0%}')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
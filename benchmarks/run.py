@@ -0,0 +1,73 @@
+"""
+Benchmarks the stages of the training step (see stages.py) on synthetic systems built
+from the structures of `egxc.systems.examples` for all combinations of molecules, basis
+sets, grid levels and alignments. Each jitted stage reports its compile time, mean and
+minimum execution time and the peak memory of the compiled executable. The results are
+written to JSON, such that they can be compared between commits with compare.py, e.g.,
+    python benchmarks/run.py --molecules water ethanol --grid-levels 1 2 -o new.json
+    python benchmarks/compare.py old.json new.json
+Runs offline on the CPU by default.
+"""
+
+import argparse
+import itertools
+import traceback
+
+import jax
+
+from common import Case, case_to_dict, write_report
+from stages import STAGES, Setup
+from typing import Any, Dict
+
+
+def format_timing(timing: Dict[str, Any]) -> str:
+    return ' '.join(f'{k}: {v:.4g}' for k, v in timing.items() if isinstance(v, float))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--molecules', nargs='+', default=['water', 'ethanol'])
+    parser.add_argument('--bases', nargs='+', default=['sto-3g', '6-31G(d)'])
+    parser.add_argument('--grid-levels', type=int, nargs='+', default=[1])
+    parser.add_argument('--alignments', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--cycles', type=int, default=15, help='SCF cycles')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--platform', default='cpu')
+    parser.add_argument('-o', '--output', default='benchmark.json')
+    args = parser.parse_args()
+    jax.config.update('jax_platforms', args.platform)
+    # as in scripts/main.py
+    jax.config.update('jax_enable_x64', True)
+    jax.config.update('jax_default_matmul_precision', 'float32')
+
+    cases = [
+        Case(*combination)
+        for combination in itertools.product(
+            args.molecules, args.bases, args.grid_levels, args.alignments
+        )
+    ]
+    results = []
+    for case in cases:
+        print(f'##### {case.name}')
+        setup = Setup.create(case, args.cycles)
+        result = {**case_to_dict(case), **setup.sizes, 'stages': {}}
+        for name in args.stages:
+            try:
+                timing = STAGES[name](setup, args.repeats)
+            except Exception:  # e.g. out of memory, the remaining stages are still run
+                traceback.print_exc()
+                timing = {'error': traceback.format_exc(limit=1)}
+            result['stages'][name] = timing
+            print(f'{name:>16} {format_timing(timing)}')
+        results.append(result)
+        jax.clear_caches()  # the executables of the previous case are not reused
+
+    write_report(args.output, vars(args), results)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
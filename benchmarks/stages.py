@@ -0,0 +1,233 @@
+"""
+The stages of a training step, each of which is benchmarked in isolation on the
+same preloaded system. The system is set up as in the default training configuration,
+i.e., the Fock tensors are preloaded by the workers while the grid and the atomic
+orbitals are computed on the device by the input transform.
+"""
+
+from dataclasses import dataclass
+
+import jax
+import jax.numpy as jnp
+import e3nn_jax as e3nn
+
+from egxc.dataloading.base import RawSample
+from egxc.dataloading.transform import PreloadTransform, get_system_fn
+from egxc.discretization import get_grid_fn, get_gto_basis_fn, QuadratureGridFn, BasisFn
+from egxc.solver import fock
+from egxc.solver.scf import SelfConsistentFieldSolver
+from egxc.solver.scf.diis import DiisState, diis_update
+from egxc.systems import System, PreloadSystem, nuclear_energy
+from egxc.xc_energy import XCModule, DensityFeatures
+from egxc.xc_energy.functionals import EGXC, Dick2021
+from egxc.xc_energy.functionals.learnable import nn
+from egxc.utils.typing import ElectRepTensorType, FloatBxB
+
+from common import Case, Result, time_host, time_jitted
+from typing import Callable, Dict
+
+ERT_TYPE = ElectRepTensorType.DENSITY_FITTED
+DIIS_SUBSPACE_SIZE = 8
+
+
+@dataclass
+class Setup:
+    case: Case
+    scf_cycles: int
+    raw_sample: RawSample
+    preload_transform: PreloadTransform
+    psys: PreloadSystem
+    grid_fn: QuadratureGridFn
+    basis_fn: BasisFn
+    sys: System
+    initial_density_matrix: FloatBxB
+
+    @classmethod
+    def create(cls, case: Case, scf_cycles: int) -> 'Setup':
+        raw_sample = case.raw_sample()
+        preload_transform = PreloadTransform(
+            basis=case.basis,
+            spin_restricted=True,
+            alignment=case.padding,
+            ert_type=ERT_TYPE,
+            include_fock_tensors=True,
+            include_grid=False,
+            grid_level=case.grid_level,
+            center=False,
+        )
+        psys, _ = preload_transform.map(raw_sample)
+        (_, atom_z, _, _), _ = raw_sample
+        grid_fn = get_grid_fn(case.grid_level, atom_z, case.padding.grid)
+        basis_fn = get_gto_basis_fn(case.basis, max(psys.periods), deriv=1)  # type: ignore
+        system_fn = jax.jit(get_system_fn((grid_fn, basis_fn), None))
+        sys = system_fn(jnp.asarray(psys.nuc_pos), psys)
+        P_0 = jnp.asarray(psys.initial_density_matrix)
+        return cls(
+            case, scf_cycles, raw_sample, preload_transform, psys, grid_fn, basis_fn, sys, P_0
+        )
+
+    @property
+    def sizes(self) -> Dict[str, int]:
+        return {
+            'atoms': len(self.psys.atom_mask),
+            'basis functions': self.psys.max_number_of_basis_fns,
+            'grid points': self.sys.grid.coords.shape[0],
+        }
+
+
+Stage = Callable[[Setup, int], Result]
+STAGES: Dict[str, Stage] = {}
+
+
+def register_stage(name: str) -> Callable[[Stage], Stage]:
+    def register(stage: Stage) -> Stage:
+        STAGES[name] = stage
+        return stage
+
+    return register
+
+
+def xc_module() -> XCModule:
+    return XCModule(Dick2021(), DensityFeatures(True))
+
+
+@register_stage('preload')
+def preload(setup: Setup, repeats: int) -> Result:
+    """Latency of a data loader worker, i.e., the pyscf preloading of one sample."""
+    return time_host(lambda: setup.preload_transform.map(setup.raw_sample), repeats)
+
+
+@register_stage('input_transform')
+def input_transform(setup: Setup, repeats: int) -> Result:
+    """
+    Latency of the main thread input transform, i.e., grid, atomic orbitals and the
+    assembly of the System. In training, the inputs are donated to it.
+    """
+    system_fn = get_system_fn((setup.grid_fn, setup.basis_fn), None)
+    psys = setup.psys
+    return time_jitted(system_fn, jnp.asarray(psys.nuc_pos), psys, repeats=repeats)
+
+
+@register_stage('grid')
+def grid(setup: Setup, repeats: int) -> Result:
+    psys = setup.psys
+
+    def grid_fn(nuc_pos, atom_mask):
+        return setup.grid_fn(nuc_pos, psys.atom_z, atom_mask)  # type: ignore
+
+    args = jnp.asarray(psys.nuc_pos), jnp.asarray(psys.atom_mask)
+    return time_jitted(grid_fn, *args, repeats=repeats)
+
+
+@register_stage('ao')
+def ao(setup: Setup, repeats: int) -> Result:
+    """Atomic orbitals and their gradients on the grid."""
+    psys = setup.psys
+
+    def basis_fn(coords, nuc_pos, atom_mask):
+        return setup.basis_fn(
+            coords,
+            nuc_pos,
+            psys.atom_z.array,  # type: ignore
+            atom_mask,
+            psys.periods,  # type: ignore
+            psys.max_number_of_basis_fns,
+        )
+
+    args = setup.sys.grid.coords, setup.sys._nuc_pos, setup.sys.atom_mask
+    return time_jitted(basis_fn, *args, repeats=repeats)
+
+
+@register_stage('features')
+def features(setup: Setup, repeats: int) -> Result:
+    feature_fn = DensityFeatures(True)
+
+    def features_fn(P, aos, grad_aos):
+        return feature_fn.apply({}, P, aos, grad_aos)
+
+    grid = setup.sys.grid
+    args = setup.initial_density_matrix, grid.aos, grid.grad_aos
+    return time_jitted(features_fn, *args, repeats=repeats)
+
+
+@register_stage('fock')
+def fock_build(setup: Setup, repeats: int) -> Result:
+    """Coulomb and exchange-correlation (by automatic differentiation) matrices."""
+    module = fock.FockMatrix(xc_module(), ERT_TYPE, True)
+    sys, P = setup.sys, setup.initial_density_matrix
+    params = module.init(jax.random.PRNGKey(0), sys._nuc_pos, P, sys)
+
+    def fock_fn(params, P, sys):
+        return module.apply(params, sys._nuc_pos, P, sys)
+
+    return time_jitted(fock_fn, params, P, sys, repeats=repeats)
+
+
+@register_stage('diis')
+def diis(setup: Setup, repeats: int) -> Result:
+    sys, P = setup.sys, setup.initial_density_matrix
+    F = sys.fock_tensors.core_hamiltonian
+    state = DiisState.init(DIIS_SUBSPACE_SIZE, F, P, sys.fock_tensors)
+
+    def diis_fn(F, state, P, fock_tensors):
+        return diis_update(DIIS_SUBSPACE_SIZE // 2, F, state, P, fock_tensors)
+
+    return time_jitted(diis_fn, F, state, P, sys.fock_tensors, repeats=repeats)
+
+
+@register_stage('gnn')
+def gnn(setup: Setup, repeats: int) -> Result:
+    """
+    Exchange-correlation energy of EG-XC (encoder, PaiNN and decoder) with the
+    hyperparameters of the `egxc` configuration of scripts/main.py.
+    """
+    F = 128
+    functional = EGXC(
+        Dick2021(),
+        nn.Encoder(e3nn.Irreps('0e + 1o'), 5.0, 16),
+        nn.PaiNN(F, 5.0, 3),
+        nn.Decoder(F),
+        nn.SpatialReweighting(layers=2, hidden_dim=16),
+        use_graph_readout=True,
+    )
+    module = XCModule(functional, DensityFeatures(True))
+    sys, P = setup.sys, setup.initial_density_matrix
+    graph = {'nuc_pos': sys._nuc_pos, 'atom_mask': sys.atom_mask}
+    graph['grid_coords'] = sys.grid.coords
+    params = module.init(jax.random.PRNGKey(0), P, sys.grid, **graph)
+
+    def energy_fn(params, P, grid, graph):
+        return module.apply(params, P, grid, **graph)
+
+    return time_jitted(energy_fn, params, P, sys.grid, graph, repeats=repeats)
+
+
+@register_stage('scf')
+def scf(setup: Setup, repeats: int) -> Result:
+    """Forward pass of the SCF with DIIS."""
+    solver = SelfConsistentFieldSolver(xc_module(), setup.scf_cycles, ERT_TYPE)
+    sys, P = setup.sys, setup.initial_density_matrix
+    params = solver.init(jax.random.PRNGKey(0), P, sys)
+
+    def energy_fn(params, P, sys):
+        (e_hj, e_xc), _ = solver.apply(params, P, sys)
+        return (e_hj + e_xc)[-1] + nuclear_energy(sys._nuc_pos, sys)
+
+    return time_jitted(energy_fn, params, P, sys, repeats=repeats)
+
+
+@register_stage('backward')
+def backward(setup: Setup, repeats: int) -> Result:
+    """
+    Energy and parameter gradient of the SCF, i.e., the training step without the
+    optimizer update.
+    """
+    solver = SelfConsistentFieldSolver(xc_module(), setup.scf_cycles, ERT_TYPE)
+    sys, P = setup.sys, setup.initial_density_matrix
+    params = solver.init(jax.random.PRNGKey(0), P, sys)
+
+    def loss_fn(params, P, sys):
+        (e_hj, e_xc), _ = solver.apply(params, P, sys)
+        return (e_hj + e_xc)[-1] + nuclear_energy(sys._nuc_pos, sys)
+
+    return time_jitted(jax.value_and_grad(loss_fn), params, P, sys, repeats=repeats)
@@ -5,14 +5,20 @@ from seml.experiment import Experiment
 
 import e3nn_jax as e3nn
 
-from egxc.discretization import get_grid_fn, get_gto_basis_fn
+from egxc.discretization import get_grid_fn, get_gto_basis_fn, get_fock_tensors_fn
 from egxc import dataloading
+from egxc.solver.direct_minimization import DirectMinimizationSolver
 from egxc.solver.scf import SelfConsistentFieldSolver
 from egxc.xc_energy import XCModule, DensityFeatures, functionals
 from egxc.xc_energy.functionals.learnable import nn
-from egxc.training import loss, run
+from egxc.training import distributed, loss, run
+from egxc.training import warm_cache as warm_compilation_cache
+from egxc.training.checkpoint import CheckpointManager
 from egxc.training.optimizer import OptConfig, get_optimizer
+from egxc.inference import Predictor, predict_trajectory
+from egxc.utils import compilation_cache
 from egxc.utils.logging import Logger
+from egxc.utils.profiling import Profiler
 
 from egxc.utils.typing import ElectRepTensorType, NnParams, Alignment
 
@@ -35,16 +41,20 @@ def default_config():
         'project': 'egxc',
         'dir': './output_log',
         'name': None,
+        'every': 10,  # steps between reads of the device-side training metrics
+        'local_file': False,  # additionally writes {dir}/metrics.jsonl
     }
     base = {  # noqa: F841
         'seed': run_seed,
         'test': False,
         'epochs': 10_000,
         'use_density_fitting': True,
+        'direct_density_fitting': False,  # requires data.preload.include_fock_tensors=False
         'spin_restricted': True,
         'atom_alignment': 4,
         'basis_alignment': 4,
         'grid_alignment': 512,
+        'orthogonalizer': 'canonical',  # 'symmetric', 'cholesky'
     }
     basis = {  # noqa: F841
         'name': '6-31G(d)',  # 'sto-6g', '6-31G(d)' '6-31G(2df,p)' '6-311++G(3df,2pd)'
@@ -59,12 +69,48 @@ def default_config():
     }
     load_model_weights = False
     checkpointing = {  # noqa: F841
+        # initializes the model with the params of the latest checkpoint in load_path
         'load': load_model_weights,
-        'path': None,  # TODO
+        'load_path': None,
+        # checkpoints of this run after each epoch, resumed from if present
+        'path': None,
+        'keep': 3,
     }
     pretraining = {  # noqa: F841
         'epochs': 0 if load_model_weights else 100,
     }
+    profiling = {  # noqa: F841
+        'enabled': False,
+        'trace_dir': None,  # writes a Perfetto trace if set
+        'trace_start': 1,
+        'trace_steps': 5,
+    }
+    compilation_cache = {  # noqa: F841
+        # persistent across runs, populated ahead of time by the warm_cache command
+        'dir': './output_log/jax_cache',
+        'min_compile_time_secs': 1.0,
+        'warm_up_samples': None,  # per set to find the shape buckets, None: all
+    }
+    evaluation = {  # noqa: F841
+        'batch_size': 4,  # samples of a shape bucket evaluated at once
+        'scf_tolerance': 1e-6,  # early exit of the SCF, None: all cycles
+    }
+    inference = {  # noqa: F841
+        # single points of a trajectory with the params of checkpointing.load_path
+        'input': None,  # any file format supported by ASE
+        'output': './output_log/predictions.jsonl',
+        'index': ':',  # geometries of the trajectory
+        'format': None,  # inferred from the file extension
+        'forces': False,  # requires the forces named config
+        'workers': 4,  # preloading processes
+        'prefetch': 16,
+    }
+    distributed = {  # noqa: F841
+        # data-parallel training, one process per device, see training.distributed
+        'coordinator_address': 'localhost:12355',
+        'num_processes': 1,
+        'process_id': 0,
+    }
     model = {'graph': None}  # noqa: F841
     data = {  # noqa: F841
         'workers': 4,
@@ -131,13 +177,83 @@ def md17():
     }
 
 
+@ex.named_config
+def forces():
+    # forces differentiate the grid and fock tensors w.r.t. the nuclear positions
+    data = {  # noqa: F841
+        'preload': {'include_grid': False, 'include_fock_tensors': False},
+    }
+    loss = {  # noqa: F841
+        'relative_weights': {
+            'energy': 1.0,
+            'forces': 1.0,
+            'density': 0.0,
+        },
+    }
+
+
 @ex.named_config
 def scf():
     solver = {  # noqa: F841
         'solver': 'scf',
         'args': {
             'cycles': 15,
-            'convergence_acceleration_method': 'DIIS',
+            'convergence_acceleration_method': 'DIIS',  # 'EDIIS', 'ADIIS', 'Vanilla'
+            'diis_subspace_size': 8,
+            'density_matrix_solver': 'eigh',  # 'purification'
+            'purification_iterations': 50,
+        },
+    }
+
+
+@ex.named_config
+def direct_minimization():
+    solver = {  # noqa: F841
+        'solver': 'direct_minimization',
+        'args': {
+            'cycles': 15,  # L-BFGS iterations + 1
+            'memory_size': 10,
+            'occupied_orbitals': None,  # upper bound per spin, e.g., for large bases
+            'min_preconditioner_gap': 0.2,
+        },
+    }
+
+
+@ex.named_config
+def scf_schedule():
+    # for difficult systems, e.g., small HOMO-LUMO gaps or stretched bonds
+    solver = {  # noqa: F841
+        'args': {
+            'damping': 0.3,
+            'damping_step': 0.1,  # 0 for constant damping
+            'max_damping': 0.8,
+            'level_shift': 0.0,
+            'target_gap': 0.3,
+            'level_shift_threshold': 1e-3,
+        },
+    }
+
+
+@ex.named_config
+def implicit_differentiation():
+    solver = {  # noqa: F841
+        'args': {
+            'implicit_differentiation': True,
+            # cycles - loss.discard_first_n, the cycles weighted by the trajectory loss
+            'backprop_cycles': 5,
+            'adjoint_max_iterations': 20,
+            'adjoint_tolerance': 1e-8,
+        },
+    }
+
+
+@ex.named_config
+def gradient_checkpointing():
+    # see scripts/profile_checkpointing.py for the memory and runtime of each policy
+    solver = {  # noqa: F841
+        'args': {
+            'checkpoint_policy': 'fock_and_density',  # 'nothing', 'fock_build'
+            'checkpoint_every': 1,
         },
     }
 
@@ -154,7 +270,18 @@ def interpolate_initial_guess():  # TODO: Implement this
 
 @ex.named_config
 def checkpointing():
-    pass
+    checkpointing = {  # noqa: F841
+        'path': './output_log/checkpoints',
+    }
+
+
+@ex.named_config
+def profiling():
+    # per step data/transform/compute durations and recompilations, see utils.profiling
+    profiling = {  # noqa: F841
+        'enabled': True,
+        'trace_dir': './output_log/trace',
+    }
 
 
 name_to_functional = {
@@ -240,11 +367,27 @@ def egxc_ex_graph_readout():
 
 class ExperimentWrapper:
     @ex.capture(prefix='logging')  # type: ignore
-    def __init__(self, overwrite: int, project: str, dir: str, name: str | None) -> None:
+    def __init__(
+        self,
+        overwrite: int,
+        project: str,
+        dir: str,
+        name: str | None,
+        every: int,
+        local_file: bool,
+    ) -> None:
         # slurm_id = ex.current_run.
+        self.init_compilation_cache()  # type: ignore
+        self.init_distributed()  # type: ignore
         self.logger = Logger(
-            project, ex.current_run.config, dir=dir, name=f'{name}_{overwrite}'  # type: ignore
+            project,
+            ex.current_run.config,  # type: ignore
+            dir=dir,
+            name=f'{name}_{overwrite}',
+            enabled=distributed.is_main_process(),
+            local_file=local_file,
         )
+        self.log_every = every
         self.init_base()  # type: ignore
         self.init_dataset()  # type: ignore
         self.init_quadrature()  # type: ignore
@@ -254,6 +397,20 @@ class ExperimentWrapper:
         self.init_solver()  # type: ignore
         self.init_loss_config()  # type: ignore
         self.init_optimizer_config()  # type: ignore
+        self.init_profiler()  # type: ignore
+        self.init_checkpoints()  # type: ignore
+        self.init_evaluation()  # type: ignore
+
+    @ex.capture(prefix='compilation_cache')  # type: ignore
+    def init_compilation_cache(self, dir: str, min_compile_time_secs: float) -> None:
+        compilation_cache.initialize(dir, min_compile_time_secs)
+        self.cache_stats = compilation_cache.CacheStats()
+
+    @ex.capture(prefix='distributed')  # type: ignore
+    def init_distributed(
+        self, coordinator_address: str, num_processes: int, process_id: int
+    ) -> None:
+        distributed.initialize(coordinator_address, num_processes, process_id)
 
     @ex.capture(prefix='base')  # type: ignore
     def init_base(
@@ -262,17 +419,22 @@ class ExperimentWrapper:
         seed: int,
         epochs: int,
         use_density_fitting: bool,
+        direct_density_fitting: bool,
         spin_restricted: bool,
         atom_alignment: int,
         basis_alignment: int,
         grid_alignment: int,
+        orthogonalizer: str,
     ):
         self.test = test
+        self.orthogonalizer = orthogonalizer
         self.seed = seed
         self.epochs = epochs
         self.alignment = Alignment(atom_alignment, basis_alignment, grid_alignment)
 
-        if use_density_fitting:
+        if use_density_fitting and direct_density_fitting:
+            self.ert_type = ElectRepTensorType.DENSITY_FITTED_DIRECT
+        elif use_density_fitting:
             self.ert_type = ElectRepTensorType.DENSITY_FITTED
         else:
             self.ert_type = ElectRepTensorType.EXACT
@@ -322,19 +484,20 @@ class ExperimentWrapper:
             **preload,
         )
         self.dataloaders = dataloading.get_dataloaders(
-            self.dataset_ensemble, self.preload_transformations, shuffle, workers, seed
+            self.dataset_ensemble,
+            self.preload_transformations,
+            shuffle,
+            workers,
+            seed,
+            shard=jax.process_count() > 1,
         )
 
     @ex.capture(prefix='data')  # type: ignore
     def init_main_thread_transform(self, preload: Dict[str, bool]) -> None:
-        assert preload[
-            'include_fock_tensors'
-        ], 'GPU based FockTensor calculation not implemented'
-
+        max_p = self.dataset.max_period
         if not preload['include_grid']:
             elements = self.dataset.unique_elements
             grid_fn = get_grid_fn(self.grid_level, elements, self.alignment.grid)
-            max_p = self.dataset.max_period
             basis_fn = get_gto_basis_fn(
                 self.basis_str, max_p, deriv=self.basis_derivative
             )
@@ -342,11 +505,21 @@ class ExperimentWrapper:
         else:
             grid_and_basis = None
 
+        if not preload['include_fock_tensors']:
+            fock_tensors_fn = get_fock_tensors_fn(
+                self.basis_str, max_p, self.ert_type, orthogonalizer=self.orthogonalizer
+            )
+        else:
+            fock_tensors_fn = None
+
         transform = dataloading.get_jax_transform(
-            grid_and_basis,
-            None,  # TODO: implement GPU based FockTensor calculation
+            grid_and_basis, fock_tensors_fn, self.orthogonalizer
+        )
+        self.main_thread_transform = transform  # jitted, prefetched in run()
+        # differentiable w.r.t. nuc_pos if nothing is preloaded, required for forces
+        self.system_fn = dataloading.get_system_fn(
+            grid_and_basis, fock_tensors_fn, self.orthogonalizer
         )
-        self.main_thread_transform = transform  # FIXME: jax.jit(input_transform)
 
     @ex.capture(prefix='model')  # type: ignore
     def __xc_module(self, local: str, graph: Dict[str, Any] | None) -> XCModule:
@@ -388,8 +561,13 @@ class ExperimentWrapper:
                 **args,
             )
         elif solver == 'direct_minimization':
-            # TODO: Implement direct minimization solver
-            pass
+            self.cycles = args['cycles']
+            self.solver = DirectMinimizationSolver(
+                model,
+                ert_type=self.ert_type,
+                spin_restricted=self.spin_restricted,
+                **args,
+            )
         else:
             raise ValueError(f'Unknown solver: {solver}')
 
@@ -419,6 +597,21 @@ class ExperimentWrapper:
         self.early_stopping_patience = early_stopping_patience
         self.opt_config = OptConfig.from_dict(kwargs)
 
+    @ex.capture(prefix='profiling')  # type: ignore
+    def init_profiler(
+        self, enabled: bool, trace_dir: str | None, trace_start: int, trace_steps: int
+    ) -> None:
+        self.profiler = Profiler(enabled, trace_dir, trace_start, trace_steps)
+
+    @ex.capture(prefix='checkpointing')  # type: ignore
+    def init_checkpoints(self, path: str | None, keep: int) -> None:
+        self.checkpoints = None if path is None else CheckpointManager(path, keep)
+
+    @ex.capture(prefix='evaluation')  # type: ignore
+    def init_evaluation(self, batch_size: int, scf_tolerance: float | None) -> None:
+        self.eval_batch_size = batch_size
+        self.scf_tolerance = scf_tolerance
+
     @ex.capture(prefix='pretraining')  # type: ignore
     def pretrain(self, epochs: int) -> NnParams:
         assert epochs >= 0, 'Number of pretraining epochs must be non-negative'
@@ -428,24 +621,85 @@ class ExperimentWrapper:
         pass
 
     @ex.capture(prefix='checkpointing')  # type: ignore
-    def get_initial_model_params(self, load: bool) -> NnParams:
+    def get_initial_model_params(self, load: bool, load_path: str | None) -> NnParams:
+        psys = dataloading.get_sample_for_model_init(
+            self.dataset_ensemble.train, self.preload_transformations
+        )
+        P0, sys = self.main_thread_transform(psys)
+        params = self.model.init(jax.random.PRNGKey(self.seed), P0, sys)
         if load:
-            # TODO: Implement loading from checkpoint
-            raise NotImplementedError
-        else:
-            # initialize checkpointing
-            # TODO: Implement saving to checkpoint
-            # init_model
-            psys = dataloading.get_sample_for_model_init(
-                self.dataset_ensemble.train, self.preload_transformations
-            )
-            P0, sys = self.main_thread_transform(psys)
-            return self.model.init(jax.random.PRNGKey(self.seed), P0, sys)
+            assert load_path is not None, 'Loading requires checkpointing.load_path'
+            # restored into the structure of the freshly initialized params
+            state = CheckpointManager(load_path).restore_state({'params': params})
+            params = state['params']
+        return params
 
     @property
     def model(self):
         return self.solver
 
+    def report_cache_stats(self) -> None:
+        stats = self.cache_stats.summary()
+        print('#' * 20, ', '.join(f'{k}: {v:g}' for k, v in stats.items()))
+        self.logger.log(stats)
+
+    @ex.capture(prefix='compilation_cache')  # type: ignore
+    def warm_cache(self, warm_up_samples: int | None) -> None:
+        opt = get_optimizer(self.opt_config)
+        init_params = self.get_initial_model_params()  # type: ignore
+        n = warm_compilation_cache(
+            init_params,
+            self.model,
+            opt,
+            self.ema_decay,
+            self.loss_config,
+            self.dataloaders,
+            self.main_thread_transform,
+            self.system_fn,
+            warm_up_samples,
+            self.eval_batch_size,
+            self.scf_tolerance,
+        )
+        print('#' * 20, f'Compiled {n} shape buckets')
+        self.report_cache_stats()
+        self.logger.close()
+
+    @ex.capture(prefix='inference')  # type: ignore
+    def predict(
+        self,
+        input: str | None,
+        output: str,
+        index: str,
+        format: str | None,
+        forces: bool,
+        workers: int,
+        prefetch: int,
+    ) -> None:
+        assert input is not None, 'Inference requires inference.input'
+        params = self.get_initial_model_params(load=True)  # type: ignore
+        predictor = Predictor(
+            self.model,
+            self.main_thread_transform,
+            self.system_fn,
+            forces,
+            self.scf_tolerance,
+            self.eval_batch_size,
+        )
+        stats = predict_trajectory(
+            params,
+            predictor,
+            self.preload_transformations[0],
+            input,
+            output,
+            index,
+            format,
+            workers,
+            prefetch,
+        )
+        print('#' * 20, ', '.join(f'{k}: {v:g}' for k, v in stats.items()))
+        self.logger.log(stats)
+        self.logger.close()
+
     def __call__(self) -> None:
         opt = get_optimizer(self.opt_config)
         init_params = self.get_initial_model_params()  # type: ignore
@@ -462,7 +716,36 @@ class ExperimentWrapper:
             self.main_thread_transform,
             self.logger,
             self.test,
+            self.system_fn,
+            self.profiler,
+            self.log_every,
+            self.checkpoints,
+            self.eval_batch_size,
+            self.scf_tolerance,
         )
+        self.report_cache_stats()
+        self.logger.close()
+
+
+@ex.command
+def warm_cache(overwrite: int):
+    """
+    Populates the persistent compilation cache for all shape buckets of the data:
+        python scripts/main.py warm_cache with ...
+    """
+    exp = ExperimentWrapper(overwrite)  # type: ignore
+    exp.warm_cache()  # type: ignore
+
+
+@ex.command
+def predict(overwrite: int):
+    """
+    Energies (and forces) of a trajectory with the model of a training configuration:
+        python scripts/main.py predict with <training config> \\
+            checkpointing.load_path=<checkpoints> inference.input=<trajectory.xyz>
+    """
+    exp = ExperimentWrapper(overwrite)  # type: ignore
+    exp.predict()  # type: ignore
 
 
 @ex.automain
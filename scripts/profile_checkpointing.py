@@ -0,0 +1,87 @@
+"""
+Reports the peak memory and step time of a training step for each gradient
+checkpointing policy of the SCF loop, e.g.,
+    python scripts/profile_checkpointing.py --basis '6-31G(2df,p)' --grid-level 3
+"""
+
+import argparse
+import time
+
+import jax
+import jax.numpy as jnp
+
+from egxc.solver import fock, scf
+from egxc.solver.scf.scf import CHECKPOINT_POLICIES
+from egxc.systems import System, examples, nuclear_energy
+from egxc.systems.preload import preload_system_using_pyscf
+from egxc.xc_energy.features import DensityFeatures
+from egxc.xc_energy.functionals.learnable import Dick2021
+from egxc.utils.typing import Alignment, ElectRepTensorType
+
+POLICIES = [None, *CHECKPOINT_POLICIES]
+
+
+def profile(psys, cycles: int, policy: str | None, every: int, repeats: int):
+    xc_module = fock.XCModule(Dick2021(), DensityFeatures(True))
+    solver = scf.SelfConsistentFieldSolver(
+        xc_module,
+        cycles,
+        ElectRepTensorType.DENSITY_FITTED,
+        checkpoint_policy=policy,  # type: ignore
+        checkpoint_every=every,
+    )
+    sys = System.from_preloaded(psys)
+    P_0 = jnp.asarray(psys.initial_density_matrix)
+    params = solver.init(jax.random.PRNGKey(0), P_0, sys)
+
+    def loss_fn(params):
+        (e_hj, e_xc), _ = solver.apply(params, P_0, sys)
+        return (e_hj + e_xc)[-1] + nuclear_energy(sys._nuc_pos, sys)
+
+    compiled = jax.jit(jax.value_and_grad(loss_fn)).lower(params).compile()
+    memory = compiled.memory_analysis()
+    peak = memory.temp_size_in_bytes + memory.argument_size_in_bytes
+    peak += memory.output_size_in_bytes
+    jax.block_until_ready(compiled(params))
+    start = time.perf_counter()
+    for _ in range(repeats):
+        jax.block_until_ready(compiled(params))
+    return peak / 2**20, (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--molecule', default='water')
+    parser.add_argument('--basis', default='6-31G(d)')
+    parser.add_argument('--grid-level', type=int, default=1)
+    parser.add_argument('--cycles', type=int, default=15)
+    parser.add_argument('--every', type=int, nargs='+', default=[1, 5])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    jax.config.update('jax_enable_x64', True)
+
+    molecule = examples.get_preloaded(
+        args.molecule, args.basis, alignment=1, include_grid=False
+    )
+    psys = preload_system_using_pyscf(
+        molecule.nuc_pos,
+        molecule.atom_z.array,
+        charge=0,
+        spin=0,
+        basis=args.basis,
+        spin_restricted=True,
+        alignment=Alignment(),
+        ert_type=ElectRepTensorType.DENSITY_FITTED,
+        include_fock_tensors=True,
+        include_grid=True,
+        grid_level=args.grid_level,
+    )
+    print(f'{"policy":>18} {"every":>5} {"peak [MiB]":>11} {"step [s]":>9}')
+    for policy in POLICIES:
+        for every in args.every if policy is not None else [1]:
+            peak, step_time = profile(psys, args.cycles, policy, every, args.repeats)
+            print(f'{str(policy):>18} {every:>5} {peak:>11.1f} {step_time:>9.3f}')
+
+
+if __name__ == '__main__':
+    main()
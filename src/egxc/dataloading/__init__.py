@@ -13,7 +13,14 @@ from .md17 import MD17
 from .qm9 import QM9
 from .threebpa import ThreeBPA
 
-from .transform import get_preload_transform, get_jax_transform, ToJaxTransform
+from .transform import (
+    get_preload_transform,
+    get_jax_transform,
+    get_system_fn,
+    prefetch_to_device,
+    preloaded_to_device,
+    ToJaxTransform,
+)
 from .dataloader import (
     get_dataloaders,
     get_sample_for_model_init,
@@ -43,6 +43,11 @@ class BaseDataset(RandomAccessDataSource):
     def __len__(self) -> int:
         return len(self.data)
 
+    def __repr__(self) -> str:
+        # grain compares the repr when restoring an iterator position, which therefore
+        # has to be independent of the process
+        return f'{type(self).__name__}(length={len(self)})'
+
     def timed_get_item(self, idx: int) -> float:
         time_start = time()
         self[idx]
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 import grain.python as grain
+from grain._src.core.sharding import even_split
 
 from egxc.systems import PreloadSystem
 from egxc.dataloading.base import DatasetEnsemble, BaseDataset
@@ -37,6 +38,15 @@ class GrainDataLoaderWrapper:
             raise StopIteration
         return next(self.__iterator)  # type: ignore
 
+    def get_state(self) -> bytes:
+        """Position of the underlying grain iterator, exact between two epochs."""
+        return iter(self).__iterator.get_state()  # type: ignore
+
+    def set_state(self, state: bytes) -> None:
+        """Continues from a position of `get_state` without replaying the samples."""
+        iter(self).__iterator.set_state(state)  # type: ignore
+        self.__counter = 0
+
 
 @dataclass
 class DataLoaders:
@@ -69,19 +79,26 @@ def get_dataloaders(
     shuffle: bool,
     workers: int | None,
     random_seed: int,
+    shard: bool = False,
 ) -> DataLoaders:
     """
     Get dataloaders for training, validation, and testing.
 
     Args:
         datasets: Tuple of datasets for training, validation, and testing.
+        shard: If True, the training and validation sets are split across the jax
+            processes (see `egxc.training.distributed`). All training shards have the
+            same length, such that the processes take the same number of steps.
     """
 
-    def get_dataloader(dataset: BaseDataset) -> GrainDataLoaderWrapper:
-        length = len(dataset)
+    def get_dataloader(
+        dataset: BaseDataset, shard_options: grain.ShardOptions
+    ) -> GrainDataLoaderWrapper:
+        start, end = even_split(len(dataset), shard_options)
+        length = end - start
         sampler = grain.IndexSampler(
-            num_records=length,
-            shard_options=grain.NoSharding(),
+            num_records=len(dataset),
+            shard_options=shard_options,
             shuffle=shuffle,
             seed=random_seed,
         )
@@ -94,9 +111,14 @@ def get_dataloaders(
         )
         return GrainDataLoaderWrapper(dataloader, length)
 
+    if shard:
+        train_sharding = grain.ShardByJaxProcess(drop_remainder=True)
+        val_sharding = grain.ShardByJaxProcess(drop_remainder=False)
+    else:
+        train_sharding = val_sharding = grain.NoSharding()
     out = DataLoaders(
-        get_dataloader(datasets.train),
-        get_dataloader(datasets.val),
-        get_dataloader(datasets.test),
+        get_dataloader(datasets.train, train_sharding),
+        get_dataloader(datasets.val, val_sharding),
+        get_dataloader(datasets.test, grain.NoSharding()),
     )
     return out
@@ -1,14 +1,17 @@
+from collections import deque
 from functools import partial
 import jax
 import jax.numpy as jnp
+import numpy as onp
 import grain.python as grain
 
-from egxc.systems import System, Grid
+from egxc.systems import System, SystemFn, Grid, FockTensors
 from egxc.systems.preload import PreloadSystem, preload_system_using_pyscf
-from egxc.discretization import QuadratureGridFn, BasisFn
+from egxc.discretization import QuadratureGridFn, BasisFn, FockTensorsFn
 from egxc.dataloading.base import RawSample, Targets
-from typing import Tuple, Callable, Sequence
-from egxc.utils.typing import Alignment, ElectRepTensorType, FloatBxB
+from egxc.utils.profiling import Profiler
+from typing import Tuple, Callable, Sequence, Iterable, Iterator
+from egxc.utils.typing import Alignment, ElectRepTensorType, FloatAx3, FloatBxB
 
 
 class PreloadTransform(grain.MapTransform):
@@ -48,6 +51,12 @@ class PreloadTransform(grain.MapTransform):
             include_grid=self.include_grid,
             grid_level=self.grid_level,
         )
+        if targets.nuc_forces is not None:
+            # same (sorted and padded) atom order as the preloaded system
+            order = onp.argsort(onp.asarray(atom_z, dtype=onp.uint8), stable=True)
+            forces = onp.asarray(targets.nuc_forces)[order]
+            forces = onp.pad(forces, ((0, len(psys.atom_mask) - len(forces)), (0, 0)))
+            targets = targets._replace(nuc_forces=forces)
         return psys, targets
 
 
@@ -90,23 +99,31 @@ def get_preload_transform(
 ToJaxTransform = Callable[[PreloadSystem], Tuple[FloatBxB, System]]
 
 
-def get_jax_transform(
+def get_system_fn(
     grid_and_basis_fn: Tuple[QuadratureGridFn, BasisFn] | None,
-    fock_tensors_fn: Callable | None,
-) -> ToJaxTransform:
-    def compute_grid(psys: PreloadSystem) -> Grid | None:
+    fock_tensors_fn: FockTensorsFn | None,
+    orthogonalizer: str = 'canonical',
+) -> SystemFn:
+    """
+    Builds the System of a preloaded system at the given nuclear positions. Grid, atomic
+    orbitals and Fock tensors that are not preloaded are computed from `nuc_pos`, such
+    that the System is differentiable w.r.t. the nuclear positions (see
+    `egxc.solver.forces`).
+    """
+
+    def compute_grid(nuc_pos: FloatAx3, psys: PreloadSystem) -> Grid | None:
         if grid_and_basis_fn is None:
             return None
         else:
             grid_fn, basis_fn = grid_and_basis_fn
             coords, weights = grid_fn(
-                psys.nuc_pos,
+                nuc_pos,
                 psys.atom_z,  # type: ignore
                 psys.atom_mask,  # type: ignore
             )
             aos = basis_fn(
                 coords,
-                psys.nuc_pos,  # type: ignore
+                nuc_pos,  # type: ignore
                 psys.atom_z.array,  # type: ignore
                 psys.atom_mask,  # type: ignore
                 psys.periods,  # type: ignore
@@ -118,14 +135,84 @@ def get_jax_transform(
             else:
                 return Grid.create(coords, weights, aos, None)
 
-    if fock_tensors_fn is not None:
-        # TODO: implement
-        raise NotImplementedError
+    def compute_fock_tensors(nuc_pos: FloatAx3, psys: PreloadSystem) -> FockTensors | None:
+        if fock_tensors_fn is None:
+            return None
+        else:
+            return fock_tensors_fn(
+                nuc_pos,
+                psys.atom_z.array,  # type: ignore
+                psys.atom_mask,
+                psys.occupancies,  # type: ignore
+                psys.periods,  # type: ignore
+                psys.max_number_of_basis_fns,
+            )
+
+    def system_fn(nuc_pos: FloatAx3, psys: PreloadSystem) -> System:
+        grid = compute_grid(nuc_pos, psys)
+        fock_tensors = compute_fock_tensors(nuc_pos, psys)
+        sys = System.from_preloaded(
+            psys, fock_tensors=fock_tensors, grid=grid, orthogonalizer=orthogonalizer
+        )
+        return sys.replace(_nuc_pos=nuc_pos)
+
+    return system_fn
 
-    # @partial(jax.jit, donate_argnums=(0,))  TODO:
+
+def get_jax_transform(
+    grid_and_basis_fn: Tuple[QuadratureGridFn, BasisFn] | None,
+    fock_tensors_fn: FockTensorsFn | None,
+    orthogonalizer: str = 'canonical',
+) -> ToJaxTransform:
+    system_fn = get_system_fn(grid_and_basis_fn, fock_tensors_fn, orthogonalizer)
+
+    @partial(jax.jit, donate_argnums=(0,))
     def input_transform(psys: PreloadSystem) -> Tuple[FloatBxB, System]:
-        grid = compute_grid(psys)
-        sys = System.from_preloaded(psys, grid=grid)
+        sys = system_fn(jnp.asarray(psys.nuc_pos), psys)
         return jnp.asarray(psys.initial_density_matrix), sys
 
     return input_transform
+
+
+def preloaded_to_device(psys: PreloadSystem) -> Tuple[FloatBxB, PreloadSystem]:
+    """
+    Input transform that only moves the preloaded system to the device. The System is
+    then built by a `SystemFn` inside the (differentiated) step, e.g. for force training.
+    """
+    psys = jax.device_put(psys)
+    return jnp.asarray(psys.initial_density_matrix), psys
+
+
+def prefetch_to_device(
+    iterable: Iterable[Tuple[PreloadSystem, Targets]],
+    input_transform: ToJaxTransform,
+    size: int = 2,
+    profiler: Profiler | None = None,
+) -> Iterator[Tuple[Tuple[FloatBxB, System], Targets]]:
+    """
+    Applies the (jitted) input transform ahead of time, such that up to `size` samples
+    are in flight on the device. Due to jax's asynchronous dispatch, the System of the
+    next step is hence built while the current training step is still running, instead
+    of blocking the main thread between two steps. The default of two corresponds to
+    double buffering. The profiler times the waiting for the data loader ('data') and
+    the dispatch of the input transform ('transform').
+    """
+    assert size >= 1, 'Prefetch size must be at least 1'
+    profiler = profiler or Profiler(enabled=False)
+    iterator = iter(iterable)
+    queue = deque()
+
+    def enqueue(n: int) -> None:
+        for _ in range(n):
+            with profiler.phase('data'):
+                sample = next(iterator, None)
+            if sample is None:
+                return
+            psys, targets = sample
+            with profiler.phase('transform'):
+                queue.append((input_transform(psys), jax.device_put(targets)))
+
+    enqueue(size)
+    while queue:
+        yield queue.popleft()
+        enqueue(1)
@@ -1,2 +1,9 @@
 from .grids.quadrature import get_grid_fn, QuadratureGridFn
-from .basis import get_gto_basis_fn, BasisFn
\ No newline at end of file
+from .basis import get_gto_basis_fn, BasisFn
+from .integrals import (
+    get_one_electron_integrals_fn,
+    get_density_fitting_integrals_fn,
+    get_fock_tensors_fn,
+    FockTensorsFn,
+    DirectDensityFitting,
+)
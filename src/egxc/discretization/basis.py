@@ -1,7 +1,8 @@
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Dict, List, Tuple
 from warnings import warn
 
-import einops
 import jax
 import jax.numpy as jnp
 import numpy as onp
@@ -9,7 +10,6 @@ import pyscf
 import pyscf.lib.exceptions
 import warnings
 from flax import linen as nn
-from numpy.typing import ArrayLike
 from pyscf import gto
 
 from egxc.utils.constants import ANGSTROM_TO_BOHR, L_MAX
@@ -19,12 +19,12 @@ from egxc.utils.typing import (
     FloatAx3,
     FloatAxG,
     FloatAxNxM_SPH,
-    FloatZxG,
     FloatG,
     FloatN,
     FloatNx3,
     FloatNxA,
     FloatNxAx3,
+    FloatNxAxM_SPH,
     FloatNxB,
     FloatNxBx3,
     FloatNxC_SPH,
@@ -52,6 +52,11 @@ L_TO_LXLYLZ = {
         (0, 0, 3),  # 8             z^3
         (1, 1, 1),  # 9     x   y   z
     ],
+    4: [  # g (only required for auxiliary basis sets), pyscf ordering
+        (4, 0, 0), (3, 1, 0), (3, 0, 1), (2, 2, 0), (2, 1, 1),  # noqa: E241
+        (2, 0, 2), (1, 3, 0), (1, 2, 1), (1, 1, 2), (1, 0, 3),  # noqa: E241
+        (0, 4, 0), (0, 3, 1), (0, 2, 2), (0, 1, 3), (0, 0, 4),  # noqa: E241
+    ],
 }
 
 # fmt: off
@@ -75,7 +80,19 @@ CART_SPH_CONTRACTIONS = {
             [-0.457045799464465739, -0.457045799464465739, 1.828183197857862944, 0, 0, 0, 0, 0, 0, 0],
             [0, 0, 0, 0, 0, 0, 1.445305721320277020, -1.445305721320277020, 0, 0],
             [0.590043589926643510, -1.770130769779930530, 0, 0, 0, 0, 0, 0, 0, 0,],
-        ]) / 8.17588381146625823
+        ]) / 8.17588381146625823,
+    4: onp.array([
+            # factors from: https://github.com/sunqm/libcint/blob/master/src/cart2sph.c
+            [0, 2.503342941796704538, 0, 0, 0, 0, -2.503342941796704538, 0, 0, 0, 0, 0, 0, 0, 0],  # g_xy(x^2-y^2)
+            [0, 0, 0, 0, 5.310392309339791593, 0, 0, 0, 0, 0, 0, -1.770130769779930531, 0, 0, 0],  # g_yz(3x^2-y^2)
+            [0, -0.946174695757560014, 0, 0, 0, 0, -0.946174695757560014, 0, 5.677048174545360108, 0, 0, 0, 0, 0, 0],  # g_xy(7z^2-r^2)
+            [0, 0, 0, 0, -2.007139630671867500, 0, 0, 0, 0, 0, 0, -2.007139630671867500, 0, 2.676186174229156671, 0],  # g_yz(7z^2-3r^2)
+            [0.317356640745612911, 0, 0, 0.634713281491225822, 0, -2.538853125964903290, 0, 0, 0, 0, 0.317356640745612911, 0, -2.538853125964903290, 0, 0.846284375321634430],  # g_z^4
+            [0, 0, -2.007139630671867500, 0, 0, 0, 0, -2.007139630671867500, 0, 2.676186174229156671, 0, 0, 0, 0, 0],  # g_xz(7z^2-3r^2)
+            [-0.473087347878780009, 0, 0, 0, 0, 2.838524087272680054, 0, 0, 0, 0, 0.473087347878780009, 0, -2.838524087272680054, 0, 0],  # g_(x^2-y^2)(7z^2-r^2)
+            [0, 0, 1.770130769779930531, 0, 0, 0, 0, -5.310392309339791593, 0, 0, 0, 0, 0, 0, 0],  # g_xz(x^2-3y^2)
+            [0.625835735449176134, 0, 0, -3.755014412695056807, 0, 0, 0, 0, 0, 0, 0.625835735449176134, 0, 0, 0, 0],  # g_x^4-6x^2y^2+y^4
+        ]) / 34.6873373116866500,
 }
 # fmt: on
 
@@ -84,10 +101,25 @@ def _safe_norm(x, axis=-1, keepdims=True):
     x = (jnp.conj(x) * x).sum(axis=axis, keepdims=keepdims)
     zero_mask = x == 0
     x_safe = jnp.where(zero_mask, 1.0, x)
-    x_safe = jnp.sqrt(x)
+    x_safe = jnp.sqrt(x_safe)
     return jnp.where(zero_mask, 0.0, x_safe)
 
 
+def _cartesian_monomials(R: jax.Array, ijk_s: onp.ndarray) -> jax.Array:
+    """
+    Evaluates the monomials x^i y^j z^k by repeated multiplication. Unlike jnp.power
+    with array-valued exponents, whose gradient is nan at 0^0, this is differentiable
+    on nodal planes, e.g., grid points coplanar with a nucleus.
+    """
+    powers = [jnp.ones_like(R)]
+    for _ in range(int(ijk_s.max(initial=0))):
+        powers.append(powers[-1] * R)
+    powers = jnp.stack(powers, axis=-1)  # ... x 3 x l+1
+    return (
+        powers[..., 0, ijk_s[:, 0]] * powers[..., 1, ijk_s[:, 1]] * powers[..., 2, ijk_s[:, 2]]
+    )
+
+
 def _calc_displacements(n: FloatNx3, a: FloatAx3) -> Tuple[FloatNxAx3, FloatNxA]:
     """
     Computes the displacement vectors between two sets of points and
@@ -120,13 +152,13 @@ class GTOAngular(nn.Module):
 
     def setup(self) -> None:
         assert self.l <= L_MAX, f'Only up to l={L_MAX} is implemented, but got l={self.l}'
-        self.ijk_s = jnp.array(L_TO_LXLYLZ[self.l], dtype=jnp.int32)
+        self.ijk_s = onp.array(L_TO_LXLYLZ[self.l], dtype=onp.int32)
 
     def __call__(self, R: FloatNx3) -> FloatNxM_SPH:
         """
         R: displacement vectors relative to GTO center
         """
-        cart_angulars = jnp.power(R[..., None, :], self.ijk_s).prod(axis=-1)
+        cart_angulars = _cartesian_monomials(R, self.ijk_s)
         angulars = self._cartesian_to_real_sph(cart_angulars)
         return angulars
 
@@ -192,7 +224,7 @@ def get_gto_shell_fn(angular_momentum: int) -> ShellFn:
     assert (
         angular_momentum <= L_MAX
     ), f'Only up to l={L_MAX} is implemented, but got l={angular_momentum}'
-    ijk_s = jnp.array(L_TO_LXLYLZ[angular_momentum], dtype=jnp.int32)
+    ijk_s = onp.array(L_TO_LXLYLZ[angular_momentum], dtype=onp.int32)
 
     def cartesian_to_real_sph(cartesian_angulars: FloatNxC_SPH) -> FloatNxM_SPH:
         coeff = CART_SPH_CONTRACTIONS[angular_momentum]
@@ -214,7 +246,7 @@ def get_gto_shell_fn(angular_momentum: int) -> ShellFn:
 
         QUESTION: Does the jit compiler recognize this and optimize it automatically?
         """
-        cart_angulars = jnp.power(displacement[..., None, :], ijk_s).prod(axis=-1)
+        cart_angulars = _cartesian_monomials(displacement, ijk_s)
         angulars = cartesian_to_real_sph(cart_angulars)
         return angulars
 
@@ -241,7 +273,87 @@ BasisFn = Callable[
 ]
 
 
-def get_gto_basis_fn(string: str, max_period: int, deriv: int) -> BasisFn:
+def _real_sph_harmonics_fn(
+    max_l: int,
+) -> Tuple[Callable[[FloatNxAx3], FloatNxAxM_SPH], Dict[int, int]]:
+    """
+    Returns a function evaluating the (unnormalized) real solid harmonics of all angular
+    momenta up to max_l in one go, together with the offset of each angular momentum
+    in the last output dimension. Shells of different atoms and angular momenta hence
+    share a single angular tensor instead of recomputing it per shell.
+    """
+    ijk_s = onp.array(
+        [ijk for l in range(max_l + 1) for ijk in L_TO_LXLYLZ[l]],  # noqa: E741
+        dtype=onp.int32,
+    )
+    m_sph = [2 * l + 1 for l in range(max_l + 1)]  # noqa: E741
+    c_sph = [len(L_TO_LXLYLZ[l]) for l in range(max_l + 1)]  # noqa: E741
+    cart_to_sph = onp.zeros((sum(m_sph), sum(c_sph)))
+    l_to_offset = {}
+    m_offset, c_offset = 0, 0
+    for l in range(max_l + 1):  # noqa: E741
+        cart_to_sph[
+            m_offset : m_offset + m_sph[l], c_offset : c_offset + c_sph[l]
+        ] = CART_SPH_CONTRACTIONS[l]
+        l_to_offset[l] = m_offset
+        m_offset += m_sph[l]
+        c_offset += c_sph[l]
+
+    def real_sph_harmonics(displacements: FloatNxAx3) -> FloatNxAxM_SPH:
+        cart_angulars = _cartesian_monomials(displacements, ijk_s)
+        return jnp.einsum('mc,...c->...m', cart_to_sph, cart_angulars)
+
+    return real_sph_harmonics, l_to_offset
+
+
+@dataclass(frozen=True)
+class GTOShellTable:
+    """
+    Flattened table of all contracted shells of all supported elements, padded to a
+    common number of shells and primitives. Row 0 belongs to padding atoms (Z = 0) and
+    has zero contraction coefficients. Padded primitives have zero coefficients and unit
+    exponents, such that they neither contribute to AO values nor to integrals.
+    Shared by the AO evaluation and the integral engines.
+    """
+
+    p_to_angulars: Dict[int, Tuple[int, ...]]  # angular momentum of the i-th shell
+    p_to_primitives: Dict[int, Tuple[int, ...]]  # max. number of primitives of the i-th shell
+    exponents: onp.ndarray  # (max_z + 1) x max_shells x max_primitives
+    ctr_coeffs: onp.ndarray  # (max_z + 1) x max_shells x max_primitives
+
+    @property
+    def max_l(self) -> int:
+        return max(max(angulars) for angulars in self.p_to_angulars.values())
+
+    def layout(
+        self, periods: CompileStaticIntA, max_number_of_basis_fns: CompileStaticInt
+    ) -> Tuple[onp.ndarray, onp.ndarray, onp.ndarray, onp.ndarray]:
+        """
+        Static gather indices, basis functions are ordered atom-major like in pyscf.
+        Since padding atoms trail the real atoms, their basis functions are last.
+        Returns:
+            pair_atom, pair_shell: atom and shell index of each (atom, shell) pair
+            ao_pair: (atom, shell) pair of each basis function
+            ao_m: magnetic quantum number index (0, ..., 2l) of each basis function
+        """
+        pair_atom, pair_shell, ao_pair, ao_m = [], [], [], []
+        for a, p in enumerate(periods):
+            for s, L in enumerate(self.p_to_angulars[p]):
+                ao_pair += [len(pair_atom)] * (2 * L + 1)
+                ao_m += list(range(2 * L + 1))
+                pair_atom.append(a)
+                pair_shell.append(s)
+        ao_pair = onp.array(ao_pair[:max_number_of_basis_fns])
+        ao_m = onp.array(ao_m[:max_number_of_basis_fns])
+        return onp.array(pair_atom), onp.array(pair_shell), ao_pair, ao_m
+
+    def pair_angulars(self, periods: CompileStaticIntA) -> onp.ndarray:
+        """Angular momentum of each (atom, shell) pair"""
+        return onp.array([L for p in periods for L in self.p_to_angulars[p]])
+
+
+@lru_cache
+def gto_shell_table(string: str, max_period: int) -> GTOShellTable:
     if max_period >= 5:
         warnings.warn(
             f'Only up to period 5 is supported, but got max_period={max_period},'
@@ -259,46 +371,35 @@ def get_gto_basis_fn(string: str, max_period: int, deriv: int) -> BasisFn:
             return None
 
     p_to_bias = {1: 0, 2: 2, 3: 10, 4: 18, 5: 36, 6: 54, 7: 86}
-    atoms = [atm(z) for z in range(1, p_to_bias[max_period + 1] + 1)]
-    p_to_angulars: Dict[
-        int, List[int]
-    ] = {}  # i-th element of the list holds the angular momentum of the i-th atomic orbital
-    p_to_ctr_coeffs: Dict[
-        int, Tuple[FloatZxG]
-    ] = {}  # i-th element of the tuple holds contraction coefficients for the i-th atomic orbital
-    p_to_exponents: Dict[
-        int, Tuple[FloatZxG]
-    ] = {}  # i-th element of the tuple holds exponents for the i-th atomic orbital
-
-    def init_exponent_and_ctr_coeff(
-        p: int, nao: int, atoms: List[gto.Mole | None], first_non_none: int
-    ) -> None:
-        """
-        initialize the exponents and contraction coefficients for the atomic orbitals in period p
-        where the i-th element of the list holds exponents/contraction coefficients for the i-th
-        atomic orbital which are of the shape (n_elements_in_period, n_contractions)
-        """
-
-        def _nan_save_ctr(i: int, a: gto.Mole | None, template: ArrayLike) -> ArrayLike:
-            return template if a is None else a.bas_ctr_coeff(i).reshape(-1)  # type: ignore
-
-        def _nan_save_exp(i: int, a: gto.Mole | None, template: ArrayLike) -> ArrayLike:
-            return template if a is None else a.bas_exp(i)
+    max_z = p_to_bias[max_period + 1]
+    atoms = [atm(z) for z in range(1, max_z + 1)]
 
-        ctr_coeff = []
-        exponents = []
-        for i in range(nao):
-            template = onp.zeros_like(atoms[first_non_none].bas_exp(i))  # type: ignore
-            ctr_coeff.append(
-                jnp.stack([_nan_save_ctr(i, a, template) for a in atoms])  # type: ignore
-            )
-            exponents.append(
-                jnp.stack([_nan_save_exp(i, a, template) for a in atoms])  # type: ignore
-            )
-        p_to_ctr_coeffs[p] = tuple(ctr_coeff)
-        p_to_exponents[p] = tuple(exponents)
+    p_to_angulars: Dict[int, Tuple[int, ...]] = {}
+    p_to_primitives: Dict[int, Tuple[int, ...]] = {}
+    # shells of element z: list of (angular momentum, exponents, normalized coefficients)
+    z_to_shells: Dict[int, List[Tuple[int, onp.ndarray, onp.ndarray]]] = {}
 
-    max_l = 0
+    def contracted_shells(
+        a: gto.Mole | None, template: gto.Mole
+    ) -> List[Tuple[int, onp.ndarray, onp.ndarray]]:
+        """
+        Splits general contractions into separate shells, following the pyscf ordering
+        of the atomic orbitals, and absorbs the radial normalization into the
+        contraction coefficients. Missing elements are filled with zero coefficients.
+        """
+        out = []
+        for i in range(template.nbas):
+            L = template.bas_angular(i)
+            if a is None:
+                exps = onp.ones(1)
+                ctr_coeffs = onp.zeros((1, template.bas_nctr(i)))
+            else:
+                exps = a.bas_exp(i)
+                ctr_coeffs = a.bas_ctr_coeff(i)
+            rnorms = (2 * exps / onp.pi) ** (3 / 4) * (8 * exps) ** (L / 2)
+            for c in range(ctr_coeffs.shape[1]):
+                out.append((L, exps, ctr_coeffs[:, c] * rnorms))
+        return out
 
     for p in range(1, max_period + 1):
         atoms_in_period = atoms[p_to_bias[p] : p_to_bias[p + 1]]
@@ -306,25 +407,46 @@ def get_gto_basis_fn(string: str, max_period: int, deriv: int) -> BasisFn:
             (i for i, a in enumerate(atoms_in_period) if a is not None), None
         )
         assert first_non_none is not None, f'No atom found for period {p}'
-        nao = atoms_in_period[first_non_none].nbas  # type: ignore # number of atomic orbitals of element in period p
-        p_to_angulars[p] = [
-            atoms_in_period[first_non_none].bas_angular(i)  # type: ignore
-            for i in range(nao)
+        # same shell structure for all atoms in the same period
+        template: gto.Mole = atoms_in_period[first_non_none]  # type: ignore
+        for i, a in enumerate(atoms_in_period):
+            z_to_shells[p_to_bias[p] + i + 1] = contracted_shells(a, template)
+        p_to_angulars[p] = tuple(
+            L for L, _, _ in z_to_shells[p_to_bias[p] + first_non_none + 1]
+        )
+        shells_in_period = [
+            z_to_shells[p_to_bias[p] + i + 1] for i in range(len(atoms_in_period))
         ]
-        # same for all atoms in the same period
-        init_exponent_and_ctr_coeff(p, nao, atoms_in_period, first_non_none)
-        max_l = max(max_l, max(p_to_angulars[p]))
-    l_to_shell_fn = [get_gto_shell_fn(l) for l in range(max_l + 1)]  # noqa: E741
-    # assign dicts to frozen member fields
-    p_to_angulars = p_to_angulars
-    p_to_ctr_coeffs = p_to_ctr_coeffs
-    p_to_exponents = p_to_exponents
+        p_to_primitives[p] = tuple(
+            max(len(shells[s][1]) for shells in shells_in_period)
+            for s in range(len(p_to_angulars[p]))
+        )
 
-    def m_sph(angular_momenta: List[int]) -> int:
-        # total number of spherical harmonics for a given list of angular momenta
-        return sum([2 * L + 1 for L in angular_momenta])
+    max_shells = max(len(shells) for shells in z_to_shells.values())
+    max_primitives = max(len(e) for shells in z_to_shells.values() for _, e, _ in shells)
+    exponents = onp.ones((max_z + 1, max_shells, max_primitives))
+    ctr_coeffs = onp.zeros((max_z + 1, max_shells, max_primitives))
+    for z, shells in z_to_shells.items():
+        for s, (_, exps, coeffs) in enumerate(shells):
+            exponents[z, s, : len(exps)] = exps
+            ctr_coeffs[z, s, : len(exps)] = coeffs
+    return GTOShellTable(p_to_angulars, p_to_primitives, exponents, ctr_coeffs)
 
-    p_to_aos_per_atom = {p: m_sph(p_to_angulars[p]) for p in range(1, max_period + 1)}
+
+def get_gto_basis_fn(string: str, max_period: int, deriv: int) -> BasisFn:
+    """
+    Returns a jitted function evaluating all atomic orbitals (and optionally their
+    gradients) of the basis set on the grid.
+
+    All shells of all supported elements are stored in a flattened shell table
+    (element x shell x primitive), padded to a common number of primitives. The
+    radial parts of all (atom, shell) pairs are then evaluated in one vectorised call
+    and the angular parts are shared between all shells of an atom. The gather indices
+    mapping (atom, shell, m) to the output basis functions only depend on the static
+    periods and are hence precomputed at trace time.
+    """
+    table = gto_shell_table(string, max_period)
+    real_sph_harmonics, l_to_offset = _real_sph_harmonics_fn(table.max_l)
 
     def aos(
         grid: FloatNx3,
@@ -339,49 +461,22 @@ def get_gto_basis_fn(string: str, max_period: int, deriv: int) -> BasisFn:
         last in the basis dimension.
         """
         # TODO: check if grid is already in bohr
-        displacements, distances = _calc_displacements(grid, nuc_pos * ANGSTROM_TO_BOHR)
-        out = []
-        sort_masks = []
-        for p in range(1, max_period + 1):
-            p_idx = onp.array(periods) == p
-            # TODO: can I check wether p_idx is empty?
-            if onp.any(p_idx):
-                ao_values = []
-                p_disp = displacements[:, p_idx]
-                p_dist = distances[:, p_idx]
-                Z_idx = (
-                    atom_z[p_idx] - 1 - p_to_bias[p]
-                )  # TODO: what about Z=0 padding atoms?
-                ctr_coeffs = p_to_ctr_coeffs[p]
-                p_ctr_coeffs: Tuple[FloatAxG] = jax.tree.map(
-                    lambda x: x[Z_idx], ctr_coeffs
-                )
-                exponents = p_to_exponents[p]
-                p_exponents: Tuple[FloatAxG] = jax.tree.map(lambda x: x[Z_idx], exponents)
-
-                for i, l in enumerate(p_to_angulars[p]):  # noqa: E741
-                    ao = l_to_shell_fn[l](p_disp, p_dist, p_ctr_coeffs[i], p_exponents[i])
-                    ao_values.append(ao)
-
-                ao_values = jnp.concatenate(ao_values, axis=-1)
-                # flatten atom dimension into basis dimension
-                ao_values = einops.rearrange(
-                    ao_values, 'atoms grid basis -> grid (atoms basis)'
-                )
-                mask = einops.repeat(
-                    atom_mask[p_idx],
-                    'atoms -> (atoms basis)',
-                    basis=p_to_aos_per_atom[p],
-                )
-                sort_masks.append(mask)
-                out.append(ao_values)
-
-        sort_mask = jnp.concatenate(sort_masks, axis=-1)
-        order = jnp.argsort(
-            sort_mask, stable=True, descending=True
-        )  # [0, 1, 1, 0, 0] -> [1, 1, 0, 0, 0]
-        out = jnp.concatenate(out, axis=-1)
-        return out[:, order[:max_number_of_basis_fns]]
+        pair_atom, pair_shell, ao_pair, ao_m = table.layout(
+            periods, max_number_of_basis_fns
+        )
+        ao_angular = onp.array([l_to_offset[L] for L in table.pair_angulars(periods)])
+        ao_angular = ao_angular[ao_pair] + ao_m
+        displacements = grid[:, None] - (nuc_pos * ANGSTROM_TO_BOHR)[None]  # N A 3
+        sq_distances = jnp.sum(displacements**2, axis=-1)  # N A
+
+        pair_z = jnp.asarray(atom_z, dtype=jnp.int32)[pair_atom]
+        exponents = jnp.asarray(table.exponents)[pair_z, pair_shell]  # K G
+        ctr_coeffs = jnp.asarray(table.ctr_coeffs)[pair_z, pair_shell]  # K G
+        radials = jnp.sum(
+            ctr_coeffs * jnp.exp(-sq_distances[:, pair_atom, None] * exponents), axis=-1
+        )  # N K
+        angulars = real_sph_harmonics(displacements)  # N A M_SPH
+        return radials[:, ao_pair] * angulars[:, pair_atom[ao_pair], ao_angular]
 
     if deriv == 0:
         out = aos
@@ -102,7 +102,6 @@ def get_grid_fn(
             grid_distances = jnp.sqrt(
                 jnp.einsum('ijk,ijk->ij', displacement, displacement)
             )
-            becke_weights = jnp.ones((A, N))
 
             atom_indices_1, atom_indices_2 = jnp.tril_indices(A, k=-1)
 
@@ -116,13 +115,16 @@ def get_grid_fn(
             partitionings = jax.vmap(compute_partitioning)(atom_indices_1, atom_indices_2)
             partitionings = partitionings * atom_mask[atom_indices_1, None] * atom_mask[atom_indices_2, None]
             partitionings += ~atom_mask[atom_indices_1, None] * atom_mask[atom_indices_2, None]
-            becke_weights = becke_weights.at[atom_indices_1].mul(
+            # product over the cell functions instead of an in-place scatter-multiply,
+            # which is not differentiable w.r.t. the nuclear positions
+            cell_functions = jnp.ones((A, A, N))
+            cell_functions = cell_functions.at[atom_indices_1, atom_indices_2].set(
                 0.5 * (1.0 - partitionings)
             )
-            becke_weights = becke_weights.at[atom_indices_2].mul(
+            cell_functions = cell_functions.at[atom_indices_2, atom_indices_1].set(
                 0.5 * (1.0 + partitionings)
             )
-            return becke_weights
+            return jnp.prod(cell_functions, axis=1)
 
         coords = []
         weights = []
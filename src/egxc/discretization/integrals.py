@@ -0,0 +1,892 @@
+"""
+Gaussian integrals over the flattened shell tables of `egxc.discretization.basis`,
+evaluated with the McMurchie-Davidson scheme.
+T. Helgaker, P. Jørgensen, J. Olsen (2000).
+Molecular Electronic-Structure Theory, chapter 9. Wiley. ISBN 9780471967552
+https://joshuagoings.com/2017/04/28/integrals/
+
+All integrals are jit compatible and differentiable w.r.t. the nuclear positions.
+Shell pairs are grouped by their (static) angular momenta, such that each class is
+evaluated in one vectorised call over all shell and primitive pairs.
+"""
+
+import jax
+import jax.numpy as jnp
+import numpy as onp
+from flax import struct
+from jax.scipy.special import gammainc, gammaln
+
+from egxc.discretization.basis import (
+    CART_SPH_CONTRACTIONS,
+    L_TO_LXLYLZ,
+    GTOShellTable,
+    gto_shell_table,
+)
+from egxc.systems.base import FockTensors
+from egxc.solver.linalg import transformation_matrix
+from egxc.utils.constants import ANGSTROM_TO_BOHR
+from egxc.utils.typing import (
+    Array,
+    BoolA,
+    BoolB,
+    IntA,
+    IntB,
+    Bool2xB,
+    FloatAx3,
+    FloatBxB,
+    FloatQxBxB,
+    FloatQxQ,
+    CompileStaticInt,
+    CompileStaticIntA,
+    ElectRepTensorType,
+    PRECISION,
+)
+
+from typing import Callable, Dict, List, Tuple
+
+_BOYS_SMALL_T = 0.1  # below this threshold the Taylor expansion is used
+_BOYS_TAYLOR_ORDER = 10
+
+
+def boys(n_max: int, T: Array) -> Array:
+    """
+    Boys function F_n(T) for n = 0, ..., n_max stacked in the last dimension.
+    F_{n_max} follows from the regularized lower incomplete gamma function and the lower
+    orders from the (stable) downward recursion. For small T, where the former is
+    ill-conditioned, a Taylor expansion is used.
+    """
+    small = T < _BOYS_SMALL_T
+    T_large = jnp.where(small, 1.0, T)
+    T_small = jnp.where(small, T, 0.0)
+
+    s = n_max + 0.5
+    F_n = 0.5 * jnp.exp(gammaln(s)) * gammainc(s, T_large) / T_large**s
+    exp_T = jnp.exp(-T_large)
+    F_large = [F_n]
+    for n in range(n_max - 1, -1, -1):
+        F_n = (2 * T_large * F_n + exp_T) / (2 * n + 1)
+        F_large.append(F_n)
+    F_large = jnp.stack(F_large[::-1], axis=-1)
+
+    k = onp.arange(_BOYS_TAYLOR_ORDER + 1)
+    n = onp.arange(n_max + 1)
+    coeffs = (-1.0) ** k / (
+        onp.cumprod(onp.maximum(k, 1))[None] * (2 * n[:, None] + 2 * k[None] + 1)
+    )  # n x k
+    powers = T_small[..., None] ** k  # ... x k
+    F_small = jnp.einsum('nk,...k->...n', coeffs, powers)
+    return jnp.where(small[..., None], F_small, F_large)
+
+
+def _batched_boys(n_max: int, Ts: List[Array]) -> List[Array]:
+    """
+    Evaluates the Boys function for several arrays of arguments in a single call, which
+    considerably reduces the compilation time compared to one call per integral class.
+    """
+    F = boys(n_max, jnp.concatenate([T.reshape(-1) for T in Ts]))
+    splits = onp.cumsum([T.size for T in Ts])[:-1]
+    return [f.reshape(*T.shape, n_max + 1) for f, T in zip(jnp.split(F, splits), Ts)]
+
+
+def _hermite_expansion(
+    i_max: int, j_max: int, a: Array, b: Array, A: Array, B: Array
+) -> Array:
+    """
+    Hermite expansion coefficients E_t^{ij} of the one-dimensional overlap distribution
+    x_A^i x_B^j exp(-a x_A^2 - b x_B^2) for i <= i_max, j <= j_max and t <= i + j,
+    stacked in the last three dimensions (zero for t > i + j).
+    """
+    p = a + b
+    XPA = (b * (B - A)) / p
+    XPB = (a * (A - B)) / p
+    one_over_2p = 0.5 / p
+    E: Dict[Tuple[int, int, int], Array] = {(0, 0, 0): jnp.exp(-a * b / p * (A - B) ** 2)}
+
+    def e(i: int, j: int, t: int) -> Array | float:
+        return E.get((i, j, t), 0.0)
+
+    for i in range(i_max):
+        for t in range(i + 2):
+            E[i + 1, 0, t] = (
+                one_over_2p * e(i, 0, t - 1) + XPA * e(i, 0, t) + (t + 1) * e(i, 0, t + 1)
+            )
+    for i in range(i_max + 1):
+        for j in range(j_max):
+            for t in range(i + j + 2):
+                E[i, j + 1, t] = (
+                    one_over_2p * e(i, j, t - 1)
+                    + XPB * e(i, j, t)
+                    + (t + 1) * e(i, j, t + 1)
+                )
+
+    zeros = jnp.zeros_like(E[0, 0, 0])
+    t_max = i_max + j_max
+    return jnp.stack(
+        [
+            jnp.stack(
+                [
+                    jnp.stack([E.get((i, j, t), zeros) for t in range(t_max + 1)], -1)
+                    for j in range(j_max + 1)
+                ],
+                -2,
+            )
+            for i in range(i_max + 1)
+        ],
+        -3,
+    )
+
+
+def _hermite_coulomb(L: int, p: Array, PC: Array, F: Array) -> Array:
+    """
+    Hermite Coulomb integrals R_tuv(p, PC) for t + u + v <= L stacked in the last three
+    dimensions (zero for t + u + v > L), where F holds the Boys function F_n(p |PC|^2)
+    for (at least) n = 0, ..., L in the last dimension.
+    """
+    R = {(0, 0, 0, n): (-2 * p) ** n * F[..., n] for n in range(L + 1)}
+    X = [PC[..., d] for d in range(3)]
+
+    def r(t: int, u: int, v: int, n: int) -> Array | float:
+        return R.get((t, u, v, n), 0.0)
+
+    for order in range(1, L + 1):
+        for n in range(L - order + 1):
+            for t in range(order + 1):
+                for u in range(order - t + 1):
+                    v = order - t - u
+                    if t > 0:
+                        R[t, u, v, n] = (t - 1) * r(t - 2, u, v, n + 1) + X[0] * r(
+                            t - 1, u, v, n + 1
+                        )
+                    elif u > 0:
+                        R[t, u, v, n] = (u - 1) * r(t, u - 2, v, n + 1) + X[1] * r(
+                            t, u - 1, v, n + 1
+                        )
+                    else:
+                        R[t, u, v, n] = (v - 1) * r(t, u, v - 2, n + 1) + X[2] * r(
+                            t, u, v - 1, n + 1
+                        )
+
+    zeros = jnp.zeros_like(R[0, 0, 0, 0])
+    return jnp.stack(
+        [
+            jnp.stack(
+                [
+                    jnp.stack([R.get((t, u, v, 0), zeros) for v in range(L + 1)], -1)
+                    for u in range(L + 1)
+                ],
+                -2,
+            )
+            for t in range(L + 1)
+        ],
+        -3,
+    )
+
+
+def _cartesian_exponents(angular_momentum: int) -> onp.ndarray:
+    return onp.array(L_TO_LXLYLZ[angular_momentum], dtype=onp.int32)  # C_SPH x 3
+
+
+class ShellPairs:
+    """
+    Static (trace time) description of all (atom, shell) pairs of a system, i.e. the
+    contracted shells, their angular momenta and their offsets in the basis dimension.
+    """
+
+    def __init__(
+        self,
+        table: GTOShellTable,
+        periods: CompileStaticIntA,
+        max_number_of_basis_fns: CompileStaticInt,
+    ):
+        self.pair_atom, self.pair_shell, _, _ = table.layout(periods, 10**9)
+        self.angulars = table.pair_angulars(periods)
+        self.offsets = onp.cumsum(2 * self.angulars + 1) - (2 * self.angulars + 1)
+        self.total_basis_fns = int(onp.sum(2 * self.angulars + 1))
+        self.max_number_of_basis_fns = max_number_of_basis_fns
+        self.table = table
+        self.primitive_counts = onp.array(
+            [
+                table.p_to_primitives[periods[a]][s]
+                for a, s in zip(self.pair_atom, self.pair_shell)
+            ],
+            dtype=onp.int32,
+        )
+
+    def primitives(
+        self, nuc_pos: FloatAx3, atom_z: IntA
+    ) -> Tuple[Array, Array, Array]:
+        """Exponents (K x G), coefficients (K x G) and centers (K x 3, Bohr)"""
+        pair_z = jnp.asarray(atom_z, dtype=jnp.int32)[self.pair_atom]
+        exponents = jnp.asarray(self.table.exponents)[pair_z, self.pair_shell]
+        ctr_coeffs = jnp.asarray(self.table.ctr_coeffs)[pair_z, self.pair_shell]
+        centers = (nuc_pos * ANGSTROM_TO_BOHR)[self.pair_atom]
+        return exponents, ctr_coeffs, centers
+
+    def classes(self) -> Dict[Tuple[int, int], Tuple[onp.ndarray, onp.ndarray]]:
+        """
+        Unique pairs of (atom, shell) pairs grouped by their angular momenta la <= lb.
+        """
+        k1, k2 = onp.triu_indices(len(self.angulars))
+        swap = self.angulars[k1] > self.angulars[k2]
+        k1, k2 = onp.where(swap, k2, k1), onp.where(swap, k1, k2)
+        out = {}
+        for la, lb in sorted(set(zip(self.angulars[k1], self.angulars[k2]))):
+            idx = (self.angulars[k1] == la) & (self.angulars[k2] == lb)
+            out[int(la), int(lb)] = (k1[idx], k2[idx])
+        return out
+
+    def ao_indices(self, k: onp.ndarray, angular_momentum: int) -> onp.ndarray:
+        return self.offsets[k][:, None] + onp.arange(2 * angular_momentum + 1)[None]
+
+    def decontracted(self, k: onp.ndarray) -> Tuple[onp.ndarray, onp.ndarray]:
+        """Position in k and primitive index of all (unpadded) primitives of the shells k"""
+        counts = self.primitive_counts[k]
+        owner = onp.repeat(onp.arange(len(k)), counts)
+        primitive = onp.concatenate([onp.arange(n) for n in counts])
+        return owner, primitive
+
+    def decontracted_pairs(
+        self, k1: onp.ndarray, k2: onp.ndarray
+    ) -> Tuple[onp.ndarray, onp.ndarray, onp.ndarray]:
+        """Position in (k1, k2) and primitive indices of all primitive pairs"""
+        n1, n2 = self.primitive_counts[k1], self.primitive_counts[k2]
+        owner = onp.repeat(onp.arange(len(k1)), n1 * n2)
+        g1 = onp.concatenate([onp.repeat(onp.arange(a), b) for a, b in zip(n1, n2)])
+        g2 = onp.concatenate([onp.tile(onp.arange(b), a) for a, b in zip(n1, n2)])
+        return owner, g1, g2
+
+    def symmetric_matrix(
+        self, blocks: Dict[Tuple[int, int], Array], dtype=PRECISION.basis
+    ) -> FloatBxB:
+        """
+        Assembles the (spherical) class blocks of shape (K_c x M_a x M_b) into the
+        symmetric matrix of all basis functions, truncated or zero-padded to the
+        maximum number of basis functions.
+        """
+        B = self.total_basis_fns
+        out = jnp.zeros((B, B), dtype=dtype)
+        for (la, lb), (k1, k2) in self.classes().items():
+            rows = self.ao_indices(k1, la)
+            cols = self.ao_indices(k2, lb)
+            block = blocks[la, lb]
+            out = out.at[rows[:, :, None], cols[:, None, :]].set(block)
+            out = out.at[cols[:, :, None], rows[:, None, :]].set(block.transpose(0, 2, 1))
+        return _truncate_or_pad(out, self.max_number_of_basis_fns)
+
+
+def _truncate_or_pad(M: Array, size: int) -> Array:
+    B = M.shape[-1]
+    if B >= size:
+        return M[..., :size, :size]
+    pad = [(0, 0)] * (M.ndim - 2) + [(0, size - B), (0, size - B)]
+    return jnp.pad(M, pad)
+
+
+def _contract_to_spherical(
+    cart_ints: Array, coeff_a: Array, coeff_b: Array, la: int, lb: int
+) -> Array:
+    """
+    Contracts primitive cartesian integrals (K_c x G x G x C_a x C_b) to spherical
+    integrals (K_c x M_a x M_b).
+    """
+    return jnp.einsum(
+        'kg,kh,kghab,ma,nb->kmn',
+        coeff_a,
+        coeff_b,
+        cart_ints,
+        CART_SPH_CONTRACTIONS[la],
+        CART_SPH_CONTRACTIONS[lb],
+    )
+
+
+def _gaussian_product(a: Array, b: Array, A: Array, B: Array) -> Tuple[Array, Array]:
+    """Exponent and center of the product of two gaussians"""
+    p = a + b
+    P = (a[..., None] * A + b[..., None] * B) / p[..., None]
+    return p, P
+
+
+def _nuclear_boys_argument(
+    a: Array, b: Array, A: Array, B: Array, nuc_pos: FloatAx3
+) -> Array:
+    p, P = _gaussian_product(a, b, A, B)
+    return p[..., None] * jnp.sum((P[..., None, :] - nuc_pos) ** 2, axis=-1)
+
+
+def _one_electron_class(
+    la: int,
+    lb: int,
+    a: Array,
+    b: Array,
+    A: Array,
+    B: Array,
+    nuc_pos: FloatAx3,
+    nuc_charges: Array,
+    F: Array,
+) -> Tuple[Array, Array, Array]:
+    """
+    Primitive cartesian overlap, kinetic and nuclear attraction integrals of one
+    angular momentum class. a, b: (K_c x G x 1), (K_c x 1 x G), A, B: (K_c x 1 x 1 x 3)
+    and F the Boys function of the nuclear attraction (K_c x G x G x A x >= la+lb+1).
+    Returns three arrays of shape K_c x G x G x C_a x C_b.
+    """
+    p, P = _gaussian_product(a, b, A, B)
+    # overlap and kinetic energy integrals factorize in the cartesian directions
+    E = [_hermite_expansion(la, lb + 2, a, b, A[..., d], B[..., d]) for d in range(3)]
+    S1 = [e[..., 0] * jnp.sqrt(jnp.pi / p)[..., None, None] for e in E]  # la+1 x lb+3
+    j = onp.arange(lb + 1)
+    T1 = []
+    for s in S1:
+        s_jm2 = jnp.pad(s[..., : lb + 1], [(0, 0)] * (s.ndim - 1) + [(2, 0)])[..., :-2]
+        T1.append(
+            -2 * b[..., None, None] ** 2 * s[..., 2 : lb + 3]
+            + b[..., None, None] * (2 * j + 1) * s[..., : lb + 1]
+            - 0.5 * j * (j - 1) * s_jm2
+        )
+
+    ia = _cartesian_exponents(la)[:, None]  # C_a x 1 x 3
+    jb = _cartesian_exponents(lb)[None]  # 1 x C_b x 3
+
+    def cart(x: List[Array], d: int) -> Array:
+        return x[d][..., ia[..., d], jb[..., d]]
+
+    S = [cart(S1, d) for d in range(3)]
+    T = [cart(T1, d) for d in range(3)]
+    overlap = S[0] * S[1] * S[2]
+    kinetic = T[0] * S[1] * S[2] + S[0] * T[1] * S[2] + S[0] * S[1] * T[2]
+
+    # nuclear attraction
+    L = la + lb
+    PC = P[..., None, :] - nuc_pos  # K_c x G x G x A x 3
+    R = _hermite_coulomb(L, p[..., None], PC, F)  # K_c x G x G x A x L+1 x L+1 x L+1
+    R = jnp.einsum('...atuv,a->...tuv', R, -nuc_charges)
+    Ex, Ey, Ez = [e[..., ia[..., d], jb[..., d], : L + 1] for d, e in enumerate(E)]
+    nuclear = (
+        2
+        * jnp.pi
+        / p[..., None, None]
+        * jnp.einsum('...abt,...abu,...abv,...tuv->...ab', Ex, Ey, Ez, R)
+    )
+    return overlap, kinetic, nuclear
+
+
+OneElectronIntegralsFn = Callable[
+    [FloatAx3, IntA, CompileStaticIntA, CompileStaticInt],
+    Tuple[FloatBxB, FloatBxB, FloatBxB],
+]
+
+
+def get_one_electron_integrals_fn(basis: str, max_period: int) -> OneElectronIntegralsFn:
+    """
+    Returns a jitted function computing the overlap, kinetic energy and nuclear
+    attraction matrices in the same (padded) basis function layout as the basis
+    function returned by `get_gto_basis_fn`.
+    """
+    table = gto_shell_table(basis, max_period)
+
+    def one_electron_integrals(
+        nuc_pos: FloatAx3,
+        atom_z: IntA,
+        periods: CompileStaticIntA,
+        max_number_of_basis_fns: CompileStaticInt,
+    ) -> Tuple[FloatBxB, FloatBxB, FloatBxB]:
+        shell_pairs = ShellPairs(table, periods, max_number_of_basis_fns)
+        exponents, ctr_coeffs, centers = shell_pairs.primitives(nuc_pos, atom_z)
+        nuc_pos_bohr = nuc_pos * ANGSTROM_TO_BOHR
+        nuc_charges = jnp.asarray(atom_z, dtype=nuc_pos.dtype)
+
+        classes = shell_pairs.classes()
+        primitives = {
+            (la, lb): (
+                exponents[k1][:, :, None],
+                exponents[k2][:, None, :],
+                centers[k1][:, None, None],
+                centers[k2][:, None, None],
+            )
+            for (la, lb), (k1, k2) in classes.items()
+        }
+        F = _batched_boys(
+            2 * table.max_l,
+            [_nuclear_boys_argument(*x, nuc_pos_bohr) for x in primitives.values()],
+        )
+
+        overlap, kinetic, nuclear = {}, {}, {}
+        for ((la, lb), (k1, k2)), F_c in zip(classes.items(), F):
+            ints = _one_electron_class(
+                la, lb, *primitives[la, lb], nuc_pos_bohr, nuc_charges, F_c
+            )
+            overlap[la, lb], kinetic[la, lb], nuclear[la, lb] = [
+                _contract_to_spherical(x, ctr_coeffs[k1], ctr_coeffs[k2], la, lb)
+                for x in ints
+            ]
+        return (
+            shell_pairs.symmetric_matrix(overlap),
+            shell_pairs.symmetric_matrix(kinetic),
+            shell_pairs.symmetric_matrix(nuclear),
+        )
+
+    return jax.jit(
+        one_electron_integrals, static_argnames=('periods', 'max_number_of_basis_fns')
+    )
+
+
+def basis_mask_from_atom_mask(
+    table: GTOShellTable,
+    atom_mask: BoolA,
+    periods: CompileStaticIntA,
+    max_number_of_basis_fns: CompileStaticInt,
+) -> BoolB:
+    pair_atom, _, ao_pair, _ = table.layout(periods, max_number_of_basis_fns)
+    mask = atom_mask[pair_atom[ao_pair]]
+    return jnp.pad(mask, (0, max_number_of_basis_fns - len(mask)))
+
+
+def pad_diagonal(M: FloatBxB, basis_mask: BoolB, values: Array) -> FloatBxB:
+    """
+    Sets the diagonal of the padded basis functions, where `values` are enumerated in
+    the order of the padded basis functions (same convention as in the pyscf preloading).
+    """
+    pad_idx = jnp.cumsum(~basis_mask) - 1
+    return M + jnp.diag(jnp.where(basis_mask, 0.0, values[pad_idx]))
+
+
+def _three_centre_boys_argument(
+    a: Array, b: Array, A: Array, B: Array, c: Array, C: Array
+) -> Array:
+    p, P = _gaussian_product(a, b, A, B)
+    q = c[:, None]
+    return p * q / (p + q) * jnp.sum((P - C[:, None]) ** 2, axis=-1)
+
+
+def _signed_hermite_contraction(
+    R: Array, E: Array, k: int, size: int, axis: int
+) -> Array:
+    """sum_tau (-1)^tau E[:, k, tau] R[tau : tau + size] along the given axis of R"""
+    out = 0.0
+    for tau in range(k + 1):
+        idx = [slice(None)] * R.ndim
+        idx[axis] = slice(tau, tau + size)
+        e = E[:, k, tau].reshape(-1, *([1] * (R.ndim - 1)))
+        out = out + (-1) ** tau * e * R[tuple(idx)]
+    return out  # type: ignore
+
+
+def _three_centre_class(
+    la: int,
+    lb: int,
+    lc: int,
+    a: Array,
+    b: Array,
+    A: Array,
+    B: Array,
+    c: Array,
+    C: Array,
+    F: Array,
+) -> Array:
+    """
+    Primitive cartesian three-centre Coulomb integrals (ab|c) of one angular momentum
+    class. a, b: (N_ab), A, B: (N_ab x 3) primitive pairs, c: (N_c), C: (N_c x 3)
+    auxiliary primitives and F the Boys function (N_c x N_ab x >= la+lb+lc+1).
+    Returns an array of shape N_c x N_ab x C_a x C_b x C_c.
+    """
+    T = la + lb + 1
+    E_ab = [_hermite_expansion(la, lb, a, b, A[:, d], B[:, d]) for d in range(3)]
+    zeros = jnp.zeros_like(c)
+    E_c = [_hermite_expansion(lc, 0, c, zeros, C[:, d], C[:, d])[..., 0, :] for d in range(3)]
+
+    p, P = _gaussian_product(a, b, A, B)
+    q = c[:, None]
+    R = _hermite_coulomb(la + lb + lc, p * q / (p + q), P - C[:, None], F)
+
+    # contract the hermite expansion of the auxiliary function, one direction at a time
+    kc = _cartesian_exponents(lc)
+    Rz = {kz: _signed_hermite_contraction(R, E_c[2], kz, T, -1) for kz in set(kc[:, 2])}
+    Ry = {
+        (ky, kz): _signed_hermite_contraction(Rz[kz], E_c[1], ky, T, -2)
+        for ky, kz in set(map(tuple, kc[:, 1:]))
+    }
+    W = jnp.stack(
+        [_signed_hermite_contraction(Ry[ky, kz], E_c[0], kx, T, -3) for kx, ky, kz in kc],
+        axis=2,
+    )  # N_c x N_ab x C_c x T x T x T
+
+    ia = _cartesian_exponents(la)[:, None]
+    jb = _cartesian_exponents(lb)[None]
+    Ex, Ey, Ez = [e[:, ia[..., d], jb[..., d]] for d, e in enumerate(E_ab)]
+    prefactor = 2 * jnp.pi**2.5 / (p * q * jnp.sqrt(p + q))
+    return prefactor[..., None, None, None] * jnp.einsum(
+        'nabt,nabu,nabv,mnctuv->mnabc', Ex, Ey, Ez, W
+    )
+
+
+def _three_centre_block(
+    la: int,
+    lb: int,
+    lc: int,
+    pairs: Tuple[Array, Array, Array, Array, Array],
+    owner: onp.ndarray,
+    num_pairs: int,
+    aux: Tuple[Array, Array, Array],
+    F: Array | None = None,
+) -> Array:
+    """
+    Spherical integrals (c|ab) contracted over the primitive pairs (exponents, centers
+    and product of contraction coefficients) owned by `num_pairs` shell pairs, but not
+    over the auxiliary primitives, which are summed when scattering into the auxiliary
+    basis functions. Returns an array of shape N_c x K_ab x M_a x M_b x M_c.
+    """
+    a, b, A, B, coeffs = pairs
+    c, C, aux_coeffs = aux
+    if F is None:
+        F = boys(la + lb + lc, _three_centre_boys_argument(a, b, A, B, c, C))
+    ints = _three_centre_class(la, lb, lc, a, b, A, B, c, C, F)
+    ints = ints * (aux_coeffs[:, None] * coeffs[None])[..., None, None, None]
+    ints = jax.ops.segment_sum(ints.swapaxes(0, 1), owner, num_segments=num_pairs)
+    return jnp.einsum(
+        'kmabc,xa,yb,zc->mkxyz',
+        ints,
+        CART_SPH_CONTRACTIONS[la],
+        CART_SPH_CONTRACTIONS[lb],
+        CART_SPH_CONTRACTIONS[lc],
+    )
+
+
+class DensityFittingClasses:
+    """
+    Static (trace time) description of the three-centre (Q|ij) and two-centre (P|Q)
+    integral classes. AO shell pairs are decontracted into primitive pairs and the
+    auxiliary shells into primitives, such that the auxiliary dimension can be evaluated
+    in chunks (see `DirectDensityFitting`).
+    """
+
+    def __init__(
+        self,
+        table: GTOShellTable,
+        aux_table: GTOShellTable,
+        periods: CompileStaticIntA,
+        max_number_of_basis_fns: CompileStaticInt,
+    ):
+        self.ao = ShellPairs(table, periods, max_number_of_basis_fns)
+        self.aux = ShellPairs(aux_table, periods, aux_table_size(aux_table, periods))
+        self.ao_classes = self.ao.classes()
+        self.pair_owners = {
+            key: (self.ao.decontracted_pairs(k1, k2)[0], len(k1))
+            for key, (k1, k2) in self.ao_classes.items()
+        }
+        self.aux_classes = {
+            int(L): onp.nonzero(self.aux.angulars == L)[0]
+            for L in onp.unique(self.aux.angulars)
+        }
+        self.aux_owners = {
+            L: (self.aux.decontracted(k)[0], len(k)) for L, k in self.aux_classes.items()
+        }
+        self.n_max = 2 * table.max_l + aux_table.max_l
+
+    @property
+    def num_aux_fns(self) -> int:
+        return self.aux.total_basis_fns
+
+    def ao_pairs(
+        self, nuc_pos: FloatAx3, atom_z: IntA
+    ) -> Dict[Tuple[int, int], Tuple[Array, Array, Array, Array, Array]]:
+        exponents, ctr_coeffs, centers = self.ao.primitives(nuc_pos, atom_z)
+        out = {}
+        for (la, lb), (k1, k2) in self.ao_classes.items():
+            owner, g1, g2 = self.ao.decontracted_pairs(k1, k2)
+            i, j = k1[owner], k2[owner]
+            out[la, lb] = (
+                exponents[i, g1],
+                exponents[j, g2],
+                centers[i],
+                centers[j],
+                ctr_coeffs[i, g1] * ctr_coeffs[j, g2],
+            )
+        return out
+
+    def aux_primitives(
+        self, nuc_pos: FloatAx3, atom_z: IntA
+    ) -> Dict[int, Tuple[Array, Array, Array]]:
+        exponents, ctr_coeffs, centers = self.aux.primitives(nuc_pos, atom_z)
+        out = {}
+        for L, k in self.aux_classes.items():
+            owner, g = self.aux.decontracted(k)
+            out[L] = (exponents[k[owner], g], centers[k[owner]], ctr_coeffs[k[owner], g])
+        return out
+
+    def aux_indices(self, angular_momentum: int) -> onp.ndarray:
+        """Auxiliary basis function indices of each auxiliary primitive (N_c x M_c)"""
+        k = self.aux_classes[angular_momentum]
+        owner, _ = self.aux.decontracted(k)
+        return self.aux.ao_indices(k[owner], angular_momentum)
+
+    def three_centre(self, nuc_pos: FloatAx3, atom_z: IntA) -> FloatQxBxB:
+        pairs = self.ao_pairs(nuc_pos, atom_z)
+        aux = self.aux_primitives(nuc_pos, atom_z)
+        classes = [(la, lb, lc) for la, lb in pairs for lc in aux]
+        F = _batched_boys(
+            self.n_max,
+            [
+                _three_centre_boys_argument(*pairs[la, lb][:4], *aux[lc][:2])
+                for la, lb, lc in classes
+            ],
+        )
+        Q, B = self.num_aux_fns, self.ao.total_basis_fns
+        out = jnp.zeros((Q, B, B), dtype=PRECISION.basis)
+        for (la, lb, lc), F_c in zip(classes, F):
+            k1, k2 = self.ao_classes[la, lb]
+            block = _three_centre_block(
+                la, lb, lc, pairs[la, lb], *self.pair_owners[la, lb], aux[lc], F_c
+            )
+            q = self.aux_indices(lc)[:, None, None, None, :]
+            rows = self.ao.ao_indices(k1, la)[None, :, :, None, None]
+            cols = self.ao.ao_indices(k2, lb)[None, :, None, :, None]
+            off_diagonal = (k1 != k2)[None, :, None, None, None]
+            out = out.at[q, rows, cols].add(block)
+            out = out.at[q, cols, rows].add(jnp.where(off_diagonal, block, 0.0))
+        return _truncate_or_pad(out, self.ao.max_number_of_basis_fns)
+
+    def two_centre(self, nuc_pos: FloatAx3, atom_z: IntA) -> FloatQxQ:
+        aux = self.aux_primitives(nuc_pos, atom_z)
+        classes = [(lP, lQ) for lP in aux for lQ in aux if lP <= lQ]
+        pairs = {L: (c, jnp.zeros_like(c), C, C, coeffs) for L, (c, C, coeffs) in aux.items()}
+        F = _batched_boys(
+            2 * self.aux.table.max_l,
+            [
+                _three_centre_boys_argument(*pairs[lP][:4], *aux[lQ][:2])
+                for lP, lQ in classes
+            ],
+        )
+        Q = self.num_aux_fns
+        out = jnp.zeros((Q, Q), dtype=PRECISION.basis)
+        for (lP, lQ), F_c in zip(classes, F):
+            block = _three_centre_block(
+                lP, 0, lQ, pairs[lP], *self.aux_owners[lP], aux[lQ], F_c
+            )[:, :, :, 0]  # N_Q x K_P x M_P x M_Q
+            rows = self.aux.ao_indices(self.aux_classes[lP], lP)[None, :, :, None]
+            q = self.aux_indices(lQ)[:, None, None, :]
+            out = out.at[rows, q].add(block)
+            if lP < lQ:
+                out = out.at[q, rows].add(block)
+        return out
+
+    def direct_coulomb_matrix(
+        self,
+        nuc_pos: FloatAx3,
+        atom_z: IntA,
+        cholesky: FloatQxQ,
+        density_matrix: FloatBxB,
+        chunk_size: int,
+    ) -> FloatBxB:
+        """
+        J_kl = (kl|P) (P|Q)^-1 (Q|ij) P_ij, where the three-centre integrals are
+        recomputed in chunks of auxiliary primitives in two passes (fitting coefficients
+        and Coulomb matrix), such that at most N_chunk x K_ab x M_a x M_b x M_c
+        integrals are kept in memory.
+        """
+        pairs = self.ao_pairs(nuc_pos, atom_z)
+        aux = self.aux_primitives(nuc_pos, atom_z)
+        Q = self.num_aux_fns
+        chunks = {}
+        for L, (c, C, coeffs) in aux.items():
+            n_pad = -len(c) % chunk_size
+            q = jnp.pad(self.aux_indices(L), ((0, n_pad), (0, 0)), constant_values=Q)
+            c, C, coeffs = [
+                jnp.pad(x, [(0, n_pad)] + [(0, 0)] * (x.ndim - 1), constant_values=v)
+                for x, v in ((c, 1.0), (C, 0.0), (coeffs, 0.0))
+            ]
+            chunks[L] = jax.tree_util.tree_map(
+                lambda x: x.reshape(-1, chunk_size, *x.shape[1:]), (c, C, coeffs, q)
+            )
+
+        P = _truncate_or_pad(density_matrix, self.ao.total_basis_fns)
+        gamma = jnp.zeros(Q, dtype=density_matrix.dtype)
+        for (la, lb), (k1, k2) in self.ao_classes.items():
+            rows = self.ao.ao_indices(k1, la)
+            cols = self.ao.ao_indices(k2, lb)
+            weights = onp.where(k1 == k2, 1.0, 2.0)[:, None, None]  # (ij) and (ji)
+            P_block = P[rows[:, :, None], cols[:, None, :]] * weights
+            for lc, xs in chunks.items():
+
+                def fit_step(gamma, x):
+                    *aux_chunk, q = x
+                    block = _three_centre_block(
+                        la, lb, lc, pairs[la, lb], *self.pair_owners[la, lb], aux_chunk
+                    )
+                    gamma_chunk = jnp.einsum('mkabc,kab->mc', block, P_block)
+                    return gamma.at[q].add(gamma_chunk, mode='drop'), None
+
+                gamma, _ = jax.lax.scan(fit_step, gamma, xs)
+        d = jax.scipy.linalg.cho_solve((cholesky, True), gamma)
+
+        blocks = {}
+        for (la, lb), (k1, _) in self.ao_classes.items():
+            J_block = jnp.zeros((len(k1), 2 * la + 1, 2 * lb + 1), dtype=d.dtype)
+            for lc, xs in chunks.items():
+
+                def coulomb_step(J_block, x):
+                    *aux_chunk, q = x
+                    block = _three_centre_block(
+                        la, lb, lc, pairs[la, lb], *self.pair_owners[la, lb], aux_chunk
+                    )
+                    d_chunk = d.at[q].get(mode='fill', fill_value=0.0)
+                    return J_block + jnp.einsum('mkabc,mc->kab', block, d_chunk), None
+
+                J_block, _ = jax.lax.scan(coulomb_step, J_block, xs)
+            blocks[la, lb] = J_block
+        return self.ao.symmetric_matrix(blocks, dtype=d.dtype)
+
+
+def aux_table_size(table: GTOShellTable, periods: CompileStaticIntA) -> int:
+    """Number of (auxiliary) basis functions of all atoms, including padding atoms"""
+    return int(onp.sum(2 * table.pair_angulars(periods) + 1))
+
+
+DensityFittingIntegralsFn = Callable[
+    [FloatAx3, IntA, CompileStaticIntA, CompileStaticInt],
+    Tuple[FloatQxBxB, FloatQxQ],
+]
+
+
+def get_density_fitting_integrals_fn(
+    basis: str, max_period: int, aux_basis: str = 'weigend'
+) -> DensityFittingIntegralsFn:
+    """
+    Returns a jitted function computing the three-centre integrals (Q|ij) and the
+    two-centre integrals (P|Q) of the auxiliary basis. The basis dimensions follow
+    `get_gto_basis_fn`, the auxiliary dimension contains the auxiliary functions of all
+    atoms (zero for padding atoms).
+    """
+    table = gto_shell_table(basis, max_period)
+    aux_table = gto_shell_table(aux_basis, max_period)
+
+    def density_fitting_integrals(
+        nuc_pos: FloatAx3,
+        atom_z: IntA,
+        periods: CompileStaticIntA,
+        max_number_of_basis_fns: CompileStaticInt,
+    ) -> Tuple[FloatQxBxB, FloatQxQ]:
+        classes = DensityFittingClasses(table, aux_table, periods, max_number_of_basis_fns)
+        return classes.three_centre(nuc_pos, atom_z), classes.two_centre(nuc_pos, atom_z)
+
+    return jax.jit(
+        density_fitting_integrals, static_argnames=('periods', 'max_number_of_basis_fns')
+    )
+
+
+@struct.dataclass
+class DirectDensityFitting:
+    """
+    Integral-direct replacement of the (whitened) density fitted electron repulsion
+    tensor. Only the Cholesky factor of (P|Q) is stored, the three-centre integrals are
+    recomputed in chunks of `chunk_size` auxiliary primitives whenever the Coulomb matrix
+    is built, trading FLOPs for the Q x B x B memory on large molecules.
+    """
+
+    nuc_pos: FloatAx3
+    atom_z: IntA
+    cholesky: FloatQxQ  # lower Cholesky factor of the two-centre integrals (P|Q)
+    basis: str = struct.field(pytree_node=False)
+    aux_basis: str = struct.field(pytree_node=False)
+    max_period: int = struct.field(pytree_node=False)
+    periods: CompileStaticIntA = struct.field(pytree_node=False)
+    max_number_of_basis_fns: int = struct.field(pytree_node=False)
+    chunk_size: int = struct.field(pytree_node=False)
+
+    def coulomb_matrix(self, density_matrix: FloatBxB) -> FloatBxB:
+        classes = DensityFittingClasses(
+            gto_shell_table(self.basis, self.max_period),
+            gto_shell_table(self.aux_basis, self.max_period),
+            self.periods,
+            self.max_number_of_basis_fns,
+        )
+        return classes.direct_coulomb_matrix(
+            self.nuc_pos, self.atom_z, self.cholesky, density_matrix, self.chunk_size
+        )
+
+
+FockTensorsFn = Callable[
+    [FloatAx3, IntA, BoolA, IntB | Bool2xB, CompileStaticIntA, CompileStaticInt],
+    FockTensors,
+]
+
+
+def get_fock_tensors_fn(
+    basis: str,
+    max_period: int,
+    ert_type: ElectRepTensorType,
+    aux_basis: str = 'weigend',
+    chunk_size: int = 32,
+    orthogonalizer: str = 'canonical',
+) -> FockTensorsFn:
+    """
+    Returns a jitted function constructing the FockTensors of a system from its
+    geometry, replacing the cpu-based pyscf preloading. Padded basis functions follow
+    the conventions of `preload_fock_tensors_using_pyscf`. For density fitting, the
+    auxiliary functions of padding atoms are zero in the electron repulsion tensor.
+    The orthogonalizer is one of `solver.linalg.ORTHOGONALIZERS`.
+    """
+    table = gto_shell_table(basis, max_period)
+    one_electron_integrals = get_one_electron_integrals_fn(basis, max_period)
+
+    def density_fitting_classes(periods, B) -> DensityFittingClasses:
+        aux_table = gto_shell_table(aux_basis, max_period)
+        return DensityFittingClasses(table, aux_table, periods, B)
+
+    def two_centre_cholesky(nuc_pos, atom_z, atom_mask, periods, B) -> FloatQxQ:
+        classes = density_fitting_classes(periods, B)
+        aux_mask = basis_mask_from_atom_mask(
+            classes.aux.table, atom_mask, periods, classes.num_aux_fns
+        )
+        V = pad_diagonal(
+            classes.two_centre(nuc_pos, atom_z), aux_mask, jnp.ones(len(aux_mask))
+        )
+        return jnp.linalg.cholesky(V)
+
+    def electron_repulsion_tensor(nuc_pos, atom_z, atom_mask, periods, B):
+        if ert_type == ElectRepTensorType.DENSITY_FITTED:
+            classes = density_fitting_classes(periods, B)
+            L = two_centre_cholesky(nuc_pos, atom_z, atom_mask, periods, B)
+            ints_3c = classes.three_centre(nuc_pos, atom_z)
+            Q = ints_3c.shape[0]
+            ert = jax.scipy.linalg.solve_triangular(L, ints_3c.reshape(Q, -1), lower=True)
+            return ert.reshape(Q, B, B)
+        elif ert_type == ElectRepTensorType.DENSITY_FITTED_DIRECT:
+            return DirectDensityFitting(
+                nuc_pos=nuc_pos,
+                atom_z=jnp.asarray(atom_z, dtype=jnp.int32),
+                cholesky=two_centre_cholesky(nuc_pos, atom_z, atom_mask, periods, B),
+                basis=basis,
+                aux_basis=aux_basis,
+                max_period=max_period,
+                periods=periods,
+                max_number_of_basis_fns=B,
+                chunk_size=chunk_size,
+            )
+        # TODO: implement jax based four-centre electron repulsion integrals
+        raise NotImplementedError(
+            f'JAX based electron repulsion tensor ({ert_type}) not implemented'
+        )
+
+    def fock_tensors(
+        nuc_pos: FloatAx3,
+        atom_z: IntA,
+        atom_mask: BoolA,
+        occupancies: IntB | Bool2xB,
+        periods: CompileStaticIntA,
+        max_number_of_basis_fns: CompileStaticInt,
+    ) -> FockTensors:
+        B = max_number_of_basis_fns
+        basis_mask = basis_mask_from_atom_mask(table, atom_mask, periods, B)
+        S, T, V = one_electron_integrals(nuc_pos, atom_z, periods, B)
+        overlap = pad_diagonal(S, basis_mask, jnp.ones(B))
+        ert = electron_repulsion_tensor(nuc_pos, atom_z, atom_mask, periods, B)
+        return FockTensors(
+            basis_mask=basis_mask,
+            overlap=overlap,
+            core_hamiltonian=T + V,
+            electron_repulsion_tensor=ert,
+            diagonal_overlap=transformation_matrix(overlap, basis_mask, orthogonalizer),
+            occupancies=jnp.asarray(occupancies),
+        )
+
+    return jax.jit(fock_tensors, static_argnames=('periods', 'max_number_of_basis_fns'))
@@ -0,0 +1,216 @@
+"""
+Single-point energies (and forces) of the geometries of a trajectory file, e.g., of an
+MD simulation, with a trained model. The geometries are read lazily with ASE, preloaded
+(pyscf) in a pool of worker processes and evaluated by the vmapped early-exit SCF (see
+`SelfConsistentFieldSolver.converge`) in batches of the same shape bucket. At most
+`prefetch` preloaded geometries, the partial batches of the buckets and two batches on
+the device are held at any time. The predictions are written as soon as their batch
+completes, such that the memory does not grow with the length of the trajectory.
+
+The command line interface runs the model of a training configuration:
+    python scripts/main.py predict with <training config> \\
+        checkpointing.load_path=<checkpoints> inference.input=<trajectory.xyz>
+"""
+
+import json
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import ase.io
+import grain.python as grain
+import jax
+import jax.numpy as jnp
+import numpy as onp
+
+from egxc.dataloading import RawSample, Targets, ToJaxTransform, preloaded_to_device
+from egxc.solver.base import Solver
+from egxc.solver.forces import get_forces_fn
+from egxc.systems import System, SystemFn, PreloadSystem, nuclear_energy
+from egxc.training.evaluation import bucketed_batches
+
+from egxc.utils.typing import NnParams
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+Prediction = Dict[str, onp.ndarray]  # energy [Eh], forces [Eh/A], scf cycles
+
+
+def read_trajectory(
+    path: str, index: str = ':', format: str | None = None
+) -> Iterator[RawSample]:
+    """
+    Reads the geometries of any format supported by ASE one at a time. The total charge
+    and spin are taken from `atoms.info['charge']` and `atoms.info['spin']` if present.
+    """
+    for atoms in ase.io.iread(path, index=index, format=format):
+        charge = int(atoms.info.get('charge', 0))
+        spin = int(atoms.info.get('spin', 0))
+        raw_input = (atoms.get_positions(), atoms.get_atomic_numbers(), charge, spin)
+        yield raw_input, Targets(None, None, None)
+
+
+def _preload(transform: grain.MapTransform, sample: RawSample) -> PreloadSystem:
+    return transform.map(sample)[0]  # type: ignore
+
+
+def preload(
+    samples: Iterable[RawSample],
+    transform: grain.MapTransform,
+    workers: int = 4,
+    prefetch: int = 16,
+) -> Iterator[PreloadSystem]:
+    """
+    Preloads the samples in order with the (pyscf) preload transform of the training (see
+    `egxc.dataloading.get_preload_transform`) in `workers` processes, 0 for the main
+    process. At most `prefetch` samples are submitted ahead of the consumer.
+    """
+    if workers == 0:
+        yield from (_preload(transform, sample) for sample in samples)
+        return
+    assert prefetch >= 1, 'At least one sample has to be prefetched'
+    # spawned, as forking the main process after jax has started its threads is unsafe
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        futures = deque()
+        for sample in samples:
+            futures.append(pool.submit(_preload, transform, sample))
+            if len(futures) >= prefetch:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+
+class Predictor:
+    def __init__(
+        self,
+        model: Solver,
+        input_transform: ToJaxTransform,
+        system_fn: SystemFn | None = None,
+        forces: bool = False,
+        scf_tolerance: float | None = 1e-6,
+        batch_size: int = 1,
+    ) -> None:
+        """
+        Args:
+            input_transform: transform of the training, see `egxc.dataloading`
+            system_fn: required for the forces, whose grid and Fock tensors must not be
+                preloaded
+            forces: whether to predict the nuclear forces
+            scf_tolerance: early exit of the SCF, None runs all cycles
+            batch_size: number of geometries of a shape bucket evaluated at once
+        """
+        assert batch_size >= 1, 'Batch size must be at least 1'
+        if forces:
+            # the System is built inside, such that the forces can be obtained by
+            # differentiating w.r.t. the nuclear positions
+            assert system_fn is not None, 'Forces require a system_fn'
+            forces_fn = get_forces_fn(model, system_fn)
+            input_transform = preloaded_to_device  # type: ignore
+        self.input_transform = input_transform
+        self.batch_size = batch_size
+        early_exit = scf_tolerance is not None and hasattr(model, 'converge')
+
+        def predict_fn(params, P0, inputs: System | PreloadSystem) -> Prediction:
+            sys = system_fn(jnp.asarray(inputs.nuc_pos), inputs) if forces else inputs
+            if early_exit:
+                (e_hj, e_xc), density_matrices, cycles = model.apply(
+                    params, P0, sys, method='converge', tolerance=scf_tolerance
+                )
+            else:
+                (e_hj, e_xc), density_matrices = model.apply(params, P0, sys)
+            energy = e_hj[-1] + e_xc[-1] + nuclear_energy(sys._nuc_pos, sys)
+            prediction = {'energy': energy}
+            if forces:
+                _, prediction['forces'] = forces_fn(params, density_matrices[-1], inputs)
+            if early_exit:
+                prediction['scf cycles'] = cycles
+            return prediction
+
+        if forces:
+            # sequential within a batch, as the compilation of the vmapped derivatives of
+            # the grid and the integrals takes prohibitively long
+            def batched_predict_fn(params, P0, inputs):
+                return jax.lax.map(lambda x: predict_fn(params, *x), (P0, inputs))
+        else:
+            batched_predict_fn = jax.vmap(predict_fn, in_axes=(None, 0, 0))
+        self.batched_predict_fn = jax.jit(batched_predict_fn)
+
+    def __call__(
+        self, params: NnParams, systems: Iterable[Tuple[Any, PreloadSystem]]
+    ) -> Iterator[Tuple[Any, Prediction]]:
+        """
+        Yields the predictions of the (meta, preloaded system) pairs in the order of
+        completion with their meta data, e.g., the index in the trajectory. The next
+        batch is dispatched before the predictions of the current one are read.
+        """
+        samples = ((meta, self.input_transform(psys)) for meta, psys in systems)
+        in_flight = deque()
+        for metas, batch in bucketed_batches(samples, self.batch_size):
+            in_flight.append((metas, self.batched_predict_fn(params, *batch)))
+            if len(in_flight) > 1:
+                yield from _unbatch(*in_flight.popleft())
+        while in_flight:
+            yield from _unbatch(*in_flight.popleft())
+
+
+def _unbatch(metas: list, predictions: Prediction) -> Iterator[Tuple[Any, Prediction]]:
+    predictions = jax.device_get(predictions)
+    for i, meta in enumerate(metas):
+        yield meta, {key: value[i] for key, value in predictions.items()}
+
+
+def predict_trajectory(
+    params: NnParams,
+    predictor: Predictor,
+    preload_transform: grain.MapTransform,
+    input_path: str,
+    output_path: str,
+    index: str = ':',
+    format: str | None = None,
+    workers: int = 4,
+    prefetch: int = 16,
+) -> Dict[str, float]:
+    """
+    Writes one JSON line per geometry to `output_path`:
+        {"index": 3, "energy": -76.4, "forces": [[...], ...], "scf cycles": 9}
+    with the energy in Hartree and the forces in Hartree per Angstrom, in the atom order
+    of the input. The lines are in the order of completion.
+    Returns:
+        Number of geometries, duration (including the compilation) and throughput
+    """
+    start = perf_counter()
+
+    def systems() -> Iterator[Tuple[Tuple[int, onp.ndarray], PreloadSystem]]:
+        raw_samples = read_trajectory(input_path, index, format)
+        atom_zs = deque()  # of the submitted samples, consumed in the same order
+
+        def submitted() -> Iterator[RawSample]:
+            for sample in raw_samples:
+                atom_zs.append(onp.asarray(sample[0][1]))
+                yield sample
+
+        psyss = preload(submitted(), preload_transform, workers, prefetch)
+        for i, psys in enumerate(psyss):
+            yield (i, atom_zs.popleft()), psys
+
+    n = 0
+    with open(output_path, 'w') as f:
+        for (i, atom_z), prediction in predictor(params, systems()):
+            record: Dict[str, Any] = {'index': i, 'energy': float(prediction['energy'])}
+            if 'forces' in prediction:
+                # the preloaded atoms are sorted by atomic number and padded
+                order = onp.argsort(atom_z.astype(onp.uint8), stable=True)
+                forces = onp.empty((len(atom_z), 3))
+                forces[order] = prediction['forces'][: len(atom_z)]
+                record['forces'] = forces.tolist()
+            if 'scf cycles' in prediction:
+                record['scf cycles'] = int(prediction['scf cycles'])
+            f.write(json.dumps(record) + '\n')
+            n += 1
+    duration = perf_counter() - start
+    return {
+        'inference/molecules': n,
+        'inference/duration [s]': duration,
+        'inference/molecules per second': n / duration,
+    }
@@ -2,6 +2,8 @@ import flax.linen as nn
 
 from egxc.systems.base import System
 from egxc.utils.typing import (
+    Float1,
+    FloatAx3,
     FloatBxB,
     Float2xBxB,
     FloatSCF,
@@ -22,3 +24,15 @@ class Solver(nn.Module):
         initial_density_matrix: FloatBxB | Float2xBxB,
         sys: System,
     ) -> Tuple[Tuple[FloatSCF, FloatSCF], FloatSCFxBxB | FloatSCFx2xBxB]: ...
+
+    def energy_and_fock_matrix(
+        self,
+        nuc_pos: FloatAx3,
+        density_matrix: FloatBxB | Float2xBxB,
+        sys: System,
+    ) -> Tuple[Tuple[Float1, Float1], FloatBxB | Float2xBxB]:
+        """
+        (core hamiltonian + coulomb, exchange-correlation) energies and the Fock matrix
+        of a density matrix, e.g. for the forces of converged solutions.
+        """
+        ...
@@ -0,0 +1,184 @@
+"""
+Direct minimization of the Kohn-Sham energy over unitary rotations of the orbitals
+    C(Z) = C_0 exp(Z E^T - E Z^T),
+where E holds the first O unit vectors and Z the occupied-virtual rotation angles, with
+a diagonally preconditioned L-BFGS. Apart from the initial guess, no eigendecomposition
+is needed, and the rank-2O structure of the generator reduces the cost of a rotation
+from O(B^3) to O(B^2 O).
+T. Van Voorhis, M. Head-Gordon. "A geometric approach to direct minimization."
+Mol. Phys. 100, 1713 (2002). https://doi.org/10.1080/00268970110103642
+"""
+
+import jax
+import jax.numpy as jnp
+import optax
+from functools import partial
+
+from egxc.xc_energy.functionals.base import XCModule
+from egxc.solver import fock, linalg
+from egxc.solver.base import Solver
+from egxc.solver.scf.implicit import implicit_fixed_point
+from egxc.systems.base import System
+from egxc.utils.typing import (
+    Float1,
+    FloatAx3,
+    FloatB,
+    FloatBxB,
+    Float2xBxB,
+    FloatSCF,
+    FloatSCFxBxB,
+    FloatSCFx2xBxB,
+    IntB,
+    BoolBxO,
+    FloatBxO,
+    ElectRepTensorType,
+)
+
+from typing import Tuple
+
+
+def rotate_orbitals(coeff: FloatBxB, angles: FloatBxO) -> FloatBxB:
+    """
+    C exp(Z E^T - E Z^T) for angles Z of shape (B, O). With W = [Z, E] the generator is
+    W A W^T, such that exp(W A W^T) = 1 + W phi(A W^T W) A W^T, phi(x) = (e^x - 1) / x,
+    where phi is evaluated on a 2O x 2O matrix.
+    """
+    B, O = angles.shape
+    identity = jnp.eye(O)
+    zeros = jnp.zeros((O, O))
+    A = jnp.block([[zeros, identity], [-identity, zeros]])
+    W = jnp.concatenate([angles, jnp.eye(B, O)], axis=1)
+    M = A @ (W.T @ W)
+    # phi(M) is the upper right block of exp([[M, 1], [0, 0]])
+    augmented = jnp.block([[M, jnp.eye(2 * O)], [jnp.zeros((2 * O, 4 * O))]])
+    phi = jax.scipy.linalg.expm(augmented)[: 2 * O, 2 * O :]
+    CW = jnp.concatenate([coeff @ angles, coeff[:, :O]], axis=1)
+    return coeff + CW @ (phi @ A) @ W.T
+
+
+def rotation_mask(occupancy: IntB, occupied_orbitals: int) -> BoolBxO:
+    """Occupied-virtual pairs (a, i) of the first `occupied_orbitals` columns."""
+    occupied = occupancy > 0
+    return ~occupied[:, None] & occupied[None, :occupied_orbitals]
+
+
+def preconditioner(
+    orbital_energies: FloatB, occupancy: IntB, occupied_orbitals: int, min_gap: float
+) -> FloatBxO:
+    """Diagonal of the orbital Hessian 2 n_i (e_a - e_i) of the initial orbitals."""
+    e = orbital_energies
+    gap = e[:, None] - e[None, :occupied_orbitals]
+    n = occupancy[None, :occupied_orbitals]
+    return 2 * jnp.maximum(n, 1) * jnp.maximum(gap, min_gap)
+
+
+class DirectMinimizationSolver(Solver):
+    XCModule: XCModule
+    cycles: int
+    ert_type: ElectRepTensorType
+    spin_restricted: bool = True
+    memory_size: int = 10
+    # upper bound of the occupied orbitals per spin, all orbitals if None
+    occupied_orbitals: int | None = None
+    # lower bound of the orbital energy gaps in the preconditioner
+    min_preconditioner_gap: float = 0.2
+    # the final density matrix is differentiated implicitly at the SCF fixed point
+    adjoint_max_iterations: int = 20
+    adjoint_tolerance: float = 1e-8
+
+    def setup(self) -> None:
+        self.FockModule = fock.FockMatrix(
+            self.XCModule, self.ert_type, self.spin_restricted
+        )  # type: ignore
+
+        def aufbau(F, X, occupancies):
+            e, C = linalg.modified_generalized_eigenvalue_problem(F, X)
+            return e, C, linalg.coeff_to_density_matrix(C, occupancies)
+
+        def density_matrix(C, angles, occupancies):
+            return linalg.coeff_to_density_matrix(rotate_orbitals(C, angles), occupancies)
+
+        if not self.spin_restricted:  # vmap over spin
+            aufbau = jax.vmap(aufbau, in_axes=(0, None, 0))
+            density_matrix = jax.vmap(density_matrix)
+        self.aufbau = aufbau
+        self.density_matrix = density_matrix
+
+    def __call__(
+        self,
+        initial_density_matrix: FloatBxB | Float2xBxB,
+        sys: System,
+    ) -> Tuple[Tuple[FloatSCF, FloatSCF], FloatSCFxBxB | FloatSCFx2xBxB]:
+        F_0 = self.FockModule.fock_matrix(sys._nuc_pos, initial_density_matrix, sys)
+        X, occupancies = sys.fock_tensors.diagonal_overlap, sys.fock_tensors.occupancies
+        e, C_0, _ = self.aufbau(F_0, X, occupancies)
+        O = self.occupied_orbitals or occupancies.shape[-1]
+        mask_fn, precond_fn = rotation_mask, preconditioner
+        if not self.spin_restricted:
+            mask_fn = jax.vmap(mask_fn, in_axes=(0, None))
+            precond_fn = jax.vmap(precond_fn, in_axes=(0, 0, None, None))
+        mask = mask_fn(occupancies, O)
+        precond = precond_fn(e, occupancies, O, self.min_preconditioner_gap)
+        scale = jax.lax.stop_gradient(jax.lax.rsqrt(precond))
+
+        solver, variables = self.unbind()
+        energy_fn = partial(solver.apply, method=DirectMinimizationSolver.__energy)
+
+        def energy_of_angles(Y, variables, C_0, sys):
+            # Y are the angles in the preconditioned coordinates Z = Y / sqrt(H)
+            P = self.density_matrix(C_0, mask * scale * Y, sys.fock_tensors.occupancies)
+            return energy_fn(variables, P, sys)
+
+        # the minimization itself is not differentiated, see below
+        args = jax.lax.stop_gradient((variables, C_0, sys))
+        value_fn = partial(energy_of_angles, variables=args[0], C_0=args[1], sys=args[2])
+        optimizer = optax.lbfgs(memory_size=self.memory_size)
+        value_and_grad_fn = optax.value_and_grad_from_state(value_fn)
+
+        def step(carry, _):
+            Y, opt_state = carry
+            value, grad = value_and_grad_fn(Y, state=opt_state)
+            updates, opt_state = optimizer.update(
+                grad, opt_state, Y, value=value, grad=grad, value_fn=value_fn
+            )
+            Y = optax.apply_updates(Y, updates)
+            P = self.density_matrix(args[1], mask * scale * Y, args[2].fock_tensors.occupancies)
+            return (Y, opt_state), P
+
+        Y_0 = jnp.zeros_like(mask, dtype=C_0.dtype)
+        (Y, _), density_matrices = jax.lax.scan(
+            step, (Y_0, optimizer.init(Y_0)), length=self.cycles - 1
+        )
+        # the minimum is the SCF fixed point, at which the final density matrix is
+        # differentiated implicitly
+        F = self.FockModule.fock_matrix(sys._nuc_pos, density_matrices[-1], sys)
+        F = implicit_fixed_point(
+            partial(solver.apply, method=DirectMinimizationSolver.__scf_map),
+            variables,
+            jax.lax.stop_gradient(F),
+            sys,
+            self.adjoint_max_iterations,
+            self.adjoint_tolerance,
+        )
+        _, _, P = self.aufbau(F, X, occupancies)
+        density_matrices = jnp.concatenate([jax.lax.stop_gradient(density_matrices), P[None]])
+        energy_fn = jax.vmap(self.FockModule.energy, in_axes=(None, 0, None))
+        return energy_fn(sys._nuc_pos, density_matrices, sys), density_matrices
+
+    def energy_and_fock_matrix(
+        self,
+        nuc_pos: FloatAx3,
+        density_matrix: FloatBxB | Float2xBxB,
+        sys: System,
+    ) -> Tuple[Tuple[Float1, Float1], FloatBxB | Float2xBxB]:
+        return self.FockModule.energy_and_fock_matrix(nuc_pos, density_matrix, sys)
+
+    def __energy(self, P, sys):
+        e_hj, e_xc = self.FockModule.energy(sys._nuc_pos, P, sys)
+        return e_hj + e_xc
+
+    def __scf_map(self, F, sys):
+        """Fock matrix of the aufbau density matrix of F, whose fixed point is the SCF."""
+        X, occupancies = sys.fock_tensors.diagonal_overlap, sys.fock_tensors.occupancies
+        _, _, P = self.aufbau(F, X, occupancies)
+        return self.FockModule.fock_matrix(sys._nuc_pos, P, sys)
@@ -7,9 +7,11 @@ Susi Lehtola et al. "An Overview of Self-Consistent Field Calculations Within Fi
 Molecules 2020, 25 (5), 1218. https://doi.org/10.3390/molecules25051218.
 """
 
+import jax
 import jax.numpy as jnp
 import flax.linen as nn
 import einops
+from jax.ad_checkpoint import checkpoint_name
 
 from egxc.xc_energy import XCModule
 from egxc.systems.base import System
@@ -38,17 +40,21 @@ class FockMatrix(nn.Module):
             electron_repulsion_tensor: FloatQxBxB | FloatBxBxBxB,
         ) -> FloatBxB:
             P = density_matrix if self.spin_restricted else density_matrix.sum(axis=0)
-            if self.ert_type == ElectRepTensorType.EXACT:
-                J = jnp.einsum('ijkl,ij->kl', electron_repulsion_tensor, P)
-            elif self.ert_type == ElectRepTensorType.DENSITY_FITTED:
-                J = jnp.einsum(
-                    'Pij,Pkl,ij->kl',
-                    electron_repulsion_tensor,
-                    electron_repulsion_tensor,
-                    P,
-                )
-            else:
-                raise ValueError(f'Invalid ert_type: {self.ert_type}')
+            with jax.named_scope('coulomb_matrix'):
+                if self.ert_type == ElectRepTensorType.EXACT:
+                    J = jnp.einsum('ijkl,ij->kl', electron_repulsion_tensor, P)
+                elif self.ert_type == ElectRepTensorType.DENSITY_FITTED:
+                    J = jnp.einsum(
+                        'Pij,Pkl,ij->kl',
+                        electron_repulsion_tensor,
+                        electron_repulsion_tensor,
+                        P,
+                    )
+                elif self.ert_type == ElectRepTensorType.DENSITY_FITTED_DIRECT:
+                    # DirectDensityFitting, recomputes the three-centre integrals
+                    J = electron_repulsion_tensor.coulomb_matrix(P)  # type: ignore
+                else:
+                    raise ValueError(f'Invalid ert_type: {self.ert_type}')
             return J
 
         self.coulomb_matrix_fn = compute_coulomb_matrix
@@ -91,10 +97,12 @@ class FockMatrix(nn.Module):
         P = density_matrix
         H_core, non_local_kwargs = self.preprocessing(nuc_pos, sys)
         J = self.coulomb_matrix_fn(P, sys.fock_tensors.ert)
+        J = checkpoint_name(J, 'coulomb_matrix')
 
         V_xc = self.xc_module.xc_potential(
             P, sys.grid, sys.fock_tensors.basis_mask, **non_local_kwargs
         )
+        V_xc = checkpoint_name(V_xc, 'xc_potential')
         return H_core + J + V_xc
 
     def energy(
@@ -0,0 +1,108 @@
+"""
+Nuclear forces of converged SCF solutions.
+
+Instead of backpropagating through all SCF cycles, the forces follow from implicit
+differentiation at the SCF fixed point. Since the energy is stationary w.r.t. the
+density matrix under the orthonormality constraint of the orbitals, its total derivative
+reduces to the derivative at fixed density matrix P and the (Pulay) overlap term of the
+energy weighted density matrix W:
+    dE/dR = dE/dR|_P - Tr[W dS/dR]
+Memory and cost are hence independent of the number of SCF cycles.
+J. A. Pople et al. "Derivative studies in Hartree-Fock and Møller-Plesset theories."
+Int. J. Quantum Chem. 1979, 16 (S13), 225-241.
+"""
+
+import jax
+import jax.numpy as jnp
+import numpy as onp
+
+from egxc.solver.base import Solver
+from egxc.systems import SystemFn, nuclear_energy
+from egxc.systems.preload import PreloadSystem
+
+from egxc.utils.typing import (
+    Array,
+    Float1,
+    FloatAx3,
+    FloatBxB,
+    Float2xBxB,
+    NnParams,
+    PRECISION,
+)
+from typing import Callable, Sequence, Tuple
+
+ForcesFn = Callable[
+    [NnParams, FloatBxB | Float2xBxB, PreloadSystem], Tuple[Float1, FloatAx3]
+]
+
+
+def energy_weighted_density_matrix(
+    density_matrix: FloatBxB | Float2xBxB, fock_matrix: FloatBxB | Float2xBxB
+) -> FloatBxB:
+    """
+    W = sum_i n_i e_i c_i c_i^T, which equals P F P / 2 for doubly occupied (spin
+    restricted) and sum_s P_s F_s P_s for singly occupied orbitals at convergence.
+    """
+    if density_matrix.ndim == 2:
+        return 0.5 * density_matrix @ fock_matrix @ density_matrix
+    return jnp.einsum('sij,sjk,skl->il', density_matrix, fock_matrix, density_matrix)
+
+
+def get_forces_fn(model: Solver, system_fn: SystemFn) -> ForcesFn:
+    """
+    Returns a function computing the total energy and the nuclear forces (Hartree per
+    Angstrom) of a converged density matrix. The System is rebuilt by `system_fn` from
+    the nuclear positions, hence the grid, atomic orbitals and Fock tensors must not be
+    preloaded. Differentiable w.r.t. the model parameters, e.g. for force training.
+    """
+
+    def forces_fn(
+        params: NnParams, density_matrix: FloatBxB | Float2xBxB, psys: PreloadSystem
+    ) -> Tuple[Float1, FloatAx3]:
+        assert psys.grid is None and psys.fock_tensors is None, (
+            'Forces require the grid and fock tensors to be computed from nuc_pos'
+        )
+        P = density_matrix
+
+        def energy_overlap_and_fock_matrix(nuc_pos: FloatAx3):
+            sys = system_fn(nuc_pos, psys)
+            (e_hj, e_xc), F = model.apply(
+                params, nuc_pos, P, sys, method='energy_and_fock_matrix'
+            )  # type: ignore
+            energy = e_hj + e_xc + nuclear_energy(nuc_pos, sys)
+            return energy, sys.fock_tensors.overlap, F
+
+        nuc_pos = jnp.asarray(psys.nuc_pos, dtype=PRECISION.forces)
+        (energy, _, F), vjp_fn = jax.vjp(energy_overlap_and_fock_matrix, nuc_pos)
+        W = energy_weighted_density_matrix(P, F)
+        # the cotangent of F is zero, i.e. P and W are constant w.r.t. nuc_pos
+        (grad,) = vjp_fn((jnp.ones_like(energy), -W, jnp.zeros_like(F)))
+        return energy, -grad * psys.atom_mask[:, None]
+
+    return forces_fn
+
+
+def get_batched_energies_and_forces_fn(
+    model: Solver, system_fn: SystemFn
+) -> Callable[[NnParams, Array, PreloadSystem], Tuple[Array, Array]]:
+    """
+    Runs the SCF and evaluates the energies and forces for a batch of geometries of the
+    same (padded) molecule, e.g. the conformations of an MD17 trajectory, vectorized
+    over the leading dimension of the initial density matrices and the stacked
+    preloaded systems (see `stack_preloaded_systems`).
+    """
+    forces_fn = get_forces_fn(model, system_fn)
+
+    def energy_and_forces(
+        params: NnParams, P0: FloatBxB | Float2xBxB, psys: PreloadSystem
+    ) -> Tuple[Float1, FloatAx3]:
+        sys = system_fn(jnp.asarray(psys.nuc_pos), psys)
+        _, density_matrices = model.apply(params, P0, sys)  # type: ignore
+        return forces_fn(params, density_matrices[-1], psys)
+
+    return jax.jit(jax.vmap(energy_and_forces, in_axes=(None, 0, 0)))
+
+
+def stack_preloaded_systems(psys: Sequence[PreloadSystem]) -> PreloadSystem:
+    """Stacks the arrays of preloaded systems sharing the same compile static fields"""
+    return jax.tree_util.tree_map(lambda *x: onp.stack(x), *psys)
@@ -1,8 +1,11 @@
+import jax
 import jax.numpy as jnp
-from typing import Tuple
+from typing import Callable, Dict, Tuple
 
 from egxc.utils.typing import (
+    Float1,
     IntE,
+    BoolB,
     Bool2xE,
     FloatB,
     FloatBxB,
@@ -21,32 +24,114 @@ def coeff_to_density_matrix(
     return jnp.einsum('pi,qi,i->pq', coeff, coeff, occupancy)
 
 
-def transformation_matrix(S: FloatBxB) -> FloatBxB:
+# orthogonalizers map the overlap matrix and the basis mask to a transformation matrix X
+# with X^T S X = 1 on the retained subspace, whose removed directions (padded basis
+# functions, linear dependencies) are zero columns of X
+Orthogonalizer = Callable[[FloatBxB, BoolB], FloatBxB]
+ORTHOGONALIZERS: Dict[str, Orthogonalizer] = {}
+# relative to the largest eigenvalue of the overlap matrix
+LINEAR_DEPENDENCY_THRESHOLD = 1e-8
+
+
+def register_orthogonalizer(name: str) -> Callable[[Orthogonalizer], Orthogonalizer]:
+    def register(orthogonalizer: Orthogonalizer) -> Orthogonalizer:
+        ORTHOGONALIZERS[name] = orthogonalizer
+        return orthogonalizer
+
+    return register
+
+
+@register_orthogonalizer('canonical')
+def canonical_orthogonalization(S: FloatBxB, basis_mask: BoolB) -> FloatBxB:
     """
-    Returns the transformation matrix X that diagonalizes the overlap matrix S.
+    X = U s^(-1/2) of the eigenvectors U with eigenvalues s above the linear dependency
+    threshold, see P.-O. Löwdin. Adv. Quantum Chem. 5, 185 (1970).
+    https://doi.org/10.1016/S0065-3276(08)60339-1
+    """
+    S = jnp.where(basis_mask[:, None] & basis_mask[None, :], S, 0.0)
+    s, U = jnp.linalg.eigh(S, symmetrize_input=True)
+    retained = s > LINEAR_DEPENDENCY_THRESHOLD * s[-1]
+    return U * jnp.where(retained, jax.lax.rsqrt(jnp.where(retained, s, 1.0)), 0.0)
+
+
+@register_orthogonalizer('symmetric')
+def symmetric_orthogonalization(S: FloatBxB, basis_mask: BoolB) -> FloatBxB:
+    """X = S^(-1/2), which requires S to be well conditioned."""
+    Lambda, V = jnp.linalg.eigh(S, symmetrize_input=True)
+    inv_lambda = jnp.reciprocal(jnp.sqrt(Lambda))
+    return jnp.einsum('ab,b,bd->ad', V, inv_lambda, V.T) * basis_mask
+
+
+@register_orthogonalizer('cholesky')
+def cholesky_orthogonalization(S: FloatBxB, basis_mask: BoolB) -> FloatBxB:
+    """
+    X = L^(-T) of the Cholesky decomposition S = L L^T, which is cheaper than an
+    eigendecomposition but requires S to be well conditioned.
+    """
+    L = jnp.linalg.cholesky(S, symmetrize_input=True)
+    X = jax.scipy.linalg.solve_triangular(L, jnp.eye(len(S), dtype=S.dtype), lower=True)
+    return X.T * basis_mask
+
+
+def transformation_matrix(
+    S: FloatBxB, basis_mask: BoolB | None = None, orthogonalizer: str = 'canonical'
+) -> FloatBxB:
+    """
+    Returns the transformation matrix X that diagonalizes the overlap matrix S, where
+    padded basis functions have an identity block in S.
     """
     # TODO: remove this check?
     assert (
         S.dtype == PRECISION.solver
     ), f'Expected {PRECISION.solver} dtype, got {S.dtype}'
+    if basis_mask is None:
+        basis_mask = jnp.ones(len(S), dtype=bool)
+    return ORTHOGONALIZERS[orthogonalizer](S, basis_mask)
 
-    Lambda, V = jnp.linalg.eigh(S, symmetrize_input=True)
-    inv_lambda = jnp.reciprocal(jnp.sqrt(Lambda))
-    return jnp.einsum('ab,b,bd->ad', V, inv_lambda, V.T)
+
+def orthogonal_fock_matrix(
+    F: FloatBxB,
+    X: FloatBxB,
+    level_shift: Float1 | float = 0.0,
+    occupied_projector: FloatBxB | None = None,
+) -> FloatBxB:
+    """
+    X^T F X, where the virtual orbitals are shifted up by level_shift if an
+    occupied_projector S P S / max_occupancy of the previous density matrix P is given.
+    V. R. Saunders, I. H. Hillier. Int. J. Quantum Chem. 7, 699 (1973).
+    https://doi.org/10.1002/qua.560070407
+    Directions removed by the orthogonalizer are decoupled and placed above the
+    (Gershgorin bound of the) spectrum, such that they are never occupied.
+    """
+    F_dash = X.T @ F @ X
+    if occupied_projector is not None:
+        virtual_projector = jnp.eye(F.shape[0]) - X.T @ occupied_projector @ X
+        F_dash += level_shift * virtual_projector
+    removed = jnp.all(X == 0, axis=0)
+    F_dash = jnp.where(removed[:, None] | removed[None, :], 0.0, F_dash)
+    upper = jnp.max(jnp.diag(F_dash) + jnp.abs(F_dash).sum(axis=1) - jnp.abs(jnp.diag(F_dash)))
+    return F_dash + jnp.diag(jnp.where(removed, upper + 1, 0.0))
 
 
 def modified_generalized_eigenvalue_problem(
-    F: FloatBxB, X: FloatBxB, mask=None
+    F: FloatBxB,
+    X: FloatBxB,
+    mask=None,
+    level_shift: Float1 | float = 0.0,
+    occupied_projector: FloatBxB | None = None,
 ) -> Tuple[FloatB, FloatBxB]:
     """
     Returns a function that solves the generalized eigenvalue problem.
     In the context of SCF calculations F is the Fock matrix and X is the
     transformation matrix which diagonalizes the overlap matrix S.
 
+    The optional level shift of the virtual orbitals (see orthogonal_fock_matrix)
+    stabilizes the SCF for small HOMO-LUMO gaps without changing its fixed point.
+
     TODO: make more robust to degeneracies due to large basis sets
           (see section 7 in https://doi.org/10.3390/molecules25051218)
     """
-    F_dash = X.T @ F @ X
+    F_dash = orthogonal_fock_matrix(F, X, level_shift, occupied_projector)
     if mask is not None:
         F_dash *= mask
     e, C_dash = jnp.linalg.eigh(F_dash, symmetrize_input=True)
@@ -54,6 +139,52 @@ def modified_generalized_eigenvalue_problem(
     return e, C
 
 
+def purified_density_matrix(
+    F: FloatBxB,
+    X: FloatBxB,
+    occupancy: IntE,
+    iterations: int,
+    level_shift: Float1 | float = 0.0,
+    occupied_projector: FloatBxB | None = None,
+    tolerance: float = 1e-10,
+) -> FloatBxB:
+    """
+    Aufbau density matrix of F by trace-correcting purification, which only consists
+    of matrix products and requires neither an eigendecomposition nor the virtual
+    orbitals. The spectrum of X^T F X is mapped into [0, 1] using Gershgorin bounds, and
+    each iteration pushes the eigenvalues below (above) the Fermi level towards 1 (0).
+    Once idempotent up to the tolerance, the iterations stop, as further ones would
+    only amplify rounding errors.
+    A. M. N. Niklasson. "Expansion algorithm for the density matrix."
+    Phys. Rev. B 66, 155115 (2002). https://doi.org/10.1103/PhysRevB.66.155115
+    """
+    F_dash = orthogonal_fock_matrix(F, X, level_shift, occupied_projector)
+    n_occupied = jnp.sum(occupancy > 0)
+    diagonal = jnp.diag(F_dash)
+    radius = jnp.abs(F_dash).sum(axis=1) - jnp.abs(diagonal)
+    lower, upper = jnp.min(diagonal - radius), jnp.max(diagonal + radius)
+    D = (upper * jnp.eye(F.shape[0]) - F_dash) / (upper - lower)
+
+    def step(D, _):
+        D_squared = D @ D
+        D_next = jnp.where(jnp.trace(D) > n_occupied, D_squared, 2 * D - D_squared)
+        converged = jnp.abs(D_squared - D).max() < tolerance
+        return jnp.where(converged, D, D_next), None
+
+    D, _ = jax.lax.scan(step, D, length=iterations)
+    return jnp.max(occupancy) * X @ D @ X.T
+
+
+def homo_lumo_gap(orbital_energies: FloatB, occupancy: IntE) -> Float1:
+    """
+    Returns the gap between the lowest unoccupied and the highest occupied orbital.
+    """
+    occupied = occupancy > 0
+    homo = jnp.max(jnp.where(occupied, orbital_energies, -jnp.inf))
+    lumo = jnp.min(jnp.where(occupied, jnp.inf, orbital_energies))
+    return lumo - homo
+
+
 # NOTE: jax.scipy.eigh presently (=January 2025) only implements B = None case
 # from jax import scipy as jsp
 # def direct_generalized_eigenvalue_problem(
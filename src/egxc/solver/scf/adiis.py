@@ -0,0 +1,156 @@
+"""
+Energy-based convergence accelerators for the early SCF cycles, where DIIS is unstable.
+Both minimize a model energy over convex combinations of the previous density matrices:
+EDIIS:
+    K. N. Kudin, G. E. Scuseria, E. Cancès. "A black-box self-consistent field
+    convergence algorithm: One step closer." J. Chem. Phys. 116, 8255 (2002).
+    https://doi.org/10.1063/1.1470195
+ADIIS:
+    X. Hu, W. Yang. "Accelerating self-consistent field convergence with the augmented
+    Roothaan-Hall energy function." J. Chem. Phys. 132, 054109 (2010).
+    https://doi.org/10.1063/1.3304922
+Once the DIIS error is below a threshold, the DIIS extrapolation is used instead
+(cf. A. J. Garza, G. E. Scuseria. J. Chem. Phys. 137, 054110 (2012)).
+"""
+
+import jax
+import jax.numpy as jnp
+from flax.struct import dataclass
+
+from egxc.solver.scf.diis import DiisState
+from egxc.systems.base import FockTensors
+from egxc.utils.typing import (
+    BoolD,
+    FloatD,
+    FloatDxD,
+    FloatDxBxB,
+    FloatBxB,
+    Float2xBxB,
+)
+from typing import Callable, Tuple
+
+
+def project_onto_simplex(v: FloatD, valid: BoolD) -> FloatD:
+    """
+    Euclidean projection onto the probability simplex of the valid entries.
+    J. Duchi et al. "Efficient projections onto the l1-ball for learning in high
+    dimensions." ICML 2008.
+    """
+    # invalid entries lie below the threshold theta >= max(v) - 1 and are set to zero
+    v = jnp.where(valid, v, jnp.min(jnp.where(valid, v, jnp.inf)) - 1)
+    u = jnp.sort(v)[::-1]
+    cumsum = jnp.cumsum(u) - 1
+    index = jnp.arange(1, len(v) + 1)
+    rho = jnp.max(jnp.where(u - cumsum / index > 0, index, 1))
+    theta = cumsum[rho - 1] / rho
+    return jnp.maximum(v - theta, 0)
+
+
+def minimize_on_simplex(
+    linear: FloatD, quadratic: FloatDxD, valid: BoolD, init: FloatD, iterations: int
+) -> FloatD:
+    """
+    Minimizes c^T linear + 1/2 c^T quadratic c s.t. c >= 0, sum(c) = 1 by projected
+    gradient descent with a fixed number of iterations.
+    """
+    quadratic = (quadratic + quadratic.T) / 2
+    mask = valid[:, None] & valid[None, :]
+    quadratic = jnp.where(mask, quadratic, 0)
+    lipschitz = jnp.abs(jnp.linalg.eigvalsh(quadratic)).max() + 1e-12
+
+    def step(_, c):
+        return project_onto_simplex(c - (linear + quadratic @ c) / lipschitz, valid)
+
+    return jax.lax.fori_loop(0, iterations, step, init)
+
+
+@dataclass
+class AdiisState:
+    """
+    Circular buffer of the last D Fock and density matrices (and energies for EDIIS),
+    together with the DIIS state used after the switch. fock_density_overlap[i, j]
+    holds Tr[F_i P_j], of which only the row and column of the current slot are
+    recomputed in each cycle.
+    """
+
+    diis: DiisState
+    fock_trajectory: FloatDxBxB
+    density_trajectory: FloatDxBxB
+    fock_density_overlap: FloatDxD
+    energies: FloatD
+
+    @classmethod
+    def init(
+        cls,
+        subspace_size: int,
+        diis_init_fn: Callable[..., DiisState],
+        fock_matrix: FloatBxB | Float2xBxB,
+        density_matrix: FloatBxB | Float2xBxB,
+        fock_tensors: FockTensors,
+    ):
+        trajectory = jnp.zeros((subspace_size, *fock_matrix.shape))
+        return cls(
+            diis_init_fn(fock_matrix, density_matrix, fock_tensors),
+            trajectory,
+            trajectory,
+            jnp.zeros((subspace_size, subspace_size)),
+            jnp.zeros(subspace_size),
+        )
+
+
+def adiis_update(
+    diis_update_fn: Callable,
+    energy_based: bool,
+    switch_threshold: float,
+    iterations: int,
+    current_cycle: int,
+    raw_fock_matrix: FloatBxB | Float2xBxB,
+    state: AdiisState,
+    density_matrix: FloatBxB | Float2xBxB,
+    fock_tensors: FockTensors,
+    energy: float = 0.0,
+) -> Tuple[FloatBxB | Float2xBxB, AdiisState]:
+    """
+    EDIIS (energy_based) or ADIIS update of the Fock matrix, which switches to the DIIS
+    update once the DIIS error is below switch_threshold. Both branches are evaluated,
+    such that the update is traceable in jax.lax.scan.
+    """
+    with jax.named_scope('adiis_update'):
+        F_diis, diis_state = diis_update_fn(
+            current_cycle, raw_fock_matrix, state.diis, density_matrix, fock_tensors
+        )
+        D = state.energies.shape[0]
+        i = current_cycle % D  # slot of the oldest matrices
+        fock_trajectory = state.fock_trajectory.at[i].set(raw_fock_matrix)
+        density_trajectory = state.density_trajectory.at[i].set(density_matrix)
+        energies = state.energies.at[i].set(energy)
+        T = state.fock_density_overlap
+        T = T.at[i, :].set(
+            jnp.einsum('...kl,d...kl->d', raw_fock_matrix, density_trajectory)
+        )
+        T = T.at[:, i].set(
+            jnp.einsum('d...kl,...kl->d', fock_trajectory, density_matrix)
+        )
+        valid = jnp.arange(D) <= current_cycle
+
+        if energy_based:
+            # E(c) = sum_i c_i E_i - 1/4 sum_ij c_i c_j Tr[(F_i-F_j)(P_i-P_j)]
+            diag = jnp.diag(T)
+            linear = energies
+            quadratic = -0.5 * (diag[:, None] + diag[None, :] - T - T.T)
+        else:  # E(c) = Tr[(P(c)-P_i) F_i] + 1/2 Tr[(P(c)-P_i) (F(c)-F_i)]
+            linear = T[i] - T[i, i]
+            quadratic = T.T - T[i][:, None] - T[:, i][None, :] + T[i, i]
+        # the mixing coefficients are treated as constants in the backward pass
+        coeffs = minimize_on_simplex(
+            *jax.lax.stop_gradient((linear, quadratic)),
+            valid,
+            jax.nn.one_hot(i, D, dtype=linear.dtype),
+            iterations,
+        )
+        F_adiis = jnp.einsum('d,d...->...', coeffs, fock_trajectory)
+
+        error = jnp.abs(diis_state.res_trajectory[..., i, :, :]).max()
+        F_out = jnp.where(error < switch_threshold, F_diis, F_adiis)
+        state = AdiisState(diis_state, fock_trajectory, density_trajectory, T, energies)
+        return F_out, state
@@ -1,8 +1,9 @@
+import jax
 import jax.numpy as jnp
 from flax.struct import dataclass
 
 from egxc.systems.base import FockTensors
-from egxc.utils.typing import FloatBxB, FloatSCF, FloatSCFxSCF, FloatSCFxBxB
+from egxc.utils.typing import BoolD, FloatD, FloatDxD, FloatDxBxB, FloatBxB
 from typing import Tuple
 
 
@@ -21,38 +22,47 @@ def compute_residual(
     return res
 
 
-def solve_pulay_equation(overlap: FloatSCFxSCF, current_cycle: int) -> FloatSCF:
-    B = overlap
-    total_cycles = overlap.shape[0]
-    constraint_idx = current_cycle + 1
-    set_vec = -1 * (jnp.arange(total_cycles) < constraint_idx)
-    B = B.at[:, constraint_idx].set(set_vec)
-    B = B.at[constraint_idx, :].set(set_vec)
-    B = B.at[constraint_idx, constraint_idx].set(0)
-    rhs = jnp.zeros(total_cycles).at[constraint_idx].set(-1)
-    fock_coeffs = jnp.linalg.solve(B, rhs)  # (x0, ..., x_{n-1}, lambda, 0, ..., 0)
-    return fock_coeffs  # TODO: test fock_coeffs[current_cycle + 1:] == 0
+def solve_pulay_equation(overlap: FloatDxD, valid: BoolD) -> FloatD:
+    """
+    Solves the Pulay equation constrained to coefficients summing to one, where
+    unoccupied slots of the subspace are decoupled and get zero coefficients.
+    """
+    D = overlap.shape[0]
+    mask = valid[:, None] & valid[None, :]
+    B = jnp.where(mask, overlap, jnp.eye(D, dtype=overlap.dtype))
+    constraint = -valid.astype(overlap.dtype)
+    B = jnp.block([[B, constraint[:, None]], [constraint[None, :], jnp.zeros((1, 1))]])
+    rhs = jnp.zeros(D + 1).at[D].set(-1)
+    fock_coeffs = jnp.linalg.solve(B, rhs)  # (x_0, ..., x_{D-1}, lambda)
+    return fock_coeffs[:D]
 
 
 @dataclass
 class DiisState:
-    overlap: FloatBxB  # do not confuse with the basis set overlap matrix
-    fock_trajectory: FloatSCFxBxB
-    res_trajectory: FloatSCFxBxB
+    """
+    Fixed-size DIIS subspace stored as a circular buffer, such that the memory is
+    independent of the number of SCF cycles. Cycle i writes to slot i % D, evicting
+    the oldest vector, and only the row and column of that slot of the error overlap
+    (Pulay) matrix are recomputed.
+    """
+
+    overlap: FloatDxD  # do not confuse with the basis set overlap matrix
+    fock_trajectory: FloatDxBxB
+    res_trajectory: FloatDxBxB
 
     @classmethod
     def init(
         cls,
-        total_cycles: int,
+        subspace_size: int,
         fock_matrix: FloatBxB,
         density_matrix: FloatBxB,
         fock_tensors: FockTensors,
     ):
         N_bas = fock_matrix.shape[0]
-        overlap = jnp.eye(total_cycles + 1)
-        fock_trajectory = jnp.zeros((total_cycles, N_bas, N_bas)).at[0].set(fock_matrix)
+        overlap = jnp.eye(subspace_size)
+        fock_trajectory = jnp.zeros((subspace_size, N_bas, N_bas)).at[0].set(fock_matrix)
         residual = compute_residual(fock_matrix, density_matrix, fock_tensors)
-        res_trajectory = jnp.zeros((total_cycles, N_bas, N_bas)).at[0].set(residual)
+        res_trajectory = jnp.zeros((subspace_size, N_bas, N_bas)).at[0].set(residual)
         return cls(overlap, fock_trajectory, res_trajectory)
 
 
@@ -81,16 +91,19 @@ def diis_update(
     https://github.com/psi4/psi4numpy/blob/master/Tutorials/03_Hartree-Fock/3b_rhf-diis.ipynb
     but adapted to be jax compile friendly.
     """
-    residual = compute_residual(raw_fock_matrix, density_matrix, fock_tensors)
-    i = current_cycle
-    res_trajectory = state.res_trajectory.at[i].set(residual)
-    new_overlap = jnp.einsum('ikl,kl->i', res_trajectory, residual)
-    overlap = state.overlap.at[i,:-1].set(new_overlap)
-    overlap = overlap.at[:-1, i].set(new_overlap)
-    fock_coeffs = solve_pulay_equation(overlap, i)
-    fock_trajectory = state.fock_trajectory.at[i].set(raw_fock_matrix)
-    F_out = jnp.einsum('i,ijk->jk', fock_coeffs[:-1], fock_trajectory)
-    F_out = jnp.where(
-        jnp.isnan(F_out).any(), raw_fock_matrix, F_out
-    )  # this is necessary, since B becomes singular once it converges converged
-    return F_out, DiisState(overlap, fock_trajectory, res_trajectory)
+    with jax.named_scope('diis_update'):
+        residual = compute_residual(raw_fock_matrix, density_matrix, fock_tensors)
+        D = state.overlap.shape[0]
+        i = current_cycle % D  # slot of the oldest vector
+        res_trajectory = state.res_trajectory.at[i].set(residual)
+        new_overlap = jnp.einsum('ikl,kl->i', res_trajectory, residual)
+        overlap = state.overlap.at[i, :].set(new_overlap)
+        overlap = overlap.at[:, i].set(new_overlap)
+        valid = jnp.arange(D) <= current_cycle
+        fock_coeffs = solve_pulay_equation(overlap, valid)
+        fock_trajectory = state.fock_trajectory.at[i].set(raw_fock_matrix)
+        F_out = jnp.einsum('i,ijk->jk', fock_coeffs, fock_trajectory)
+        F_out = jnp.where(
+            jnp.isnan(F_out).any(), raw_fock_matrix, F_out
+        )  # this is necessary, since B becomes singular once it converges converged
+        return F_out, DiisState(overlap, fock_trajectory, res_trajectory)
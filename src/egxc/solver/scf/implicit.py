@@ -0,0 +1,56 @@
+"""
+Implicit differentiation of the SCF fixed point F* = G(F*, theta), where G maps a Fock
+matrix to the Fock matrix of its aufbau density matrix. Instead of backpropagating
+through all SCF cycles, the adjoint (coupled-perturbed Kohn-Sham) equation
+    w = F_bar + (dG/dF)^T w
+is solved iteratively at the fixed point, such that the memory of the backward pass is
+independent of the number of cycles.
+M. Blondel et al. "Efficient and Modular Implicit Differentiation." NeurIPS 2022.
+https://arxiv.org/abs/2105.15183
+"""
+
+import jax
+import jax.numpy as jnp
+
+from egxc.systems.base import System
+from egxc.utils.typing import FloatBxB, Float2xBxB
+from typing import Any, Callable
+
+ScfMap = Callable[[Any, FloatBxB | Float2xBxB, System], FloatBxB | Float2xBxB]
+
+
+def implicit_fixed_point(
+    scf_map: ScfMap,
+    variables: Any,
+    fock_matrix: FloatBxB | Float2xBxB,
+    sys: System,
+    max_iterations: int,
+    tolerance: float,
+) -> FloatBxB | Float2xBxB:
+    """
+    Identity in the forward pass, while the backward pass treats `fock_matrix` as the
+    fixed point of `scf_map(variables, ., sys)`. The variables and the system tensors
+    receive the implicit gradient, the incoming Fock matrix none.
+    """
+
+    @jax.custom_vjp
+    def fixed_point(variables, F, sys):
+        return F
+
+    def forward(variables, F, sys):
+        return F, (variables, F, sys)
+
+    def backward(residuals, F_bar):
+        _, vjp_fn = jax.vjp(scf_map, *residuals)
+
+        def matvec(w):
+            return w - vjp_fn(w)[1]
+
+        w, _ = jax.scipy.sparse.linalg.gmres(
+            matvec, F_bar, x0=F_bar, tol=tolerance, maxiter=max_iterations
+        )
+        variables_bar, _, sys_bar = vjp_fn(w)
+        return variables_bar, jnp.zeros_like(F_bar), sys_bar
+
+    fixed_point.defvjp(forward, backward)
+    return fixed_point(variables, fock_matrix, sys)
@@ -1,15 +1,27 @@
 import jax
 import jax.numpy as jnp
 from functools import partial
+from jax.ad_checkpoint import checkpoint_name
 
 from egxc.xc_energy.functionals.base import XCModule
 from egxc.solver import fock
 from egxc.solver.scf.diis import DiisState, diis_update
+from egxc.solver.scf.adiis import AdiisState, adiis_update
+from egxc.solver.scf.implicit import implicit_fixed_point
+from egxc.solver.scf.schedule import (
+    ScfSchedule,
+    ScheduleState,
+    commutator_error,
+    occupied_projector,
+)
 from egxc.solver import linalg
 from egxc.solver.base import Solver
 
 from egxc.systems.base import System
 from egxc.utils.typing import (
+    Float1,
+    Int1,
+    FloatAx3,
     FloatBxB,
     Float2xBxB,
     FloatSCF,
@@ -20,13 +32,25 @@ from egxc.utils.typing import (
 
 from typing import Tuple, Literal
 
-ConvAccState = DiisState | Tuple[FloatBxB | Float2xBxB, int] | None
+ConvAccState = DiisState | AdiisState | Tuple[FloatBxB | Float2xBxB, int] | None
+
+# residuals saved by jax.checkpoint, the rest is recomputed in the backward pass
+CHECKPOINT_POLICIES = {
+    'nothing': jax.checkpoint_policies.nothing_saveable,
+    'fock_and_density': jax.checkpoint_policies.save_only_these_names(
+        'fock_matrix', 'density_matrix'
+    ),
+    'fock_build': jax.checkpoint_policies.save_only_these_names(
+        'fock_matrix', 'density_matrix', 'coulomb_matrix', 'xc_potential'
+    ),
+}
 
+# the system is a loop invariant, such that the backward pass does not save it per cycle
 ScfCycleCarry = Tuple[
     FloatBxB | Float2xBxB,
     FloatBxB | Float2xBxB,
-    System,
     ConvAccState,
+    ScheduleState | None,
 ]
 
 
@@ -35,20 +59,57 @@ class SelfConsistentFieldSolver(Solver):
     cycles: int
     ert_type: ElectRepTensorType
     spin_restricted: bool = True
-    convergence_acceleration_method: Literal["Vanilla", "Momentum", "DIIS"] = "DIIS"
+    convergence_acceleration_method: Literal[
+        "Vanilla", "Momentum", "DIIS", "EDIIS", "ADIIS"
+    ] = "DIIS"
+    diis_subspace_size: int = 8
+    # density matrices by diagonalization or by purification of the Fock matrix
+    density_matrix_solver: Literal["eigh", "purification"] = "eigh"
+    purification_iterations: int = 50
+    # EDIIS and ADIIS switch to DIIS once the DIIS error is below this threshold
+    diis_switch_threshold: float = 1e-1
+    adiis_iterations: int = 100
+    # damping F <- (1 - d) F + d F_previous, adapted by damping_step from the energies
+    damping: float = 0.0
+    damping_step: float = 0.0
+    max_damping: float = 0.8
+    # virtual orbitals are shifted up by at least level_shift and up to target_gap
+    level_shift: float = 0.0
+    target_gap: float = 0.0
+    # the level shift is switched off below this commutator error, e.g., 1e-3 for DIIS
+    level_shift_threshold: float = 0.0
+    # gradients only flow through the last `backprop_cycles` cycles (all if None)
+    backprop_cycles: int | None = None
+    # differentiate the final density matrix implicitly at the SCF fixed point
+    implicit_differentiation: bool = False
+    adjoint_max_iterations: int = 20
+    adjoint_tolerance: float = 1e-8
+    # rematerialize the cycles in the backward pass, one checkpoint per k cycles
+    checkpoint_policy: Literal['nothing', 'fock_and_density', 'fock_build'] | None = None
+    checkpoint_every: int = 1
 
     def setup(self) -> None:
         self.FockModule = fock.FockMatrix(
             self.XCModule, self.ert_type, self.spin_restricted
         )  # type: ignore
         # set up specified convergence acceleration method to dampen oscillations of the fock matrix
-        if self.convergence_acceleration_method == "DIIS":
-            init_fn = partial(DiisState.init, self.cycles)
+        if self.convergence_acceleration_method in ("DIIS", "EDIIS", "ADIIS"):
+            init_fn = partial(DiisState.init, self.diis_subspace_size)
             if not self.spin_restricted:  # vmap over spin
-                self.convergence_acc_fn = jax.vmap(diis_update, in_axes=(None, 0, 0, 0, None))
+                update_fn = jax.vmap(diis_update, in_axes=(None, 0, 0, 0, None))
                 init_fn = jax.vmap(init_fn, in_axes=(0, 0, None))
             else:
-                self.convergence_acc_fn = diis_update
+                update_fn = diis_update
+            if self.convergence_acceleration_method != "DIIS":  # joint over spin
+                init_fn = partial(AdiisState.init, self.diis_subspace_size, init_fn)
+                update_fn = partial(
+                    adiis_update,
+                    update_fn,
+                    self.convergence_acceleration_method == "EDIIS",
+                    self.diis_switch_threshold,
+                    self.adiis_iterations,
+                )
+            self.convergence_acc_fn = update_fn
             self.init_convergence_acc_state = init_fn
         elif self.convergence_acceleration_method == "Momentum":
             self.init_convergence_acc_state = lambda F, *args: (F, 0)
@@ -67,13 +128,54 @@ class SelfConsistentFieldSolver(Solver):
                 f"Invalid convergence acceleration method: {self.convergence_acceleration_method}"
             )
 
-        def new_density_matrix(F, X, occupancies):
-            _, C = linalg.modified_generalized_eigenvalue_problem(F, X)
-            return linalg.coeff_to_density_matrix(C, occupancies)
+        schedule = ScfSchedule(
+            self.damping,
+            self.damping_step,
+            self.max_damping,
+            self.level_shift,
+            self.target_gap,
+            self.level_shift_threshold,
+        )
+        self.schedule = schedule if schedule.active else None
+        if self.density_matrix_solver == "purification" and self.target_gap > 0:
+            raise ValueError("The HOMO-LUMO gap is not available with purification")
+
+        def new_density_matrix_and_gap(F, X, occupancies, level_shift=0.0, projector=None):
+            if self.density_matrix_solver == "purification":
+                P = linalg.purified_density_matrix(
+                    F, X, occupancies, self.purification_iterations, level_shift, projector
+                )
+                return P, jnp.asarray(jnp.inf)
+            e, C = linalg.modified_generalized_eigenvalue_problem(
+                F, X, level_shift=level_shift, occupied_projector=projector
+            )
+            gap = linalg.homo_lumo_gap(e, occupancies) - level_shift
+            return linalg.coeff_to_density_matrix(C, occupancies), gap
 
         if not self.spin_restricted:  # vmap over spin
-            new_density_matrix = jax.vmap(new_density_matrix, in_axes=(0, None, 0))
-        self.new_density_matrix = new_density_matrix
+            new_density_matrix_and_gap = jax.vmap(
+                new_density_matrix_and_gap, in_axes=(0, None, 0, None, 0)
+            )
+        self.new_density_matrix_and_gap = new_density_matrix_and_gap
+        self.new_density_matrix = lambda F, X, occupancies: new_density_matrix_and_gap(
+            F, X, occupancies, 0.0, None
+        )[0]
+
+    @property
+    def __requires_energy(self) -> bool:
+        if self.convergence_acceleration_method == "EDIIS":
+            return True
+        return self.schedule is not None and self.schedule.requires_energy
+
+    @property
+    def differentiable_cycles(self) -> int:
+        if self.backprop_cycles is None:
+            return 1 if self.implicit_differentiation else self.cycles
+        assert 0 <= self.backprop_cycles <= self.cycles, 'Invalid number of backprop cycles'
+        assert self.backprop_cycles > 0 or not self.implicit_differentiation, (
+            'Implicit differentiation requires at least one backprop cycle'
+        )
+        return self.backprop_cycles
 
     def __call__(  # TODO: think about whether nuc gradient should stop here?
         self,
@@ -90,6 +192,69 @@ class SelfConsistentFieldSolver(Solver):
         )
         return energies, density_matrices
 
+    def converge(
+        self,
+        initial_density_matrix: FloatBxB | Float2xBxB,
+        sys: System,
+        tolerance: float = 1e-6,
+    ) -> Tuple[Tuple[FloatSCF, FloatSCF], FloatSCFxBxB | FloatSCFx2xBxB, Int1]:
+        """
+        Forward-only SCF, e.g. for evaluation, which stops as soon as the commutator
+        error of a cycle is below `tolerance`, but after at most `cycles` cycles. The
+        trajectory of the remaining cycles is filled with the last cycle, i.e., it is
+        the (stationary) trajectory of the converged SCF, such that the outputs match
+        the ones of `__call__` and the trajectory losses can be evaluated as is.
+        Returns:
+            Energies, density matrices and the number of cycles run
+        """
+        P_0 = initial_density_matrix
+        F_0 = self.FockModule.fock_matrix(sys._nuc_pos, P_0, sys)
+        acc_state = self.init_convergence_acc_state(F_0, P_0, sys.fock_tensors)
+        schedule_state = None if self.schedule is None else self.schedule.init()
+        e_hj = e_xc = jnp.zeros(self.cycles, dtype=P_0.dtype)
+        density_matrices = jnp.zeros((self.cycles, *P_0.shape), dtype=P_0.dtype)
+
+        def cond(loop_state):
+            cycle, *_, error = loop_state
+            return (cycle < self.cycles) & (error > tolerance)
+
+        def body(loop_state):
+            cycle, state, (e_hj, e_xc), density_matrices, _ = loop_state
+            state, (P, energies, error) = self.__cycle(sys, state, cycle, True)
+            return (
+                cycle + 1,
+                state,
+                (e_hj.at[cycle].set(energies[0]), e_xc.at[cycle].set(energies[1])),
+                density_matrices.at[cycle].set(P),
+                error,
+            )
+
+        loop_state = (
+            jnp.asarray(0),
+            (F_0, P_0, acc_state, schedule_state),
+            (e_hj, e_xc),
+            density_matrices,
+            jnp.asarray(jnp.inf, dtype=P_0.dtype),
+        )
+        loop_state = jax.lax.while_loop(cond, body, loop_state)
+        cycles, _, energies, density_matrices, _ = loop_state
+        converged = jnp.arange(self.cycles) >= cycles
+        energies, density_matrices = jax.tree.map(
+            lambda x: jnp.where(
+                converged.reshape(-1, *(1,) * (x.ndim - 1)), x[cycles - 1], x
+            ),
+            (energies, density_matrices),
+        )
+        return energies, density_matrices, cycles
+
+    def energy_and_fock_matrix(
+        self,
+        nuc_pos: FloatAx3,
+        density_matrix: FloatBxB | Float2xBxB,
+        sys: System,
+    ) -> Tuple[Tuple[Float1, Float1], FloatBxB | Float2xBxB]:
+        return self.FockModule.energy_and_fock_matrix(nuc_pos, density_matrix, sys)
+
     def scf_loop(
         self, F_0, P_0, sys
     ) -> Tuple[Tuple[FloatSCF, FloatSCF], FloatSCFxBxB | FloatSCFx2xBxB]:
@@ -105,26 +270,142 @@ class SelfConsistentFieldSolver(Solver):
             Density matrices: Array of density matrices for each cycle (total_cycles, N_bas, N_bas)
         """
 
-        def loop_body(
-            carry: ScfCycleCarry, cycle: int
-        ) -> Tuple[ScfCycleCarry, FloatBxB | Float2xBxB]:
-            F, P, sys, acc_state = carry
-            P = self.new_density_matrix(F, sys.fock_tensors.diagonal_overlap, sys.fock_tensors.occupancies)
-            F = self.FockModule.fock_matrix(sys._nuc_pos, P, sys)
-            F, acc_state = self.convergence_acc_fn(cycle, F, acc_state, P, sys.fock_tensors)  # type: ignore
-            return (F, P, sys, acc_state), P
+        def scan(sys, state, first_cycle, last_cycle):
+            body = partial(self.__cycle, sys)
+            if self.checkpoint_policy is None:
+                return jax.lax.scan(
+                    body, state, xs=jnp.arange(first_cycle, last_cycle)  # type: ignore
+                )
+            policy = CHECKPOINT_POLICIES[self.checkpoint_policy]
+            k = self.checkpoint_every
+            last_block_cycle = last_cycle - (last_cycle - first_cycle) % k
+            # nested checkpoints: carries are saved every k cycles, and the cycles of a
+            # block are rematerialized one at a time
+            body = jax.checkpoint(body, policy=policy)
+            block_body = jax.checkpoint(partial(jax.lax.scan, body), policy=policy)
+            state, block_density_matrices = jax.lax.scan(
+                block_body, state, xs=jnp.arange(first_cycle, last_block_cycle).reshape(-1, k)
+            )
+            state, tail_density_matrices = jax.lax.scan(
+                body,
+                state,
+                xs=jnp.arange(last_block_cycle, last_cycle),  # type: ignore
+            )
+            density_matrices = jnp.concatenate(
+                [
+                    block_density_matrices.reshape(-1, *tail_density_matrices.shape[1:]),
+                    tail_density_matrices,
+                ]
+            )
+            return state, density_matrices
 
         acc_state = self.init_convergence_acc_state(F_0, P_0, sys.fock_tensors)
-        init_state = (F_0, P_0, sys, acc_state)
+        schedule_state = None if self.schedule is None else self.schedule.init()
+        state = (F_0, P_0, acc_state, schedule_state)
+        # first cycle through which the gradient is backpropagated
+        differentiable_from = self.cycles - self.differentiable_cycles
+        trajectory = []
+        if differentiable_from > 0:  # no residuals are stored for truncated cycles
+            state, density_matrices = scan(
+                *jax.lax.stop_gradient((sys, state)), 0, differentiable_from
+            )
+            state = jax.lax.stop_gradient(state)
+            trajectory.append(jax.lax.stop_gradient(density_matrices))
 
-        _, density_matrices = jax.lax.scan(
-            loop_body, init_state, xs=jnp.arange(self.cycles)  # type: ignore
-        )
+        if self.implicit_differentiation:
+            # backpropagate through the trajectory up to the last cycle, whose density
+            # matrix is differentiated implicitly via the preceding Fock matrix
+            state, density_matrices = scan(
+                sys, state, differentiable_from, self.cycles - 1
+            )
+            solver, variables = self.unbind()
+            F = implicit_fixed_point(
+                partial(solver.apply, method=SelfConsistentFieldSolver.__scf_map),
+                variables,
+                jax.lax.stop_gradient(state[0]),
+                sys,
+                self.adjoint_max_iterations,
+                self.adjoint_tolerance,
+            )
+            P = self.new_density_matrix(
+                F, sys.fock_tensors.diagonal_overlap, sys.fock_tensors.occupancies
+            )
+            trajectory += [density_matrices, P[None]]
+        else:
+            _, density_matrices = scan(sys, state, differentiable_from, self.cycles)
+            trajectory.append(density_matrices)
+        density_matrices = jnp.concatenate(trajectory)
         energies = self.__calc_energies_along_scf_trajectory(
             sys._nuc_pos, density_matrices, sys
         )
         return energies, density_matrices
 
+    def __cycle(
+        self, sys: System, carry: ScfCycleCarry, cycle: int, forward_only: bool = False
+    ) -> Tuple[ScfCycleCarry, FloatBxB | Float2xBxB]:
+        """
+        A single SCF cycle, which returns its density matrix, and in the forward-only mode
+        also its energies and the commutator error of its Fock matrix (see `converge`).
+        """
+        F_in, P, acc_state, schedule_state = carry
+        if schedule_state is None:
+            shift_args = (0.0, None)
+        else:  # level shift relative to the occupied space of the previous cycle
+            projector = occupied_projector(P, sys.fock_tensors.overlap)
+            shift_args = (schedule_state.level_shift, projector)
+        with jax.named_scope('density_matrix'):
+            P, gap = self.new_density_matrix_and_gap(
+                F_in,
+                sys.fock_tensors.diagonal_overlap,
+                sys.fock_tensors.occupancies,
+                *shift_args,
+            )
+        P = checkpoint_name(P, 'density_matrix')
+        acc_args = (P, sys.fock_tensors)
+        energy = None
+        if self.__requires_energy or forward_only:
+            (e_hj, e_xc), F = self.FockModule.energy_and_fock_matrix(
+                sys._nuc_pos, P, sys
+            )
+            energy = e_hj + e_xc
+        else:
+            F = self.FockModule.fock_matrix(sys._nuc_pos, P, sys)
+        F = checkpoint_name(F, 'fock_matrix')
+        out = P
+        if forward_only:
+            out = (P, (e_hj, e_xc), commutator_error(F, P, sys.fock_tensors))
+        if self.convergence_acceleration_method == "EDIIS":
+            acc_args += (energy,)
+        if schedule_state is not None:
+            # the schedule does not change the fixed point and receives no gradient
+            schedule_state = self.schedule.update(
+                schedule_state,
+                *jax.lax.stop_gradient((
+                    commutator_error(F, P, sys.fock_tensors),
+                    jnp.min(gap),
+                    energy if self.schedule.requires_energy else None,
+                )),
+            )
+        F, acc_state = self.convergence_acc_fn(cycle, F, acc_state, *acc_args)  # type: ignore
+        if schedule_state is not None:
+            d = schedule_state.damping
+            F = (1 - d) * F + d * F_in
+        return (F, P, acc_state, schedule_state), out
+
+    def __scf_map(self, F, sys):
+        """Fock matrix of the aufbau density matrix of F, whose fixed point is the SCF."""
+        P = self.new_density_matrix(
+            F, sys.fock_tensors.diagonal_overlap, sys.fock_tensors.occupancies
+        )
+        return self.FockModule.fock_matrix(sys._nuc_pos, P, sys)
+
     def __calc_energies_along_scf_trajectory(self, nuc_pos, density_matrices, sys):
-        energy_fn = jax.vmap(self.FockModule.energy, in_axes=(None, 0, None))
-        return energy_fn(nuc_pos, density_matrices, sys)
+        if self.checkpoint_policy is None:
+            energy_fn = jax.vmap(self.FockModule.energy, in_axes=(None, 0, None))
+            return energy_fn(nuc_pos, density_matrices, sys)
+        # one cycle at a time, rematerializing the grid intermediates in the backward pass
+        energy_fn = jax.checkpoint(
+            partial(self.FockModule.energy, nuc_pos, sys=sys),
+            policy=CHECKPOINT_POLICIES[self.checkpoint_policy],
+        )
+        return jax.lax.map(energy_fn, density_matrices)
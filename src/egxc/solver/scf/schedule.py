@@ -0,0 +1,110 @@
+"""
+Damping and level shifting schedule of the SCF, which stabilizes difficult systems
+(small HOMO-LUMO gaps, stretched bonds, open shells) without changing the fixed point:
+Damping:
+    F <- (1 - d) F + d F_previous, where d grows by a step whenever the energy or the
+    commutator error rises and decays geometrically otherwise, such that oscillations
+    are damped increasingly.
+    E. Cancès, C. Le Bris. "Can we outperform the DIIS approach for electronic
+    structure calculations?" Int. J. Quantum Chem. 79, 82 (2000).
+Level shifting:
+    The virtual orbitals are shifted up by b >= level_shift, such that the HOMO-LUMO gap
+    is at least target_gap (see linalg.modified_generalized_eigenvalue_problem). It is
+    switched off below a commutator error threshold, where it only slows down the
+    convergence of DIIS.
+    V. R. Saunders, I. H. Hillier. Int. J. Quantum Chem. 7, 699 (1973).
+    https://doi.org/10.1002/qua.560070407
+All decisions are made with jnp.where, such that the schedule is traceable in
+jax.lax.scan.
+"""
+
+import jax
+import jax.numpy as jnp
+from dataclasses import dataclass as static_dataclass
+from flax.struct import dataclass
+
+from egxc.solver.scf.diis import compute_residual
+from egxc.systems.base import FockTensors
+from egxc.utils.typing import Float1, FloatBxB, Float2xBxB
+
+
+@dataclass
+class ScheduleState:
+    damping: Float1
+    level_shift: Float1
+    # of the previous cycle
+    energy: Float1
+    error: Float1
+
+
+@static_dataclass(frozen=True)
+class ScfSchedule:
+    damping: float = 0.0
+    # adaptive damping if > 0, otherwise the damping is constant
+    damping_step: float = 0.0
+    max_damping: float = 0.8
+    level_shift: float = 0.0
+    target_gap: float = 0.0
+    # the level shift is switched off below this commutator error
+    level_shift_threshold: float = 0.0
+
+    @property
+    def active(self) -> bool:
+        return any((self.damping, self.damping_step, self.level_shift, self.target_gap))
+
+    @property
+    def requires_energy(self) -> bool:
+        return self.damping_step > 0
+
+    def init(self) -> ScheduleState:
+        return ScheduleState(
+            jnp.asarray(self.damping),
+            jnp.asarray(self.level_shift),
+            jnp.asarray(jnp.inf),
+            jnp.asarray(jnp.inf),
+        )
+
+    def update(
+        self,
+        state: ScheduleState,
+        error: Float1,
+        gap: Float1,
+        energy: Float1 | None = None,
+    ) -> ScheduleState:
+        """
+        Schedule for the current cycle from its commutator error, the HOMO-LUMO gap of
+        the unshifted orbital energies and its energy (for adaptive damping).
+        """
+        damping, level_shift = state.damping, state.level_shift
+        if energy is None:
+            energy = state.energy
+        else:
+            unstable = (energy > state.energy) | (error > state.error)
+            damping = jnp.where(
+                unstable,
+                jnp.minimum(damping + self.damping_step, self.max_damping),
+                damping * (1 - self.damping_step),
+            )
+        level_shift = jnp.maximum(self.level_shift, self.target_gap - gap)
+        level_shift = jnp.where(error < self.level_shift_threshold, 0.0, level_shift)
+        return ScheduleState(damping, level_shift, energy, error)
+
+
+def commutator_error(
+    fock_matrix: FloatBxB | Float2xBxB,
+    density_matrix: FloatBxB | Float2xBxB,
+    fock_tensors: FockTensors,
+) -> Float1:
+    """Maximum absolute entry of the orthogonalized commutator FPS - SPF."""
+    residual_fn = compute_residual
+    if fock_matrix.ndim == 3:  # vmap over spin
+        residual_fn = jax.vmap(compute_residual, in_axes=(0, 0, None))
+    return jnp.abs(residual_fn(fock_matrix, density_matrix, fock_tensors)).max()
+
+
+def occupied_projector(
+    density_matrix: FloatBxB | Float2xBxB, overlap: FloatBxB
+) -> FloatBxB | Float2xBxB:
+    """S P S / max_occupancy, the projector onto the occupied space in the AO basis."""
+    max_occupancy = 2 if density_matrix.ndim == 2 else 1
+    return jnp.einsum('ab,...bc,cd->...ad', overlap, density_matrix, overlap) / max_occupancy
@@ -1,2 +1,9 @@
-from .base import System, nuclear_energy, nuclear_energy_and_force, Grid
+from .base import (
+    System,
+    SystemFn,
+    nuclear_energy,
+    nuclear_energy_and_force,
+    Grid,
+    FockTensors,
+)
 from .preload import PreloadSystem
\ No newline at end of file
@@ -33,7 +33,7 @@ from egxc.utils.typing import (
     FloatBxBxBxB,
 )
 
-from typing import List, Tuple
+from typing import Callable, List, Tuple
 
 
 @dataclass
@@ -113,6 +113,7 @@ class System:
         psys: PreloadSystem,
         fock_tensors: FockTensors | None = None,
         grid: Grid | None = None,
+        orthogonalizer: str = 'canonical',
     ):
         if fock_tensors is None:
             assert psys.fock_tensors is not None, 'Fock tensors must be provided'
@@ -124,7 +125,9 @@ class System:
                     psys.fock_tensors.electron_repulsion_tensor
                 ),
                 diagonal_overlap=transformation_matrix(
-                    jnp.asarray(psys.fock_tensors.overlap)
+                    jnp.asarray(psys.fock_tensors.overlap),
+                    jnp.asarray(psys.fock_tensors.basis_mask),
+                    orthogonalizer,
                 ),
                 occupancies=jnp.asarray(psys.fock_tensors.occupancies),
             )
@@ -164,6 +167,10 @@ class System:
         return mol
 
 
+# builds the System of a preloaded system at the given nuclear positions
+SystemFn = Callable[[FloatAx3, PreloadSystem], System]
+
+
 def nuclear_energy(nuc_pos: FloatAx3, sys: System) -> Float1:
     """
     Nuclear electrostatic interaction energy.
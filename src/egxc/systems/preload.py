@@ -3,6 +3,7 @@ from pyscf import gto, df, dft
 from pyscf.dft import gen_grid
 import numpy as onp
 import einops
+from jax import tree_util
 from scipy import linalg
 
 from egxc.utils.constants import ANGSTROM_TO_BOHR
@@ -78,6 +79,9 @@ def compute_electron_repulsion_tensor(
                 aux_mask is not None
             ), 'aux_mask must be provided'  # TODO: do we actually need this
             ert = onp.einsum('qij,q,i,j-> qij', ert, aux_mask, mask, mask)
+    else:
+        # DENSITY_FITTED_DIRECT is only available with the jax based fock tensors
+        raise ValueError(f'Invalid ert_type for pyscf preloading: {ert_type}')
     return ert
 
 
@@ -105,6 +109,19 @@ class PreloadFockTensors:
         )
 
 
+tree_util.register_dataclass(
+    PreloadFockTensors,
+    data_fields=[
+        'basis_mask',
+        'overlap',
+        'core_hamiltonian',
+        'electron_repulsion_tensor',
+        'occupancies',
+    ],
+    meta_fields=[],
+)
+
+
 def preload_fock_tensors_using_pyscf(
     mol: gto.Mole,
     spin: int,
@@ -127,9 +144,8 @@ def preload_fock_tensors_using_pyscf(
         overlap = onp.pad(overlap, ((0, b_pad), (0, b_pad)))
         overlap[~basis_mask, ~basis_mask] = 1.0
 
+        # padded basis functions are removed by the orthogonalizer (see solver.linalg)
         core_hamiltonian = onp.pad(core_hamiltonian, ((0, b_pad), (0, b_pad)))
-        # pad diagonal with large non-equal values to avoid issues in the generalized eigenvalue problem of the Fock matrix
-        core_hamiltonian[~basis_mask, ~basis_mask] = onp.arange(10_000, 10_000 + 1000 * b_pad, 1000)
 
         if ert.ndim == 4:
             ert = onp.pad(ert, ((0, b_pad), (0, b_pad), (0, b_pad), (0, b_pad)))
@@ -177,6 +193,11 @@ class PreloadGrid:
         return cls(coords, weights, aos, grad_aos)
 
 
+tree_util.register_dataclass(
+    PreloadGrid, data_fields=['coords', 'weights', 'aos', 'grad_aos'], meta_fields=[]
+)
+
+
 def preload_grid_using_pyscf(
     mol: gto.Mole, grids: gen_grid.Grids, grid_level: int, alignment: Alignment
 ) -> PreloadGrid:
@@ -213,8 +234,24 @@ class PreloadSystem:
     def max_number_of_basis_fns(self) -> CompileStaticInt:  # type: ignore
         if self.fock_tensors is not None:
             return len(self.fock_tensors.basis_mask)
-        elif self.grid is not None:
-            return self.occupancies.shape[-1]  # type: ignore
+        elif self.occupancies is not None:
+            return self.occupancies.shape[-1]
+
+
+# Arrays are leaves while the compile static fields are part of the tree definition, such
+# that a PreloadSystem can be passed to (and donated to) jitted functions directly.
+tree_util.register_dataclass(
+    PreloadSystem,
+    data_fields=[
+        'nuc_pos',
+        'atom_mask',
+        'fock_tensors',
+        'grid',
+        'initial_density_matrix',
+        'occupancies',
+    ],
+    meta_fields=['atom_z', 'basis', 'periods', 'grid_alignment'],
+)
 
 
 def preload_system_using_pyscf(
@@ -1 +1 @@
-from .run import run
\ No newline at end of file
+from .run import run, warm_cache
@@ -0,0 +1,108 @@
+"""
+Checkpoints of the training state, written after an epoch, such that an interrupted
+run, e.g., on a preemptible node, resumes from its last completed epoch:
+    epoch_000042.0.msgpack: the state of the main process (params, optimizer state with
+        the EMA, early stopping) and its data iterator positions,
+    epoch_000042.<i>.msgpack: the data iterator positions of process i > 0,
+as the processes iterate over different shards of the data. The state is copied to
+the host by `save`, while the serialization and the write happen on a background
+thread. Files are written to a temporary file first and renamed, such that a crash
+during a write never leaves a truncated checkpoint behind.
+"""
+
+import os
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import jax
+from flax import serialization
+
+from typing import Any, Dict, List, Tuple
+
+DataState = Dict[str, bytes]  # grain iterator state per dataloader
+
+
+class CheckpointManager:
+    def __init__(self, directory: str, keep: int = 3) -> None:
+        """
+        Args:
+            directory: directory of the checkpoints of a single run
+            keep: number of most recent checkpoints to keep
+        """
+        assert keep >= 1, 'At least one checkpoint has to be kept'
+        self.directory = directory
+        self.keep = keep
+        self.process = jax.process_index()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._future: Future | None = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, epoch: int, process: int) -> str:
+        return os.path.join(self.directory, f'epoch_{epoch:06d}.{process}.msgpack')
+
+    def _epochs(self, process: int) -> List[int]:
+        pattern = re.compile(rf'epoch_(\d+)\.{process}\.msgpack')
+        matches = (pattern.fullmatch(f) for f in os.listdir(self.directory))
+        return sorted(int(m.group(1)) for m in matches if m is not None)
+
+    def latest_epoch(self) -> int | None:
+        """Latest epoch, which is complete on this and the main process."""
+        epochs = set(self._epochs(0)) & set(self._epochs(self.process))
+        return max(epochs, default=None)
+
+    def save(self, epoch: int, state: Dict[str, Any], data_state: DataState) -> None:
+        """
+        Copies the state to the host and writes it in the background. Waits for the
+        previous write, such that at most one copy of the state is pending.
+        """
+        self.wait()
+        payload: Dict[str, Any] = {'data': data_state}
+        if self.process == 0:
+            payload['state'] = serialization.to_state_dict(jax.device_get(state))
+        self._future = self._executor.submit(self._write, epoch, payload)
+
+    def _write(self, epoch: int, payload: Dict[str, Any]) -> None:
+        path = self._path(epoch, self.process)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(serialization.msgpack_serialize(payload))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        for old_epoch in self._epochs(self.process)[: -self.keep]:
+            os.remove(self._path(old_epoch, self.process))
+
+    def wait(self) -> None:
+        """Waits for the pending write and raises its exception, if any."""
+        if self._future is not None:
+            self._future.result()
+            self._future = None
+
+    def _read(self, epoch: int, process: int) -> Dict[str, Any]:
+        with open(self._path(epoch, process), 'rb') as f:
+            return serialization.msgpack_restore(f.read())
+
+    def restore_state(
+        self, target: Dict[str, Any], epoch: int | None = None
+    ) -> Dict[str, Any]:
+        """
+        Restores the state of the main process, by default of the latest epoch, into the
+        structure of `target`, which may contain a subset of the keys, e.g., the params.
+        """
+        self.wait()
+        epoch = max(self._epochs(0), default=None) if epoch is None else epoch
+        if epoch is None:
+            raise FileNotFoundError(f'No checkpoint in {self.directory}')
+        state = serialization.from_state_dict(target, self._read(epoch, 0)['state'])
+        return jax.device_put(state)
+
+    def restore(
+        self, target: Dict[str, Any], epoch: int
+    ) -> Tuple[Dict[str, Any], DataState]:
+        """The state and the data iterator positions of this process after `epoch`."""
+        state = self.restore_state(target, epoch)
+        return state, self._read(epoch, self.process)['data']
+
+    def close(self) -> None:
+        self.wait()
+        self._executor.shutdown()
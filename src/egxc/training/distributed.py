@@ -0,0 +1,66 @@
+"""
+Data-parallel training across jax processes, e.g., one process per CPU node. Each
+process trains on its own shard of the training set (grain.ShardByJaxProcess) and the
+gradients are averaged across processes after each step, such that the parameters, and
+hence the EMA of the parameters, stay identical on all processes. The validation loss
+is averaged as well, such that all processes stop early in the same epoch.
+
+As the molecules of the processes differ in their (padded) shapes, the step itself is
+compiled per process and only the parameter-shaped gradients are all-reduced, instead
+of a single pmap / shard_map over all devices, which requires equal shapes. Run one
+process per device. On a single machine, e.g. for testing,
+    python scripts/main.py with ... distributed.num_processes=2 distributed.process_id=0
+    python scripts/main.py with ... distributed.num_processes=2 distributed.process_id=1
+with the default local coordinator.
+"""
+
+import jax
+import jax.numpy as jnp
+import numpy as onp
+from jax.experimental import multihost_utils
+
+from typing import TypeVar
+
+T = TypeVar('T')
+
+
+def initialize(coordinator_address: str, num_processes: int, process_id: int) -> None:
+    """Connects to the other processes, cross-process collectives on CPU use gloo."""
+    if num_processes <= 1:
+        return
+    jax.config.update('jax_cpu_collectives_implementation', 'gloo')
+    jax.distributed.initialize(coordinator_address, num_processes, process_id)
+
+
+def is_main_process() -> bool:
+    return jax.process_index() == 0
+
+
+def all_reduce_mean(tree: T) -> T:
+    """Mean of the pytree over all processes."""
+    if jax.process_count() == 1:
+        return tree
+    gathered = multihost_utils.process_allgather(tree)
+    return jax.tree.map(lambda x: jnp.mean(x, axis=0), gathered)
+
+
+def broadcast_from_main(tree: T) -> T:
+    """The pytree of the main process on all processes."""
+    if jax.process_count() == 1:
+        return tree
+    return multihost_utils.broadcast_one_to_all(tree)
+
+
+def all_reduce_min(value: int) -> int:
+    """Minimum of an integer over all processes."""
+    if jax.process_count() == 1:
+        return value
+    return int(multihost_utils.process_allgather(onp.asarray(value)).min())
+
+
+def weighted_mean(value: float, weight: float) -> float:
+    """Mean of a per process mean `value` over `weight` samples over all processes."""
+    if jax.process_count() == 1:
+        return value
+    total, weight = all_reduce_mean(onp.array([value * weight, weight]))
+    return float(total / weight)
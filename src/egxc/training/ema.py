@@ -18,7 +18,7 @@ class EMA(NamedTuple, Generic[T]):
 
     @classmethod
     def create(cls, tree: T) -> 'EMA[T]':
-        return cls(jax.tree_map(lambda x: jnp.zeros_like(x), tree), 0)
+        return cls(jax.tree.map(lambda x: jnp.zeros_like(x), tree), 0)
 
 
 @partial(jax.jit, static_argnames=('decay',))
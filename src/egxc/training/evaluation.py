@@ -0,0 +1,120 @@
+"""
+Batched evaluation of the validation and test sets. Samples of the same shape bucket
+(see `egxc.utils.typing.Alignment`) are stacked into batches of `batch_size` and
+evaluated by a single vmapped call of the (forward-only) evaluation function. The
+per-sample metrics are written into arrays, which are preallocated on the device, such
+that the loop never waits for a transfer to the host and the data loader (see
+`egxc.dataloading.prefetch_to_device`) keeps running while the device evaluates.
+"""
+
+from functools import partial
+
+import jax
+import jax.numpy as jnp
+
+from egxc.dataloading import ToJaxTransform, prefetch_to_device
+from egxc.dataloading.dataloader import GrainDataLoaderWrapper
+
+from egxc.utils.typing import NnParams
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Tuple
+
+Metrics = Dict[str, jax.Array]
+Sample = Tuple[Any, ...]  # (targets, P0, sys)
+
+
+def bucket_key(sample: Any) -> Hashable:
+    """Samples with the same key can be stacked into a batch."""
+    leaves, treedef = jax.tree.flatten(sample)
+    return (treedef, *((jnp.shape(x), jnp.result_type(x)) for x in leaves))
+
+
+@jax.jit
+def _stack(samples: List[Sample]) -> Sample:
+    return jax.tree.map(lambda *x: jnp.stack(x), *samples)
+
+
+def bucketed_batches(
+    samples: Iterable[Tuple[Any, Sample]], batch_size: int
+) -> Iterator[Tuple[List[Any], Sample]]:
+    """
+    Groups the samples by shape bucket and yields a stacked batch as soon as a bucket
+    holds `batch_size` samples, the remaining partial batches at the end. Partial batches
+    are padded with their last sample, such that each bucket is compiled once.
+    Args:
+        samples: (meta, sample) pairs, the meta data is kept on the host, e.g., an index
+    Returns:
+        The meta data of the (unpadded) samples and the batch
+    """
+    pending: Dict[Hashable, Tuple[List[Any], List[Sample]]] = {}
+
+    def stack(metas: List[Any], batch: List[Sample]) -> Tuple[List[Any], Sample]:
+        padding = [batch[-1]] * (batch_size - len(batch))
+        return metas, _stack(batch + padding)
+
+    for meta, sample in samples:
+        key = bucket_key(sample)
+        metas, batch = pending.setdefault(key, ([], []))
+        metas.append(meta)
+        batch.append(sample)
+        if len(batch) == batch_size:
+            yield stack(*pending.pop(key))
+    for metas, batch in pending.values():
+        yield stack(metas, batch)
+
+
+@partial(jax.jit, donate_argnums=0)
+def _write(buffers: Metrics, indices: jax.Array, metrics: Metrics) -> Metrics:
+    # the indices of padded samples are out of bounds and their metrics are dropped
+    return {
+        key: buffer.at[indices].set(metrics[key], mode='drop')
+        for key, buffer in buffers.items()
+    }
+
+
+class Evaluator:
+    def __init__(
+        self, eval_fn: Callable, input_transform: ToJaxTransform, batch_size: int = 1
+    ) -> None:
+        """
+        Args:
+            eval_fn: (params, targets, P0, sys) -> scalar metrics of a single sample
+            input_transform: transform of the preloaded systems, see `prefetch_to_device`
+            batch_size: number of samples of a shape bucket, which are evaluated at once
+        """
+        assert batch_size >= 1, 'Batch size must be at least 1'
+        self.input_transform = input_transform
+        self.batch_size = batch_size
+        self.batched_eval_fn = jax.jit(jax.vmap(eval_fn, in_axes=(None, 0, 0, 0)))
+
+    def __call__(self, params: NnParams, dataloader: GrainDataLoaderWrapper) -> Metrics:
+        """
+        Returns:
+            The metrics of the samples in the order of the data loader, each an array of
+            shape (len(dataloader),).
+        """
+        n_samples = len(dataloader)
+        buffers: Metrics | None = None
+        inputs = prefetch_to_device(dataloader, self.input_transform)
+        samples = (
+            (i, (targets, P0, sys)) for i, ((P0, sys), targets) in enumerate(inputs)
+        )
+        for indices, batch in bucketed_batches(samples, self.batch_size):
+            metrics = self.batched_eval_fn(params, *batch)
+            if buffers is None:
+                buffers = {
+                    key: jnp.full(n_samples, jnp.nan, dtype=value.dtype)
+                    for key, value in metrics.items()
+                }
+            padding = [n_samples] * (self.batch_size - len(indices))
+            buffers = _write(buffers, jnp.asarray(indices + padding), metrics)
+        assert buffers is not None, 'No samples to evaluate'
+        return buffers
+
+    def lower(self, params: NnParams, targets: Any, P0: Any, sys: Any):
+        """Lowers the batched evaluation for the shape bucket of a (abstract) sample."""
+        def batched(x):
+            shape = (self.batch_size, *jnp.shape(x))
+            return jax.ShapeDtypeStruct(shape, jnp.result_type(x))
+
+        batch = jax.tree.map(batched, (targets, P0, sys))
+        return self.batched_eval_fn.lower(params, *batch)
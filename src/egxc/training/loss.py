@@ -16,7 +16,6 @@ from egxc.utils.typing import (
     FloatSCF,
     FloatSCFxBxB,
     FloatAx3,
-    FloatSCFxAx3,
     PRECISION,
 )
 
@@ -97,7 +96,7 @@ def decay_egxc2025(cycles: int, discard_first_n: int):
 @flax_dataclass
 class LossFns:
     energy: Callable[[Float1, FloatSCF], Float1]
-    forces: Callable[[FloatAx3, FloatSCFxAx3], Float1]
+    forces: Callable[[FloatAx3, FloatAx3], Float1]
     density: Callable[[FloatBxB, FloatSCFxBxB, Grid, Int1], Float1]
 
 
@@ -117,8 +116,9 @@ def get_loss_fns(config: LossConfig) -> LossFns:
 
     if config.weights.forces > 0.0:
 
-        def forces_loss(target: FloatAx3, prediction: FloatSCFxAx3):
-            out = jnp.einsum('c, af, caf->i', decay_factors, target, prediction)
+        def forces_loss(target: FloatAx3, prediction: FloatAx3) -> Float1:
+            # forces are only evaluated at the (converged) final cycle, see solver.forces
+            out = (target - prediction) ** 2
             return config.weights.forces * out.sum()
     else:
         forces_loss = zero_fn
@@ -3,42 +3,91 @@ import jax.numpy as jnp
 import optax
 
 from egxc.solver.base import Solver
-from egxc.systems import System, nuclear_energy, PreloadSystem
-from egxc.dataloading import DataLoaders, Targets, ToJaxTransform
+from egxc.solver.forces import get_forces_fn
+from egxc.systems import System, SystemFn, PreloadSystem, nuclear_energy
+from egxc.dataloading import (
+    DataLoaders,
+    Targets,
+    ToJaxTransform,
+    prefetch_to_device,
+    preloaded_to_device,
+)
 
 from egxc.training.loss import LossConfig, get_loss_fns
-from egxc.training import ema
+from egxc.training import distributed, ema
+from egxc.training.checkpoint import CheckpointManager
+from egxc.training.evaluation import Evaluator
 from egxc.training.early_stopping import EarlyStopping
-from egxc.utils.logging import Logger
+from egxc.utils.logging import Logger, MetricSums, accumulate
+from egxc.utils.profiling import Profiler
 
 from egxc.utils.typing import NnParams, FloatBxB
-from typing import Tuple, Any
+from typing import Any, Callable, NamedTuple, Tuple
 
 
-def run(
-    init_params: NnParams,
+class StepFns(NamedTuple):
+    input_transform: ToJaxTransform
+    grad_fn: Callable  # (params, targets, P0, sys) -> (loss, energy error, grads)
+    update_fn: Callable  # (params, opt_state, loss, grads) -> (params, opt_state, norm)
+    eval_fn: Callable  # (params, targets, P0, sys) -> metrics, forward-only
+
+
+def get_step_fns(
     model: Solver,
     optimizer: optax.GradientTransformation | optax.GradientTransformationExtraArgs,
     ema_decay: float,
-    early_stopping_patience: int,
     loss_config: LossConfig,
-    epochs: int,
-    dataloaders: DataLoaders,
     input_transform: ToJaxTransform,
-    logger: Logger,
-    test: bool,
-) -> None:
+    system_fn: SystemFn | None = None,
+    scf_tolerance: float | None = None,
+) -> StepFns:
+    """
+    The evaluation stops the SCF as soon as its commutator error is below `scf_tolerance`
+    (see `SelfConsistentFieldSolver.converge`), the other solvers run all cycles.
+    """
     loss_fns = get_loss_fns(loss_config)
+    train_forces = loss_config.weights.forces > 0.0
 
-    @jax.jit
-    def loss_fn(params, targets: Targets, P0: FloatBxB, sys: System):
-        (e_hj, e_xc), predicted_density_matrices = model.apply(params, P0, sys)
+    if train_forces:
+        # the System is built inside the step, such that the forces can be obtained
+        # by differentiating w.r.t. the nuclear positions
+        assert system_fn is not None, 'Force training requires a system_fn'
+        forces_fn = get_forces_fn(model, system_fn)
+        input_transform = preloaded_to_device  # type: ignore
+
+    def build_system(inputs: System | PreloadSystem) -> System:
+        if train_forces:
+            return system_fn(jnp.asarray(inputs.nuc_pos), inputs)  # type: ignore
+        return inputs  # type: ignore
+
+    early_exit = scf_tolerance is not None and hasattr(model, 'converge')
+
+    def loss_fn(
+        params,
+        targets: Targets,
+        P0: FloatBxB,
+        inputs: System | PreloadSystem,
+        forward_only: bool = False,
+    ):
+        sys = build_system(inputs)
+        cycles = None
+        if forward_only and early_exit:
+            (e_hj, e_xc), predicted_density_matrices, cycles = model.apply(
+                params, P0, sys, method='converge', tolerance=scf_tolerance
+            )
+        else:
+            (e_hj, e_xc), predicted_density_matrices = model.apply(params, P0, sys)
         predicted_energies = e_xc + e_hj + nuclear_energy(sys._nuc_pos, sys)
         # energy
         loss = loss_fns.energy(targets.energy, predicted_energies)  # type: ignore
         # force
-        # TODO: Implement force loss
-        loss += 0
+        if train_forces:
+            _, predicted_forces = forces_fn(
+                params, predicted_density_matrices[-1], inputs  # type: ignore
+            )
+            loss += loss_fns.forces(targets.nuc_forces, predicted_forces)  # type: ignore
+        else:
+            predicted_forces = None
         # density
         loss += loss_fns.density(
             targets.density_matrix,  # type: ignore
@@ -46,62 +95,203 @@ def run(
             sys.grid,
             sys.n_electrons,
         )
-        return loss, (predicted_energies, predicted_density_matrices)
+        return loss, (
+            predicted_energies,
+            predicted_density_matrices,
+            predicted_forces,
+            cycles,
+        )
 
     @jax.jit
-    def step_fn(
-        params,
-        opt_state: Tuple[ema.EMA, Any],
-        targets: Targets,
-        P0: FloatBxB,
-        sys: System,
-    ):
-        (loss, (e_pred, dm_pred)), grads = jax.value_and_grad(loss_fn, has_aux=True)(
+    def grad_fn(params, targets: Targets, P0: FloatBxB, sys: System | PreloadSystem):
+        (loss, (e_pred, *_)), grads = jax.value_and_grad(loss_fn, has_aux=True)(
             params, targets, P0, sys
         )
+        energy_error = jnp.abs(e_pred[-1] - targets.energy) * 1e3
+        return loss, energy_error, grads
+
+    @jax.jit
+    def update_fn(params, opt_state: Tuple[ema.EMA, Any], loss, grads):
         optax_state, params_ema = opt_state
         updates, optax_state = optimizer.update(grads, optax_state, params, value=loss)  # type: ignore # TODO: why do I need to pass params here?
         params = optax.apply_updates(params, updates)
         params_ema = ema.update(params_ema, params, ema_decay)
         grad_norm = optax.global_norm(grads)
-        return params, (optax_state, params_ema), loss, e_pred, grad_norm
-
-    def eval_step(params, psys: PreloadSystem, targets: Targets, prefix: str) -> None:
-        P0, sys = input_transform(psys)
-        loss, (e_pred, dm_pred) = loss_fn(params, targets, P0, sys)
-        logger.log(
-            {
-                f'{prefix}/loss': loss,
-                f'{prefix}/energy error [mEh]': abs(e_pred[-1] - targets.energy) * 1e3,
-                f'debug/{prefix}/density matrix volatility': jnp.linalg.norm(
-                    dm_pred[-2] - dm_pred[-1]
-                ),
-            }
-        )
+        return params, (optax_state, params_ema), grad_norm
+
+    @jax.jit
+    def eval_fn(params, targets: Targets, P0: FloatBxB, sys: System | PreloadSystem):
+        loss, (e_pred, dm_pred, f_pred, cycles) = loss_fn(params, targets, P0, sys, True)
+        metrics = {  # formatted with the prefix
+            '{}/loss': loss,
+            '{}/energy error [mEh]': jnp.abs(e_pred[-1] - targets.energy) * 1e3,
+        }
+        if cycles is None:
+            metrics['debug/{}/density matrix volatility'] = jnp.linalg.norm(
+                dm_pred[-2] - dm_pred[-1]
+            )
+        else:  # the trajectory is stationary after the early exit
+            metrics['debug/{}/scf cycles'] = cycles.astype(loss.dtype)
+        if f_pred is not None:
+            metrics['{}/force error [mEh/A]'] = (
+                jnp.abs(f_pred - targets.nuc_forces).max() * 1e3
+            )
+        return metrics
+
+    return StepFns(input_transform, grad_fn, update_fn, eval_fn)
+
 
-    params = init_params
+def warm_cache(
+    init_params: NnParams,
+    model: Solver,
+    optimizer: optax.GradientTransformation | optax.GradientTransformationExtraArgs,
+    ema_decay: float,
+    loss_config: LossConfig,
+    dataloaders: DataLoaders,
+    input_transform: ToJaxTransform,
+    system_fn: SystemFn | None = None,
+    max_samples: int | None = None,
+    eval_batch_size: int = 1,
+    scf_tolerance: float | None = None,
+) -> int:
+    """
+    Compiles the functions of `run` ahead of time for every shape bucket of the training
+    and validation sets, such that a run with the persistent compilation cache (see
+    `egxc.utils.compilation_cache`) does not compile. The buckets are found by
+    preloading up to `max_samples` samples of each set, nothing is executed.
+    Returns:
+        Number of shape buckets.
+    """
+    fns = get_step_fns(
+        model, optimizer, ema_decay, loss_config, input_transform, system_fn, scf_tolerance
+    )
+    evaluator = Evaluator(fns.eval_fn, fns.input_transform, eval_batch_size)
+    buckets = {}
+    for dataloader in (dataloaders.train, dataloaders.val):
+        for i, (psys, targets) in enumerate(dataloader):
+            abstract_inputs = jax.eval_shape(fns.input_transform, psys)
+            key = (
+                jax.tree.structure(abstract_inputs),
+                *jax.tree.leaves(abstract_inputs),
+                *map(jnp.shape, jax.tree.leaves(targets)),
+            )
+            buckets.setdefault(key, (psys, targets, abstract_inputs))
+            if max_samples is not None and i + 1 >= max_samples:
+                break
+    assert len(buckets) > 0, 'No samples to compile for'
+
+    opt_state = (optimizer.init(init_params), ema.EMA.create(init_params))
+    for n, (psys, targets, (P0, sys)) in enumerate(buckets.values()):
+        print('#' * 20, f'Compiling shape bucket {n + 1}/{len(buckets)}', flush=True)
+        if hasattr(fns.input_transform, 'lower'):  # jitted
+            fns.input_transform.lower(psys).compile()  # type: ignore
+        fns.grad_fn.lower(init_params, targets, P0, sys).compile()  # type: ignore
+        evaluator.lower(init_params, targets, P0, sys).compile()
+    # independent of the shapes of the molecules
+    loss, _, grads = jax.eval_shape(fns.grad_fn, init_params, targets, P0, sys)  # type: ignore
+    fns.update_fn.lower(init_params, opt_state, loss, grads).compile()  # type: ignore
+    return len(buckets)
+
+
+def run(
+    init_params: NnParams,
+    model: Solver,
+    optimizer: optax.GradientTransformation | optax.GradientTransformationExtraArgs,
+    ema_decay: float,
+    early_stopping_patience: int,
+    loss_config: LossConfig,
+    epochs: int,
+    dataloaders: DataLoaders,
+    input_transform: ToJaxTransform,
+    logger: Logger,
+    test: bool,
+    system_fn: SystemFn | None = None,
+    profiler: Profiler | None = None,
+    log_every: int = 10,  # steps between reads of the device-side metrics
+    checkpoints: CheckpointManager | None = None,  # resumes from the latest checkpoint
+    eval_batch_size: int = 1,  # samples of a shape bucket evaluated at once
+    scf_tolerance: float | None = None,  # early exit of the SCF during the evaluation
+) -> None:
+    profiler = profiler or Profiler(enabled=False)
+    input_transform, grad_fn, update_fn, eval_fn = get_step_fns(
+        model, optimizer, ema_decay, loss_config, input_transform, system_fn, scf_tolerance
+    )
+    evaluator = Evaluator(eval_fn, input_transform, eval_batch_size)
+
+    def step_fn(
+        params,
+        opt_state: Tuple[ema.EMA, Any],
+        targets: Targets,
+        P0: FloatBxB,
+        sys: System | PreloadSystem,
+    ):
+        loss, energy_error, grads = grad_fn(params, targets, P0, sys)
+        # identical updates on all processes (the identity for a single process)
+        loss, grads = distributed.all_reduce_mean((loss, grads))
+        params, opt_state, grad_norm = update_fn(params, opt_state, loss, grads)
+        metrics = {
+            'train/loss': loss,
+            'train/energy error [mEh]': energy_error,
+            'debug/gradient norm': grad_norm,
+        }
+        return params, opt_state, metrics
+
+    def evaluate(params, dataloader, prefix: str) -> None:
+        """Evaluates the dataset in batches and reads its metrics once."""
+        metrics = evaluator(params, dataloader)
+        logger.log_sums(accumulate(None, {k.format(prefix): v for k, v in metrics.items()}))
+
+    params = distributed.broadcast_from_main(init_params)
     optax_state = optimizer.init(params)
     params_ema = ema.EMA.create(params)
     opt_state = (optax_state, params_ema)
     early_stopping = EarlyStopping(early_stopping_patience)
 
-    for e in range(epochs):
+    def training_state():
+        return {
+            'params': params,
+            'opt_state': opt_state,
+            'early_stopping': {
+                'best_loss': early_stopping.best_loss,
+                'counter': early_stopping.counter,
+            },
+        }
+
+    start_epoch = 0
+    if checkpoints is not None:
+        # the latest epoch, which has been saved by all processes
+        latest = checkpoints.latest_epoch()
+        latest = distributed.all_reduce_min(-1 if latest is None else latest)
+        if latest >= 0:
+            print('#' * 20, f'Resuming after epoch {latest}')
+            state, data_state = checkpoints.restore(training_state(), latest)
+            params, opt_state = state['params'], state['opt_state']
+            early_stopping.best_loss = float(state['early_stopping']['best_loss'])
+            early_stopping.counter = int(state['early_stopping']['counter'])
+            dataloaders.train.set_state(data_state['train'])
+            dataloaders.val.set_state(data_state['val'])
+            start_epoch = latest + 1
+            if early_stopping.counter >= early_stopping.patience:
+                start_epoch = epochs  # stopped early before
+
+    for e in range(start_epoch, epochs):
         logger.start_epoch(e)
         logger.start_mean(['train/energy error [mEh]'])
-        for psys, targets in dataloaders.train:
-            P0, sys = input_transform(psys)
-            params, opt_state, loss, e_pred, grad_norm = step_fn(
-                params, opt_state, targets, P0, sys
-            )
-            logger.log(
-                {
-                    'train/loss': loss,
-                    'train/energy error [mEh]': abs(e_pred[-1] - targets.energy) * 1e3,
-                    'debug/gradient norm': grad_norm,
-                }
+        sums: MetricSums | None = None
+        for i, ((P0, sys), targets) in enumerate(
+            prefetch_to_device(dataloaders.train, input_transform, profiler=profiler)
+        ):
+            params, opt_state, metrics = profiler.step(
+                step_fn, params, opt_state, targets, P0, sys
             )
+            sums = accumulate(sums, metrics)
+            if (i + 1) % log_every == 0:
+                logger.log_sums(sums)
+                sums = None
+        logger.log_sums(sums)
         logger.stop_mean()
         logger.log_epoch_training_duration()
+        logger.log_profile(profiler)
 
         if e == epochs - 1 and test:
             # skip last validation
@@ -110,38 +300,46 @@ def run(
 
         logger.start_mean(['val/loss', 'val/energy error [mEh]'])
         eval_params = ema.value(opt_state[1])
-        for psys, targets in dataloaders.val:
-            eval_step(eval_params, psys, targets, 'val')
+        evaluate(eval_params, dataloaders.val, 'val')
 
-        mean_val_loss = logger.get_current_mean('val/loss')
-        if early_stopping.stop(mean_val_loss):
-            logger.stop_mean()
+        mean_val_loss = distributed.weighted_mean(
+            logger.get_current_mean('val/loss'), len(dataloaders.val)
+        )
+        stop = early_stopping.stop(mean_val_loss)
+        logger.stop_mean()
+        if checkpoints is not None:
+            checkpoints.save(
+                e,
+                training_state(),
+                {'train': dataloaders.train.get_state(), 'val': dataloaders.val.get_state()},
+            )
+        if stop:
             break
-        else:
-            logger.stop_mean()
-
-        # TODO: save checkpoint
 
-    if test:
-        jax.clear_caches()
+    profiler.close()
+    if checkpoints is not None:
+        checkpoints.close()
+    # the test set is not sharded, the train and validation sets are those of the shard
+    # of the main process
+    if test and distributed.is_main_process():
+        # free the training executables, the batched evaluation ones are reused
+        grad_fn.clear_cache()  # type: ignore
+        update_fn.clear_cache()  # type: ignore
         print('#' * 40, 'Final Evaluation')
         logger.write_csv = True
         final_params = ema.value(opt_state[1])
 
         logger.start_mean(
-            [f'final {prefix} energy error [mEh]' for prefix in ['train', 'val', 'test']]
+            [f'final {prefix}/energy error [mEh]' for prefix in ['train', 'val', 'test']]
         )
         print('#' * 20, 'On Training Set')
-        for psys, targets in dataloaders.train:
-            eval_step(final_params, psys, targets, 'final train')
+        evaluate(final_params, dataloaders.train, 'final train')
         del dataloaders.train
 
         print('#' * 20, 'On Valiation Set')
-        for psys, targets in dataloaders.val:
-            eval_step(final_params, psys, targets, 'final val')
+        evaluate(final_params, dataloaders.val, 'final val')
         del dataloaders.val
 
         print('#' * 20, 'On Test Set')
-        for psys, targets in dataloaders.test:
-            eval_step(final_params, psys, targets, 'final test')
+        evaluate(final_params, dataloaders.test, 'final test')
         logger.stop_mean()
@@ -0,0 +1,55 @@
+"""
+Persistent XLA compilation cache (https://docs.jax.dev/en/latest/persistent_compilation_cache.html).
+The executables are keyed by the lowered computation, i.e., by the padded input shapes,
+such that each shape bucket (see `egxc.utils.typing.Alignment`) is compiled once across
+runs. `CacheStats` counts the cache hits of the current process.
+"""
+
+import os
+from collections import defaultdict
+
+import jax
+
+from typing import Any, Dict
+
+REQUESTS_EVENT = '/jax/compilation_cache/compile_requests_use_cache'
+HITS_EVENT = '/jax/compilation_cache/cache_hits'
+MISSES_EVENT = '/jax/compilation_cache/cache_misses'  # compiled and written
+TIME_SAVED_EVENT = '/jax/compilation_cache/compile_time_saved_sec'
+
+
+def initialize(directory: str, min_compile_time_secs: float = 1.0) -> None:
+    """
+    Caches all executables, whose compilation took longer than `min_compile_time_secs`,
+    in `directory`. Has to be called before the first compilation.
+    """
+    os.makedirs(directory, exist_ok=True)
+    jax.config.update('jax_compilation_cache_dir', os.path.abspath(directory))
+    jax.config.update('jax_persistent_cache_min_compile_time_secs', min_compile_time_secs)
+
+
+class CacheStats:
+    def __init__(self) -> None:
+        self.events: Dict[str, float] = defaultdict(float)
+        jax.monitoring.register_event_listener(self._on_event)
+        jax.monitoring.register_event_duration_secs_listener(self._on_duration)
+
+    def _on_event(self, event: str, **kwargs: Any) -> None:
+        if event in (REQUESTS_EVENT, HITS_EVENT, MISSES_EVENT):
+            self.events[event] += 1
+
+    def _on_duration(self, event: str, duration: float, **kwargs: Any) -> None:
+        if event == TIME_SAVED_EVENT:
+            self.events[event] += duration
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'compilation cache/requests': self.events[REQUESTS_EVENT],
+            'compilation cache/hits': self.events[HITS_EVENT],
+            'compilation cache/misses': self.events[MISSES_EVENT],
+            'compilation cache/compile time saved [s]': self.events[TIME_SAVED_EVENT],
+        }
+
+    def close(self) -> None:
+        jax.monitoring.unregister_event_listener(self._on_event)
+        jax.monitoring.unregister_event_duration_listener(self._on_duration)
@@ -5,7 +5,7 @@ ANGSTROM_TO_BOHR = 1 / BOHR_TO_ANGSTROM
 HATREE_TO_KCAL_PER_MOL = 627.509474
 KCAL_PER_MOL_TO_HATREE = 1 / HATREE_TO_KCAL_PER_MOL
 
-L_MAX = 3
+L_MAX = 4
 
 # fmt: off
 _UNKNOWN = 1.999999
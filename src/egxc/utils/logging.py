@@ -1,12 +1,82 @@
+import atexit
+import csv
+import json
 import os.path
+import queue
+import threading
 import numpy as onp
 import pandas as pd
+import jax
+import jax.numpy as jnp
 import wandb
 from time import time
 
-from typing import Dict, List
+from egxc.utils.profiling import Profiler
+from typing import Any, Dict, List, Tuple
 
-Scalar = float | int
+Scalar = float | int | jax.Array
+# per metric: sum of the non-NaN values, number of non-NaN values and number of NaNs
+MetricSums = Dict[str, jax.Array]
+
+
+@jax.jit
+def _accumulate(sums: MetricSums, metrics: Dict[str, Scalar]) -> MetricSums:
+    def add(total, value):
+        value = jnp.asarray(value, dtype=total.dtype)
+        nan = jnp.isnan(value)
+        value = jnp.where(nan, 0, value)
+        return total + jnp.stack([value.sum(), (~nan).sum(), nan.sum()])
+
+    return {key: add(sums[key], value) for key, value in metrics.items()}
+
+
+def accumulate(sums: MetricSums | None, metrics: Dict[str, Scalar]) -> MetricSums:
+    """
+    Adds the scalar metrics of a step, or arrays of per-sample metrics, to the sums on the
+    device, such that the step does not wait for a transfer to the host. The sums are
+    read by `Logger.log_sums`.
+    """
+    if sums is None:
+        sums = {key: jnp.zeros(3) for key in metrics}
+    return _accumulate(sums, metrics)
+
+
+class _Writer(threading.Thread):
+    """
+    Writes the logged records to wandb and the local files on a background thread. The
+    queue is bounded, such that a slow backend eventually blocks the training loop
+    instead of accumulating an unbounded backlog.
+    """
+
+    def __init__(self, dir: str, local_file: bool, queue_size: int) -> None:
+        super().__init__(daemon=True)
+        self.queue: queue.Queue[Tuple[Dict[str, Any], bool] | None] = queue.Queue(
+            queue_size
+        )
+        self.jsonl_path = os.path.join(dir, 'metrics.jsonl') if local_file else None
+        self.csv_path = os.path.join(dir, 'metrics.csv')
+
+    def run(self) -> None:
+        while (item := self.queue.get()) is not None:
+            record, write_csv = item
+            record = {key: _to_python(value) for key, value in record.items()}
+            wandb.log(record)
+            if self.jsonl_path is not None:
+                with open(self.jsonl_path, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+            if write_csv:
+                new = not os.path.exists(self.csv_path)
+                with open(self.csv_path, 'a', newline='') as f:
+                    writer = csv.writer(f)
+                    if new:
+                        writer.writerow(['key', 'value'])
+                    writer.writerows(record.items())
+
+
+def _to_python(value: Any) -> Any:
+    if isinstance(value, (jax.Array, onp.ndarray, onp.generic)):
+        return onp.asarray(value).item()
+    return value
 
 
 class Logger:
@@ -15,39 +85,72 @@ class Logger:
     epoch_start_time: float| None = None
     # backend: str = 'wandb'  # TODO: add support for Tensorboard?
 
-    def __init__(self, project: str, config: Dict, dir: str, name=None) -> None:
-        dir = os.path.join(dir, 'wandb')
-        wandb.init(project=project, config=config, dir=dir, name=name)  # type: ignore
+    def __init__(
+        self,
+        project: str,
+        config: Dict,
+        dir: str,
+        name=None,
+        enabled: bool = True,
+        local_file: bool = False,  # additionally writes dir/metrics.jsonl
+        queue_size: int = 1024,
+    ) -> None:
+        # disabled, e.g., on all but the main process, the means are still accumulated
+        os.makedirs(dir, exist_ok=True)
+        mode = None if enabled else 'disabled'
+        wandb_dir = os.path.join(dir, 'wandb')
+        wandb.init(project=project, config=config, dir=wandb_dir, name=name, mode=mode)  # type: ignore
+        self.enabled = enabled
+        self.mean_sums: Dict[str, onp.ndarray] = {}
+        self.accumulate = False
+        self._writer = _Writer(dir, local_file and enabled, queue_size)
+        self._writer.start()
+        atexit.register(self.close)
 
     def log(self, dict: Dict[str, Scalar]) -> None:
-        wandb.log(dict)
+        """Queues the record for the background writer."""
+        if self.enabled:
+            self._writer.queue.put((dict, self.write_csv))
         if self.accumulate:
             for key, value in dict.items():
-                if key in self.accumulate_keys:
-                    self.accumulate_keys[key].append(value)
+                if key in self.mean_sums:
+                    value = float(value)
+                    nan = onp.isnan(value)
+                    self.mean_sums[key] += (0.0 if nan else value, not nan, nan)
+
+    def log_sums(self, sums: MetricSums | None) -> None:
+        """
+        Logs the means of the sums of `accumulate`, which are read from the device in a
+        single transfer.
+        """
+        if sums is None:
+            return
+        sums = jax.device_get(sums)
+        if self.enabled:
+            self._writer.queue.put(
+                ({key: _mean(s, max_nans=0) for key, s in sums.items()}, self.write_csv)
+            )
+        if self.accumulate:
+            for key, s in sums.items():
+                if key in self.mean_sums:
+                    self.mean_sums[key] += s
 
     def start_mean(self, keys: List[str]) -> None:
-        self.accumulate_keys = {key: [] for key in keys}
+        self.mean_sums = {key: onp.zeros(3) for key in keys}
         self.accumulate = True
 
     def _evaluate_mean(self, key=None) -> None:
-        for key, values in self.accumulate_keys.items():
+        for key, s in self.mean_sums.items():
             label = f'mean/{key}'
-            self.log({label: sum(values) / len(values)})
+            self.log({label: _mean(s, max_nans=0)})
 
     def get_current_mean(self, key: str, max_nans=5) -> float:
-        values = self.accumulate_keys[key]
-        array = onp.array(values)
-        isnan = onp.isnan(array)
-        out = array[~isnan].mean()
-        if isnan.sum() > max_nans:
-            out = onp.nan
-        return out
+        return _mean(self.mean_sums[key], max_nans)
 
     def stop_mean(self) -> None:
-        self._evaluate_mean()
         self.accumulate = False
-        self.accumulate_keys = {}
+        self._evaluate_mean()
+        self.mean_sums = {}
 
     def start_epoch(self, e: int) -> None:
         print('#' * 20, f'Epoch {e}:', flush=True)
@@ -60,4 +163,22 @@ class Logger:
     def log_epoch_training_duration(self) -> None:
         current_time = time()
         time_diff = current_time - self.epoch_start_time  # type: ignore
-        self.log({'debug/Epoch train duration [min]:': time_diff / 60})
\ No newline at end of file
+        self.log({'debug/Epoch train duration [min]:': time_diff / 60})
+
+    def log_profile(self, profiler: Profiler) -> None:
+        """Logs the per step phase durations and compilation counters of the profiler."""
+        if profiler.enabled:
+            self.log(profiler.summary())
+
+    def close(self) -> None:
+        """Waits until all queued records are written."""
+        if self._writer.is_alive():
+            self._writer.queue.put(None)
+            self._writer.join()
+
+
+def _mean(sums: onp.ndarray, max_nans: int) -> float:
+    total, count, nans = sums
+    if nans > max_nans or count == 0:
+        return onp.nan
+    return float(total / count)
@@ -0,0 +1,107 @@
+"""
+Host-side profiling of the training loop, which attributes the wall time of a step to
+    data: waiting for the data loader (grain workers),
+    transform: the main thread input transform (see `dataloading.prefetch_to_device`),
+    compute: the (synchronized) training step,
+and counts the XLA compilations per jitted function, such that recompilations, e.g.,
+due to new shapes, show up in the logs. Optionally, a few steps are recorded as a
+Perfetto trace (https://docs.jax.dev/en/latest/profiling.html), in which the phases
+above are annotated next to the named scopes of the device computation. Flax runs all
+module methods under jax.named_scope (flax.config.flax_profile), while plain functions
+of the hot path (DIIS, Coulomb matrix, ...) are scoped explicitly.
+"""
+
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+import jax
+
+from typing import Any, Callable, ContextManager, Dict, Iterator
+
+BACKEND_COMPILE_EVENT = '/jax/core/compile/backend_compile_duration'
+
+
+class Profiler:
+    def __init__(
+        self,
+        enabled: bool = True,
+        trace_dir: str | None = None,
+        trace_start: int = 1,  # skip the first step, which is dominated by compilation
+        trace_steps: int = 5,
+    ) -> None:
+        self.enabled = enabled
+        self.trace_dir = trace_dir
+        self.trace_start = trace_start
+        self.trace_steps = trace_steps
+        self.durations: Dict[str, float] = defaultdict(float)
+        self.steps = 0  # since the last summary
+        self.total_steps = 0
+        self.compilations: Dict[str, int] = defaultdict(int)
+        self.compile_time = 0.0
+        self.tracing = False
+        if enabled:
+            jax.monitoring.register_event_duration_secs_listener(self._on_event)
+
+    def _on_event(self, event: str, duration: float, **kwargs: Any) -> None:
+        if event == BACKEND_COMPILE_EVENT:
+            fun_name = str(kwargs.get('fun_name', 'unknown'))  # e.g. 'jit(step_fn)'
+            self.compilations[fun_name.removeprefix('jit(').removesuffix(')')] += 1
+            self.compile_time += duration
+
+    @contextmanager
+    def _timed(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        with jax.profiler.TraceAnnotation(name):
+            yield
+        self.durations[name] += time.perf_counter() - start
+
+    def phase(self, name: str) -> ContextManager[None]:
+        """Accumulates the wall time of the enclosed block under `name`."""
+        return self._timed(name) if self.enabled else nullcontext()
+
+    def step(self, step_fn: Callable, *args: Any) -> Any:
+        """
+        Runs a training step as the compute phase. The step is synchronized, such that
+        its device time is not attributed to the next data or transform phase.
+        """
+        if not self.enabled:
+            return step_fn(*args)
+        if self.trace_dir is not None and self.total_steps == self.trace_start:
+            jax.profiler.start_trace(self.trace_dir, create_perfetto_trace=True)
+            self.tracing = True
+        with jax.profiler.StepTraceAnnotation('train', step_num=self.total_steps):
+            with self._timed('compute'):
+                out = jax.block_until_ready(step_fn(*args))
+        self.steps += 1
+        self.total_steps += 1
+        if self.tracing and self.total_steps == self.trace_start + self.trace_steps:
+            self.stop_trace()
+        return out
+
+    def stop_trace(self) -> None:
+        if self.tracing:
+            jax.profiler.stop_trace()
+            self.tracing = False
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Mean wall time per step of each phase since the last summary and the number of
+        compilations and recompilations (compilations of an already compiled function).
+        """
+        steps = max(self.steps, 1)
+        out = {f'profile/{name} [s/step]': t / steps for name, t in self.durations.items()}
+        out['profile/compilations'] = sum(self.compilations.values())
+        out['profile/recompilations'] = sum(n - 1 for n in self.compilations.values())
+        out['profile/compile time [s]'] = self.compile_time
+        for fun_name, n in self.compilations.items():
+            if n > 1:
+                out[f'profile/recompilations/{fun_name}'] = n - 1
+        self.durations.clear()
+        self.steps = 0
+        return out
+
+    def close(self) -> None:
+        self.stop_trace()
+        if self.enabled:
+            jax.monitoring.unregister_event_duration_listener(self._on_event)
@@ -19,6 +19,8 @@ from jaxtyping import Array, Bool, Float, Int, PyTree
 # M_SPH: real spherical harmonics
 # Q: density fitting auxiliary basis
 # SCF: number of scf iterations
+# D: DIIS subspace size
+# O: occupied orbitals
 # F: node features (atom features)
 
 # dataloading
@@ -60,6 +62,8 @@ FloatBxE = Float[Array, 'B E']
 Float2xBxE = Float[Array, '2 B E']
 FloatBxB = Float[Array, 'B B']
 Float2xBxB = Float[Array, '2 B B']
+BoolBxO = Bool[Array, 'B O']
+FloatBxO = Float[Array, 'B O']
 FloatZ = Float[Array, 'Z']
 FloatZxG = Float[Array, 'Z G']
 IntN = Int[Array, 'N']
@@ -74,11 +78,16 @@ FloatNxBx3 = Float[Array, 'N B 3']
 Float4xNxB = Float[Array, '4 N B']
 BoolQ = Bool[Array, 'Q']
 FloatQxBxB = Float[Array, 'Q B B']
+FloatQxQ = Float[Array, 'Q Q']
 FloatBxBxBxB = Float[Array, 'B B B B']
 FloatSCF = Float[Array, 'SCF']
 FloatSCFxSCF = Float[Array, 'SCF SCF']
 FloatSCFxBxB = Float[Array, 'SCF B B']
 FloatSCFx2xBxB = Float[Array, 'SCF 2 B B']
+BoolD = Bool[Array, 'D']
+FloatD = Float[Array, 'D']
+FloatDxD = Float[Array, 'D D']
+FloatDxBxB = Float[Array, 'D B B']
 
 # GNN related
 FloatAxF = Float[Array, 'A F']
@@ -91,6 +100,7 @@ FloatM_SPH = Float[Array, 'M_SPH']
 FloatNxM_SPH = Float[Array, 'N M_SPH']
 FloatNxC_SPH = Float[Array, 'N C_SPH']
 FloatAxNxM_SPH = Float[Array, 'N M_SPH']
+FloatNxAxM_SPH = Float[Array, 'N A M_SPH']
 
 
 NnParams = PyTree
@@ -156,6 +166,7 @@ class ElectRepTensorType(Enum):
 
     EXACT = auto()
     DENSITY_FITTED = auto()
+    DENSITY_FITTED_DIRECT = auto()  # three-centre integrals recomputed in the Fock build
 
 
 @dataclass
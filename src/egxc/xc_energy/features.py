@@ -1,3 +1,4 @@
+import jax
 import jax.numpy as jnp
 import flax.linen as nn
 
@@ -105,33 +106,39 @@ class DensityFeatures(nn.Module):
     def _spin_restricted_feats(
         self, density_matrix: FloatBxB, aos: FloatNxB, grad_aos: FloatNxBx3 | None
     ) -> Tuple[BoolN, Tuple[FloatN, FloatN]] | Tuple[BoolN, Tuple[FloatN, FloatN, FloatN, FloatN]]:
-        n = jnp.einsum('uv,iu,iv->i', density_matrix, aos, aos)
-        mask, n = _mask_density(self.min_density_threshold, n)
-        zeta = jnp.zeros_like(n)
+        with jax.named_scope('density'):
+            n = jnp.einsum('uv,iu,iv->i', density_matrix, aos, aos)
+            mask, n = _mask_density(self.min_density_threshold, n)
+            zeta = jnp.zeros_like(n)
         if grad_aos is None:
             return mask, (n, zeta)
-        _n_grad = jnp.einsum(
-            'uv,iuj,iv -> ij', density_matrix, grad_aos, aos
-        ) + jnp.einsum('uv,iu,ivj -> ij', density_matrix, aos, grad_aos)
-        abs_n_grad = jnp.linalg.norm(_n_grad, axis=-1)
-        s = transform_abs_grad_n_to_s(n, abs_n_grad)
-        tau = 0.5 * jnp.einsum('uv,iuj,ivj->i', density_matrix, grad_aos, grad_aos)
+        with jax.named_scope('reduced_density_gradient'):
+            _n_grad = jnp.einsum(
+                'uv,iuj,iv -> ij', density_matrix, grad_aos, aos
+            ) + jnp.einsum('uv,iu,ivj -> ij', density_matrix, aos, grad_aos)
+            abs_n_grad = jnp.linalg.norm(_n_grad, axis=-1)
+            s = transform_abs_grad_n_to_s(n, abs_n_grad)
+        with jax.named_scope('kinetic_energy_density'):
+            tau = 0.5 * jnp.einsum('uv,iuj,ivj->i', density_matrix, grad_aos, grad_aos)
         return mask, (n, zeta, s, tau)
 
     def _spin_unrestricted_feats(
         self, density_matrix: Float2xBxB, aos: FloatNxB, grad_aos: FloatNxBx3 | None
     ) -> Tuple[BoolN, Tuple[FloatN, FloatN]] | Tuple[BoolN, Tuple[FloatN, FloatN, FloatN, FloatN]]:
-        n_up = jnp.einsum('uv,iu,iv->i', density_matrix[0], aos, aos)
-        n_down = jnp.einsum('uv,iu,iv->i', density_matrix[1], aos, aos)
-        n = n_up + n_down
-        mask, n = _mask_density(self.min_density_threshold, n)
-        zeta = (n_up - n_down) / n  # TODO: check for division by zero
+        with jax.named_scope('density'):
+            n_up = jnp.einsum('uv,iu,iv->i', density_matrix[0], aos, aos)
+            n_down = jnp.einsum('uv,iu,iv->i', density_matrix[1], aos, aos)
+            n = n_up + n_down
+            mask, n = _mask_density(self.min_density_threshold, n)
+            zeta = (n_up - n_down) / n  # TODO: check for division by zero
         if grad_aos is None:
             return mask, (n, zeta)
-        _n_grad = jnp.einsum(
-            'suv,iuj,iv -> ij', density_matrix, grad_aos, aos
-        ) + jnp.einsum('suv,iu,ivj -> ij', density_matrix, aos, grad_aos)
-        abs_n_grad = jnp.linalg.norm(_n_grad, axis=-1)
-        s = transform_abs_grad_n_to_s(n, abs_n_grad)
-        tau = 0.5 * jnp.einsum('suv,iuj,ivj->i', density_matrix, grad_aos, grad_aos)
+        with jax.named_scope('reduced_density_gradient'):
+            _n_grad = jnp.einsum(
+                'suv,iuj,iv -> ij', density_matrix, grad_aos, aos
+            ) + jnp.einsum('suv,iu,ivj -> ij', density_matrix, aos, grad_aos)
+            abs_n_grad = jnp.linalg.norm(_n_grad, axis=-1)
+            s = transform_abs_grad_n_to_s(n, abs_n_grad)
+        with jax.named_scope('kinetic_energy_density'):
+            tau = 0.5 * jnp.einsum('suv,iuj,ivj->i', density_matrix, grad_aos, grad_aos)
         return mask, (n, zeta, s, tau)
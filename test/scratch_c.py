@@ -0,0 +1,17 @@
+import sys, time, jax
+jax.config.update('jax_compilation_cache_dir','/tmp/jax_cache')
+import test_inference as t
+import pathlib, tempfile
+if __name__ == '__main__':
+    forces = sys.argv[1] == '1'; workers = int(sys.argv[2])
+    d = pathlib.Path(tempfile.mkdtemp())
+    from egxc import inference
+    orig = inference.predict_trajectory
+    def wrapped(*a, **k):
+        k['workers'] = workers
+        t0=time.time(); r = orig(*a, **k); print('predict', time.time()-t0, r, flush=True); return r
+    t.predict_trajectory = wrapped
+    t0=time.time()
+    t.test_predict_trajectory(d, forces)
+    print('total', time.time()-t0)
+    
\ No newline at end of file
@@ -0,0 +1,67 @@
+import os
+
+import grain.python as grain
+import jax
+import jax.numpy as jnp
+import numpy as onp
+import optax
+
+from egxc.dataloading import BaseDataset
+from egxc.dataloading.dataloader import GrainDataLoaderWrapper
+from egxc.training import ema
+from egxc.training.checkpoint import CheckpointManager
+
+from utils import set_jax_testing_config
+
+set_jax_testing_config()
+
+
+class Indices(BaseDataset):
+    def __init__(self) -> None:
+        self.data = onp.arange(10)
+
+    def __getitem__(self, idx):
+        return int(idx)
+
+
+def get_dataloader() -> GrainDataLoaderWrapper:
+    sampler = grain.IndexSampler(10, grain.NoSharding(), shuffle=True, seed=0)
+    dataloader = grain.DataLoader(data_source=Indices(), sampler=sampler, worker_count=0)
+    return GrainDataLoaderWrapper(dataloader, 4)
+
+
+def test_save_and_resume(tmp_path):
+    params = {'w': jnp.arange(3.0), 'b': jnp.array(1.0)}
+    optimizer = optax.adam(1e-2)
+    opt_state = (optimizer.init(params), ema.update(ema.EMA.create(params), params, 0.9))
+    dataloader = get_dataloader()
+    checkpoints = CheckpointManager(str(tmp_path), keep=2)
+    for epoch in range(3):
+        list(dataloader)
+        state = {'params': params, 'opt_state': opt_state, 'early_stopping': {'counter': 1}}
+        checkpoints.save(epoch, state, {'train': dataloader.get_state()})
+        params = jax.tree.map(lambda x: x + 1, params)
+    checkpoints.close()
+    expected_next_epoch = list(dataloader)
+
+    files = sorted(os.listdir(tmp_path))
+    assert files == ['epoch_000001.0.msgpack', 'epoch_000002.0.msgpack']
+    assert checkpoints.latest_epoch() == 2
+
+    target = {
+        'params': jax.tree.map(jnp.zeros_like, params),
+        'opt_state': (optimizer.init(params), ema.EMA.create(params)),
+        'early_stopping': {'counter': 0},
+    }
+    restored, data_state = CheckpointManager(str(tmp_path)).restore(target, 2)
+    assert onp.allclose(restored['params']['w'], jnp.arange(3.0) + 2)
+    assert jax.tree.structure(restored['opt_state']) == jax.tree.structure(opt_state)
+    assert onp.allclose(restored['opt_state'][1].data['b'], 1.0)
+    assert restored['early_stopping']['counter'] == 1
+
+    resumed = get_dataloader()
+    resumed.set_state(data_state['train'])
+    assert list(resumed) == expected_next_epoch  # without replaying the epochs
+
+    only_params = CheckpointManager(str(tmp_path)).restore_state({'params': params})
+    assert onp.allclose(only_params['params']['b'], 3.0)
@@ -0,0 +1,38 @@
+import json
+import subprocess
+import sys
+
+# compiles a function ahead of time in a fresh process and prints the cache stats
+COMPILE = """
+import json
+import sys
+
+import jax
+import jax.numpy as jnp
+
+from egxc.utils import compilation_cache
+
+compilation_cache.initialize(sys.argv[1], min_compile_time_secs=0.0)
+stats = compilation_cache.CacheStats()
+jax.jit(lambda x: jnp.sin(x) @ x.T).lower(jnp.ones((8, 8))).compile()
+print(json.dumps(stats.summary()))
+"""
+
+
+def compile_in_new_process(directory: str):
+    out = subprocess.run(
+        [sys.executable, '-c', COMPILE, directory],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+def test_persistent_cache_hits(tmp_path):
+    first = compile_in_new_process(str(tmp_path))
+    assert first['compilation cache/hits'] == 0
+    assert first['compilation cache/misses'] >= 1
+    second = compile_in_new_process(str(tmp_path))
+    assert second['compilation cache/hits'] >= 1
+    assert second['compilation cache/misses'] == 0
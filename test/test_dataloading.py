@@ -42,6 +42,18 @@ def test_jax_transform(align: Alignment):
     assert isinstance(P0, jnp.ndarray)
 
 
+def test_prefetch_to_device(n: int = 3):
+    water = examples.get_preloaded('water', 'sto-3g', include_grid=True)
+    samples = [(water, Targets(float(i), None, None)) for i in range(n)]
+    transform = dataloading.get_jax_transform(None, None)
+    out = list(dataloading.prefetch_to_device(samples, transform))
+    assert len(out) == n
+    for i, ((P0, sys), targets) in enumerate(out):
+        assert isinstance(sys, System)
+        assert isinstance(P0, jnp.ndarray)
+        assert targets.energy == i
+
+
 presplit_datasets: Dict[str, dataloading.PresplitDataset] = {}
 
 partially_split_datasets: Dict[str, dataloading.PartiallySplitDataset] = {
@@ -0,0 +1,69 @@
+import socket
+import subprocess
+import sys
+
+import pytest
+
+# runs in each process, prints OK if the processes agree
+WORKER = """
+import sys
+import jax.numpy as jnp
+import numpy as onp
+from jax.experimental import multihost_utils
+
+from egxc.dataloading import BaseDataset, DatasetEnsemble, get_dataloaders
+from egxc.training import distributed
+
+address, n, i = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+distributed.initialize(address, n, i)
+
+
+class Indices(BaseDataset):
+    def __init__(self, length):
+        self.data = onp.arange(length)
+
+    def __getitem__(self, idx):
+        return int(idx)
+
+
+datasets = DatasetEnsemble(Indices(11), Indices(5), Indices(3))
+loaders = get_dataloaders(datasets, [], shuffle=True, workers=0, random_seed=0, shard=True)
+assert len(loaders.train) == 11 // n and len(loaders.test) == 3
+for _ in range(2):  # epochs
+    train = onp.array(list(loaders.train))
+    all_train = multihost_utils.process_allgather(train)
+    assert len(onp.unique(all_train)) == all_train.size  # disjoint shards
+
+grads = {'w': jnp.full(3, float(i)), 'b': jnp.array(2.0 * i)}  # on device
+mean = distributed.all_reduce_mean(grads)
+assert onp.allclose(mean['w'], (n - 1) / 2) and onp.isclose(mean['b'], n - 1)
+params = distributed.broadcast_from_main({'w': onp.full(3, float(i))})
+assert onp.allclose(params['w'], 0.0)
+val_loss = distributed.weighted_mean(float(i), len(loaders.val))
+assert onp.isclose(val_loss, sum(j * len(range(j, 5, n)) for j in range(n)) / 5)
+print('OK')
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+@pytest.mark.parametrize('num_processes', [2])
+def test_data_parallel_collectives(num_processes: int):
+    address = f'localhost:{free_port()}'
+    processes = [
+        subprocess.Popen(
+            [sys.executable, '-c', WORKER, address, str(num_processes), str(i)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        for i in range(num_processes)
+    ]
+    for p in processes:
+        out, err = p.communicate(timeout=300)
+        assert p.returncode == 0, err
+        assert 'OK' in out
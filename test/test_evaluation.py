@@ -0,0 +1,42 @@
+import grain.python as grain
+import jax.numpy as jnp
+import numpy as onp
+
+from egxc.dataloading import BaseDataset
+from egxc.dataloading.dataloader import GrainDataLoaderWrapper
+from egxc.training.evaluation import Evaluator
+
+from utils import set_jax_testing_config
+
+set_jax_testing_config()
+
+
+class Samples(BaseDataset):
+    """Samples of two shape buckets, the target is the index."""
+
+    def __init__(self) -> None:
+        self.data = onp.arange(7)
+
+    def __getitem__(self, idx):
+        return onp.ones(2 + int(idx) % 2), float(idx)
+
+
+def eval_fn(params, target, P0, sys):
+    return {'{}/error': params * P0.sum() + sys.sum() - target}
+
+
+def test_batched_evaluation():
+    sampler = grain.IndexSampler(7, grain.NoSharding(), shuffle=False)
+    loader = grain.DataLoader(data_source=Samples(), sampler=sampler, worker_count=0)
+    dataloader = GrainDataLoaderWrapper(loader, 7)
+
+    def input_transform(x):
+        return jnp.asarray(x), jnp.asarray(x)
+
+    expected = []
+    for psys, target in dataloader:
+        expected.append(eval_fn(2.0, target, *input_transform(psys))['{}/error'])
+    for batch_size in (1, 3):  # with a padded batch per bucket
+        metrics = Evaluator(eval_fn, input_transform, batch_size)(2.0, dataloader)
+        assert metrics['{}/error'].shape == (7,)
+        assert onp.allclose(metrics['{}/error'], expected)
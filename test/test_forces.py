@@ -0,0 +1,63 @@
+import jax
+import jax.numpy as jnp
+import numpy as onp
+
+from egxc.discretization import get_grid_fn, get_gto_basis_fn, get_fock_tensors_fn
+from egxc.dataloading import get_system_fn
+from egxc.solver import fock, scf
+from egxc.solver.forces import get_forces_fn
+from egxc.systems import examples, nuclear_energy
+from egxc.systems.preload import preload_system_using_pyscf
+from egxc.xc_energy.features import DensityFeatures
+from egxc.xc_energy.functionals.classical.mgga import MetaGGA
+from egxc.utils.typing import Alignment, ElectRepTensorType
+from utils import set_jax_testing_config
+
+set_jax_testing_config()
+
+
+def test_forces_match_finite_differences(basis: str = 'sto-3g', cycles: int = 20):
+    ert_type = ElectRepTensorType.DENSITY_FITTED
+    water = examples.get_preloaded('water', basis, alignment=1, include_grid=False)
+    psys = preload_system_using_pyscf(
+        water.nuc_pos,
+        water.atom_z.array,
+        charge=0,
+        spin=0,
+        basis=basis,
+        spin_restricted=True,
+        alignment=Alignment(),
+    )
+    system_fn = get_system_fn(
+        (
+            get_grid_fn(1, psys.atom_z.array, 1),
+            get_gto_basis_fn(basis, max_period=2, deriv=1),
+        ),
+        get_fock_tensors_fn(basis, max_period=2, ert_type=ert_type),
+    )
+    xc_module = fock.XCModule(MetaGGA(), DensityFeatures(True))
+    model = scf.SelfConsistentFieldSolver(xc_module, cycles, ert_type, True, 'DIIS')
+    P0 = jnp.asarray(psys.initial_density_matrix)
+    params = model.init(jax.random.PRNGKey(0), P0, system_fn(psys.nuc_pos, psys))
+
+    @jax.jit
+    def scf_energy_and_density_matrix(nuc_pos):
+        sys = system_fn(nuc_pos, psys)
+        (e_hj, e_xc), density_matrices = model.apply(params, P0, sys)
+        return e_hj[-1] + e_xc[-1] + nuclear_energy(nuc_pos, sys), density_matrices[-1]
+
+    nuc_pos = jnp.asarray(psys.nuc_pos)
+    energy, P = scf_energy_and_density_matrix(nuc_pos)
+    e_forces, forces = jax.jit(get_forces_fn(model, system_fn))(params, P, psys)
+    assert jnp.isclose(energy, e_forces), 'Energies of the SCF and forces do not match'
+    assert jnp.abs(forces.sum(axis=0)).max() < 1e-4, 'Forces do not sum to zero'
+
+    eps = 1e-4
+    for atom, direction in [(0, 1), (2, 2)]:
+        dx = onp.zeros_like(nuc_pos)
+        dx[atom, direction] = eps
+        e_plus, _ = scf_energy_and_density_matrix(nuc_pos + dx)
+        e_minus, _ = scf_energy_and_density_matrix(nuc_pos - dx)
+        finite_diff = -(e_plus - e_minus) / (2 * eps)
+        error = abs(forces[atom, direction] - finite_diff)
+        assert error < 1e-6, f'Force error too high: {error}'
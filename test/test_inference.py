@@ -0,0 +1,62 @@
+import json
+
+import ase
+import ase.io
+import jax
+import numpy as onp
+
+from egxc.dataloading import get_jax_transform, get_preload_transform
+from egxc.discretization import get_grid_fn, get_gto_basis_fn
+from egxc.inference import Predictor, predict_trajectory, read_trajectory
+from egxc.solver import fock, scf
+from egxc.systems import nuclear_energy
+from egxc.xc_energy.features import DensityFeatures
+from egxc.xc_energy.functionals.classical.mgga import MetaGGA
+from egxc.utils.typing import Alignment, ElectRepTensorType
+
+from utils import set_jax_testing_config
+
+set_jax_testing_config()
+
+
+def write_trajectory(path: str, n: int = 3) -> None:
+    rng = onp.random.default_rng(0)
+    water = onp.array([[0, 0.7572, -0.4692], [0, 0, 0.1173], [0, -0.7572, -0.4692]])
+    frames = [
+        ase.Atoms('HOH', positions=water + 0.02 * rng.standard_normal((3, 3)))
+        for _ in range(n)
+    ]
+    ase.io.write(path, frames, format='extxyz')
+
+
+def test_predict_trajectory(tmp_path, basis: str = 'sto-3g', cycles: int = 20):
+    ert_type = ElectRepTensorType.DENSITY_FITTED
+    input_path, output_path = str(tmp_path / 'traj.xyz'), str(tmp_path / 'out.jsonl')
+    write_trajectory(input_path)
+
+    (preload_transform,) = get_preload_transform(
+        1, basis, True, Alignment(1, 1, 1), ert_type, include_fock_tensors=True
+    )
+    grid_and_basis = (get_grid_fn(1, [1, 8], 1), get_gto_basis_fn(basis, 2, deriv=1))
+    input_transform = get_jax_transform(grid_and_basis, None)
+    model = scf.SelfConsistentFieldSolver(
+        fock.XCModule(MetaGGA(), DensityFeatures(True)), cycles, ert_type, True
+    )
+    samples = [preload_transform.map(s)[0] for s in read_trajectory(input_path)]
+    params = model.init(jax.random.PRNGKey(0), *input_transform(samples[0]))
+
+    predictor = Predictor(model, input_transform, scf_tolerance=1e-6, batch_size=2)
+    stats = predict_trajectory(
+        params, predictor, preload_transform, input_path, output_path, workers=2
+    )
+    assert stats['inference/molecules'] == 3
+    with open(output_path) as f:
+        records = sorted((json.loads(line) for line in f), key=lambda r: r['index'])
+    assert [r['index'] for r in records] == [0, 1, 2]
+
+    for record, psys in zip(records, samples):
+        P0, sys = input_transform(psys)
+        (e_hj, e_xc), _ = model.apply(params, P0, sys)
+        energy = e_hj[-1] + e_xc[-1] + nuclear_energy(sys._nuc_pos, sys)
+        assert abs(record['energy'] - energy) < 1e-7
+        assert record['scf cycles'] < cycles
@@ -0,0 +1,97 @@
+import jax
+import jax.numpy as jnp
+import numpy as onp
+from pyscf import df
+from scipy.special import hyp1f1
+
+from egxc.discretization import (
+    get_one_electron_integrals_fn,
+    get_density_fitting_integrals_fn,
+    get_fock_tensors_fn,
+)
+from egxc.discretization.integrals import boys
+from egxc.systems import System, examples
+from egxc.utils.typing import ElectRepTensorType
+from utils import set_jax_testing_config
+
+set_jax_testing_config()
+
+
+def test_boys_function(n_max: int = 6):
+    T = onp.array([0.0, 1e-4, 0.05, 0.0999, 0.1, 0.5, 3.0, 20.0, 80.0])
+    target = onp.stack(
+        [hyp1f1(n + 0.5, n + 1.5, -T) / (2 * n + 1) for n in range(n_max + 1)], axis=-1
+    )
+    error = onp.abs(boys(n_max, jnp.asarray(T)) - target).max()
+    assert error < 1e-14, f'Boys function error too high: {error}'
+
+
+def test_one_electron_integrals(basis: str = '6-31G(d)', align: int = 4):
+    psys = examples.get_preloaded('water', basis=basis, include_grid=False, alignment=align)
+    mol = System.from_preloaded(psys, grid='').to_pyscf(basis)  # type: ignore
+    integrals_fn = get_one_electron_integrals_fn(basis, max_period=2)
+    integrals = integrals_fn(
+        jnp.asarray(psys.nuc_pos),
+        jnp.asarray(psys.atom_z.array),
+        psys.periods,  # type: ignore
+        psys.max_number_of_basis_fns,
+    )
+    B = mol.nao
+    for M, key in zip(integrals, ('int1e_ovlp', 'int1e_kin', 'int1e_nuc')):
+        error = onp.abs(M[:B, :B] - mol.intor(key)).max()
+        assert error < 1e-12, f'{key} error too high: {error}'
+        assert jnp.all(M[B:] == 0), f'{key} of padded basis functions must be zero'
+
+    def f(nuc_pos):
+        out = integrals_fn(
+            nuc_pos,
+            jnp.asarray(psys.atom_z.array),
+            psys.periods,  # type: ignore
+            psys.max_number_of_basis_fns,
+        )
+        return sum(jnp.sum(M**2) for M in out)
+
+    nuc_pos = jnp.asarray(psys.nuc_pos)
+    grad = jax.grad(f)(nuc_pos)
+    assert jnp.all(jnp.isfinite(grad)), 'Gradient w.r.t. nuclear positions is not finite'
+    eps = 1e-5
+    dx = onp.zeros_like(nuc_pos)
+    dx[0, 2] = eps
+    finite_diff = (f(nuc_pos + dx) - f(nuc_pos - dx)) / (2 * eps)
+    assert jnp.isclose(grad[0, 2], finite_diff, rtol=1e-6), 'Gradient mismatch'
+
+
+def test_density_fitting_integrals(basis: str = 'sto-3g', align: int = 4):
+    psys = examples.get_preloaded('water', basis=basis, include_grid=False, alignment=align)
+    mol = System.from_preloaded(psys, grid='').to_pyscf(basis)  # type: ignore
+    auxmol = df.addons.make_auxmol(mol, 'weigend')
+    args = (
+        jnp.asarray(psys.nuc_pos),
+        jnp.asarray(psys.atom_z.array),
+        psys.periods,
+        psys.max_number_of_basis_fns,
+    )
+    ints_3c, ints_2c = get_density_fitting_integrals_fn(basis, max_period=2)(*args)  # type: ignore
+    B, Q = mol.nao, auxmol.nao
+    target_3c = df.incore.aux_e2(mol, auxmol, intor='int3c2e').transpose(2, 0, 1)
+    error = onp.abs(ints_3c[:Q, :B, :B] - target_3c).max()
+    assert error < 1e-12, f'three-centre integral error too high: {error}'
+    error = onp.abs(ints_2c[:Q, :Q] - auxmol.intor('int2c2e')).max()
+    assert error < 1e-12, f'two-centre integral error too high: {error}'
+    assert jnp.all(ints_3c[Q:] == 0) and jnp.all(ints_2c[Q:] == 0)
+
+    # the direct mode reproduces the coulomb matrix of the stored tensor
+    V = ints_2c + jnp.diag(jnp.arange(len(ints_2c)) >= Q)
+    L = jnp.linalg.cholesky(V)
+    ert = jax.scipy.linalg.solve_triangular(L, ints_3c.reshape(len(V), -1), lower=True)
+    ert = ert.reshape(ints_3c.shape)
+    fock_tensors = get_fock_tensors_fn(
+        basis, 2, ElectRepTensorType.DENSITY_FITTED_DIRECT, chunk_size=8
+    )(*args[:2], jnp.asarray(psys.atom_mask), psys.fock_tensors.occupancies, *args[2:])  # type: ignore
+    mask = fock_tensors.basis_mask
+    P = onp.random.default_rng(0).normal(size=(len(mask), len(mask))) * mask[:, None] * mask
+    P = P + P.T
+    J = jax.jit(lambda ert, P: ert.coulomb_matrix(P))(fock_tensors.ert, P)
+    J_target = jnp.einsum('Pij,Pkl,ij->kl', ert, ert, P)
+    error = jnp.abs(J - J_target).max()
+    assert error < 1e-12, f'direct coulomb matrix error too high: {error}'
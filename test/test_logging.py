@@ -0,0 +1,35 @@
+import json
+import os
+
+import jax.numpy as jnp
+import numpy as onp
+
+from egxc.utils.logging import Logger, accumulate
+
+from utils import set_jax_testing_config
+
+set_jax_testing_config()
+
+
+def test_device_side_metrics(tmp_path, monkeypatch):
+    monkeypatch.setenv('WANDB_MODE', 'disabled')
+    logger = Logger('test', {}, str(tmp_path), local_file=True)
+    values = [1.0, 2.0, onp.nan, 4.0]
+
+    logger.start_mean(['loss'])
+    sums = None
+    for i, value in enumerate(values):
+        sums = accumulate(sums, {'loss': jnp.array(value), 'step': i})
+        if i % 2 == 1:  # read every 2 steps
+            logger.log_sums(sums)
+            sums = None
+    assert logger.get_current_mean('loss') == onp.mean([1.0, 2.0, 4.0])
+    assert onp.isnan(logger.get_current_mean('loss', max_nans=0))
+    logger.stop_mean()
+    logger.close()
+
+    with open(os.path.join(tmp_path, 'metrics.jsonl')) as f:
+        records = [json.loads(line) for line in f]
+    assert records[0] == {'loss': 1.5, 'step': 0.5}
+    assert onp.isnan(records[1]['loss']) and records[1]['step'] == 2.5
+    assert onp.isnan(records[2]['mean/loss'])  # contains a NaN
@@ -0,0 +1,45 @@
+import jax
+import jax.numpy as jnp
+
+from egxc import dataloading
+from egxc.dataloading import Targets
+from egxc.systems import examples
+from egxc.utils.profiling import Profiler
+
+from utils import set_jax_testing_config
+
+set_jax_testing_config()
+
+
+def test_profiler_phases(n: int = 3):
+    water = examples.get_preloaded('water', 'sto-3g', include_grid=True)
+    samples = [(water, Targets(float(i), None, None)) for i in range(n)]
+    transform = dataloading.get_jax_transform(None, None)
+    profiler = Profiler()
+    step_fn = jax.jit(lambda P0: P0.sum())
+    for (P0, _), _ in dataloading.prefetch_to_device(samples, transform, profiler=profiler):
+        profiler.step(step_fn, P0)
+    summary = profiler.summary()
+    profiler.close()
+    for phase in ('data', 'transform', 'compute'):
+        assert summary[f'profile/{phase} [s/step]'] >= 0
+    assert profiler.steps == 0  # reset by the summary
+    assert profiler.total_steps == n
+
+
+def test_profiler_recompilations():
+    @jax.jit
+    def profiled_step(x):
+        return jnp.sin(x).sum()
+
+    profiler = Profiler()
+    for shape in (3, 3, 4):  # the second shape is compiled again
+        profiler.step(profiled_step, jnp.ones(shape))
+    summary = profiler.summary()
+    profiler.close()
+    assert summary['profile/recompilations/profiled_step'] == 1
+    assert summary['profile/compilations'] >= 2
+
+    disabled = Profiler(enabled=False)
+    disabled.step(profiled_step, jnp.ones(5))
+    assert disabled.compilations == {}
@@ -1,12 +1,18 @@
 from scipy import linalg as ref_linalg
 import numpy as onp
+import jax
 import jax.numpy as jnp
 import pytest
+from jax import random
+from jax.flatten_util import ravel_pytree
+from functools import partial
 
 from egxc.solver import fock, linalg, scf
+from egxc.solver.direct_minimization import DirectMinimizationSolver, rotate_orbitals
 from egxc.xc_energy.features import DensityFeatures
 from egxc.xc_energy.functionals.classical import mgga
-from egxc.systems import examples
+from egxc.xc_energy.functionals.learnable import Nagai2020
+from egxc.systems import examples, System
 from egxc.systems.base import nuclear_energy
 
 from utils import PyscfSystemWrapper as PySys
@@ -32,10 +38,88 @@ def test_generalized_eigenvalue_solver():
     assert onp.allclose(onp.abs(C), onp.abs(C_ref)), f'{C} != {C_ref}'
 
 
+@pytest.mark.parametrize('orthogonalizer', list(linalg.ORTHOGONALIZERS))
+def test_orthogonalizer(orthogonalizer):
+    rng = onp.random.default_rng(0)
+    n, n_pad = 6, 2
+    F = rng.normal(size=(n, n))
+    F = F + F.T
+    S = rng.normal(size=(n, n))
+    S = S @ S.T + n * onp.eye(n)
+    e_ref = ref_linalg.eigh(F, S, eigvals_only=True)
+    # padded basis functions have an identity block in S and zero entries in F
+    basis_mask = jnp.arange(n + n_pad) < n
+    S_padded = jnp.asarray(ref_linalg.block_diag(S, onp.eye(n_pad)))
+    X = linalg.transformation_matrix(S_padded, basis_mask, orthogonalizer)
+    removed = jnp.all(X == 0, axis=0)
+    assert onp.allclose(X[n:], 0) and jnp.sum(removed) == n_pad
+    assert onp.allclose(X.T @ S_padded @ X, jnp.diag(~removed))
+    F_padded = jnp.asarray(onp.pad(F, (0, n_pad)))
+    e, C = linalg.modified_generalized_eigenvalue_problem(F_padded, X)  # type: ignore
+    assert onp.allclose(e[:n], e_ref)
+    assert onp.allclose(C[:, n:], 0)
+
+
+def test_linear_dependency_removal():
+    rng = onp.random.default_rng(0)
+    n = 5
+    A = rng.normal(size=(n, n))
+    A[:, -1] = A[:, 0]  # duplicated basis function
+    S = jnp.asarray(A.T @ A)
+    H = rng.normal(size=(n, n))
+    F = jnp.asarray(A.T @ (H + H.T) @ A)
+    X = linalg.transformation_matrix(S, orthogonalizer='canonical')
+    assert jnp.sum(jnp.all(X == 0, axis=0)) == 1
+    # the eigenvalues of the retained subspace, spanned by the first n - 1 functions
+    e_ref = ref_linalg.eigh(F[:-1, :-1], S[:-1, :-1], eigvals_only=True)
+    e, _ = linalg.modified_generalized_eigenvalue_problem(F, X)  # type: ignore
+    assert onp.allclose(e[:-1], e_ref)
+
+
+@pytest.mark.parametrize('occupied', [1, 3, 5])
+def test_purified_density_matrix(occupied):
+    rng = onp.random.default_rng(0)
+    n = 8
+    F = rng.normal(size=(n, n))
+    F = jnp.asarray(F + F.T)
+    S = rng.normal(size=(n, n))
+    S = jnp.asarray(S @ S.T + n * onp.eye(n))
+    X = linalg.transformation_matrix(S)
+    occupancy = 2 * (jnp.arange(n) < occupied)
+    _, C = linalg.modified_generalized_eigenvalue_problem(F, X)  # type: ignore
+    P = linalg.coeff_to_density_matrix(C, occupancy)
+    P_purified = linalg.purified_density_matrix(F, X, occupancy, 50)  # type: ignore
+    assert onp.allclose(P_purified, P, atol=1e-10)
+
+
+def test_level_shift():
+    onp.random.seed(0)
+    n, shift = 6, 0.5
+    F = onp.random.randn(n, n)
+    F = F + F.T
+    S = onp.random.randn(n, n)
+    S = S @ S.T + n * onp.eye(n)
+    X = linalg.transformation_matrix(jnp.array(S))  # type: ignore
+    e, C = linalg.modified_generalized_eigenvalue_problem(F, X)  # type: ignore
+    occupancy = jnp.array([2, 2, 0, 0, 0, 0])
+    P = linalg.coeff_to_density_matrix(C, occupancy)
+    e_shifted, _ = linalg.modified_generalized_eigenvalue_problem(
+        F, X, level_shift=shift, occupied_projector=S @ P @ S / 2  # type: ignore
+    )
+    # the occupied orbitals are unchanged, the virtual orbitals are shifted up
+    assert onp.allclose(e_shifted, e + shift * (occupancy == 0))
+    gap = linalg.homo_lumo_gap(e_shifted, occupancy)  # type: ignore
+    assert onp.isclose(gap, e[2] - e[1] + shift)
+
+
 @pytest.mark.parametrize(
     'spin_restricted', [True, False], ids=['restricted', 'unrestricted']
 )
-@pytest.mark.parametrize('conv_acc_method', ['Vanilla', 'DIIS'], ids=['Vanilla', 'DIIS'])
+@pytest.mark.parametrize(
+    'conv_acc_method',
+    ['Vanilla', 'DIIS', 'EDIIS', 'ADIIS'],
+    ids=['Vanilla', 'DIIS', 'EDIIS', 'ADIIS'],
+)
 def test_scf_method(spin_restricted, conv_acc_method):
     basis = '6-31G(d)'
     ert_type = ERTT.EXACT
@@ -57,7 +141,7 @@ def test_scf_method(spin_restricted, conv_acc_method):
         spin_restricted=spin_restricted,
     )
 
-    if not conv_acc_method == 'DIIS':
+    if conv_acc_method == 'Vanilla':
         pyscf_sys.mf.diis = None
     pyscf_sys.mf.max_cycle = CYCLES
     pyscf_sys.mf.kernel()
@@ -74,3 +158,173 @@ def test_scf_method(spin_restricted, conv_acc_method):
     assert (
         abs(e_tot - e_ref) < 3e-6
     ), f'Total energy does not match {e_tot:.8e} != {e_ref:.8e}, difference {(e_tot - e_ref):.3e} Ha'  # type: ignore
+
+
+def test_scf_purification():
+    basis = '6-31G(d)'
+    ert_type = ERTT.EXACT
+    xc_mod = fock.XCModule(mgga.MetaGGA(), DensityFeatures(True))
+    scf_solver = scf.SelfConsistentFieldSolver(
+        xc_mod, 15, ert_type, density_matrix_solver='purification'
+    )
+    # padded basis functions widen the spectrum that is mapped into [0, 1]
+    sys = examples.get('water', basis, ert_type=ert_type, alignment=8)
+    pyscf_sys = PySys(sys, basis, xc='SCAN', grid_level=1)
+    pyscf_sys.mf.kernel()
+
+    P_0 = pyscf_sys.initial_density_matrix
+    b_pad = len(sys.fock_tensors.basis_mask) - len(P_0)
+    P_0 = onp.pad(P_0, (0, b_pad))
+
+    (e_hj, e_xc), _ = call_module_as_function(scf_solver, P_0, sys, jit=True)  # type: ignore
+    e_tot = (e_xc + e_hj)[-1] + nuclear_energy(sys._nuc_pos, sys)
+    e_ref = pyscf_sys.total_energy
+    assert abs(e_tot - e_ref) < 3e-6, f'{e_tot:.8e} != {e_ref:.8e}'
+
+
+@pytest.mark.parametrize(
+    'schedule',
+    [
+        dict(damping=0.3),
+        dict(level_shift=1.0),
+        dict(damping=0.3, damping_step=0.1, target_gap=1.0),
+    ],
+    ids=['damping', 'level_shift', 'adaptive'],
+)
+def test_scf_schedule(schedule):
+    # plain SCF iterations of water oscillate without damping or level shifting
+    basis = '6-31G(d)'
+    ert_type = ERTT.EXACT
+    CYCLES = 30
+    xc_mod = fock.XCModule(mgga.MetaGGA(), DensityFeatures(True))
+    scf_solver = scf.SelfConsistentFieldSolver(
+        xc_mod, CYCLES, ert_type, convergence_acceleration_method='Vanilla', **schedule
+    )
+    sys = examples.get('water', basis, ert_type=ert_type, alignment=1)
+    pyscf_sys = PySys(sys, basis, xc='SCAN', grid_level=1)
+    pyscf_sys.mf.kernel()
+
+    (e_hj, e_xc), _ = call_module_as_function(
+        scf_solver, pyscf_sys.initial_density_matrix, sys, jit=True
+    )  # type: ignore
+    e_tot = (e_xc + e_hj)[-1] + nuclear_energy(sys._nuc_pos, sys)
+    e_ref = pyscf_sys.total_energy
+    assert abs(e_tot - e_ref) < 3e-6, f'{e_tot:.8e} != {e_ref:.8e}'
+
+
+@pytest.mark.parametrize('spin_restricted', [True, False], ids=['restricted', 'unrestricted'])
+def test_scf_converge(spin_restricted, cycles: int = 30, tolerance: float = 1e-6):
+    basis = 'sto-3g'
+    ert_type = ERTT.EXACT
+    xc_mod = fock.XCModule(mgga.MetaGGA(), DensityFeatures(spin_restricted))
+    scf_solver = scf.SelfConsistentFieldSolver(xc_mod, cycles, ert_type, spin_restricted)
+    sys = examples.get(
+        'water', basis, ert_type=ert_type, alignment=1, spin_restricted=spin_restricted
+    )
+    P_0 = PySys(sys, basis, spin_restricted=spin_restricted).initial_density_matrix
+    params = scf_solver.init(random.PRNGKey(0), P_0, sys)
+
+    (e_hj, e_xc), density_matrices = jax.jit(scf_solver.apply)(params, P_0, sys)
+    converge = jax.jit(partial(scf_solver.apply, method='converge', tolerance=tolerance))
+    (e_hj_c, e_xc_c), density_matrices_c, n = converge(params, P_0, sys)
+    assert n < cycles
+    # the trajectory of the converged SCF
+    assert onp.allclose((e_hj + e_xc)[:n], (e_hj_c + e_xc_c)[:n])
+    assert onp.all((e_hj_c + e_xc_c)[n:] == (e_hj_c + e_xc_c)[n - 1])
+    assert abs((e_hj + e_xc)[-1] - (e_hj_c + e_xc_c)[-1]) < 1e-9
+    assert onp.allclose(density_matrices[-1], density_matrices_c[-1], atol=1e-6)
+
+
+def test_rotate_orbitals():
+    rng = onp.random.default_rng(0)
+    B, O = 7, 3
+    C = jnp.asarray(rng.normal(size=(B, B)))
+    Z = jnp.asarray(rng.normal(size=(B, O))).at[:O].set(0)
+    K = jnp.zeros((B, B)).at[:, :O].set(Z)
+    assert onp.allclose(rotate_orbitals(C, Z), C @ ref_linalg.expm(K - K.T))
+
+
+@pytest.mark.parametrize(
+    'spin_restricted', [True, False], ids=['restricted', 'unrestricted']
+)
+def test_direct_minimization(spin_restricted):
+    basis = '6-31G(d)'
+    ert_type = ERTT.EXACT
+    xc_mod = fock.XCModule(mgga.MetaGGA(), DensityFeatures(spin_restricted))
+    solver = DirectMinimizationSolver(
+        xc_mod, 15, ert_type, spin_restricted, occupied_orbitals=8
+    )
+    sys = examples.get(
+        'water', basis, ert_type=ert_type, alignment=1, spin_restricted=spin_restricted
+    )
+    pyscf_sys = PySys(sys, basis, xc='SCAN', grid_level=1, spin_restricted=spin_restricted)
+    pyscf_sys.mf.kernel()
+
+    (e_hj, e_xc), _ = call_module_as_function(
+        solver, pyscf_sys.initial_density_matrix, sys, jit=True
+    )  # type: ignore
+    e_tot = (e_xc + e_hj)[-1] + nuclear_energy(sys._nuc_pos, sys)
+    e_ref = pyscf_sys.total_energy
+    assert abs(e_tot - e_ref) < 3e-6, f'{e_tot:.8e} != {e_ref:.8e}'
+
+
+@pytest.mark.parametrize('solver', ['fixed_point', 'truncated', 'direct_minimization'])
+def test_implicit_differentiation(solver, cycles: int = 40, eps: float = 1e-5):
+    ert_type = ERTT.DENSITY_FITTED
+    xc_mod = fock.XCModule(Nagai2020(hidden_dim=8), DensityFeatures(True))
+    if solver == 'direct_minimization':
+        scf_solver = DirectMinimizationSolver(xc_mod, cycles, ert_type)
+    else:
+        scf_solver = scf.SelfConsistentFieldSolver(
+            xc_mod,
+            cycles,
+            ert_type,
+            convergence_acceleration_method='DIIS',
+            backprop_cycles=None if solver == 'fixed_point' else 3,
+            implicit_differentiation=True,
+        )
+    psys = examples.get_preloaded('water', 'sto-3g', ert_type=ert_type, alignment=1)
+    sys = System.from_preloaded(psys)
+    P_0 = psys.initial_density_matrix
+    params, unravel = ravel_pytree(scf_solver.init(random.PRNGKey(0), P_0, sys))
+    rng = onp.random.default_rng(0)
+    target = rng.normal(size=P_0.shape)
+
+    def loss_fn(params):
+        _, density_matrices = scf_solver.apply(unravel(params), P_0, sys)
+        assert len(density_matrices) == cycles
+        return jnp.sum(density_matrices[-1] * target)
+
+    grad = jax.jit(jax.grad(loss_fn))(params)
+    direction = rng.normal(size=params.shape)
+    finite_diff = (
+        loss_fn(params + eps * direction) - loss_fn(params - eps * direction)
+    ) / (2 * eps)
+    assert jnp.isclose(grad @ direction, finite_diff, rtol=1e-5), 'Gradient mismatch'
+
+
+@pytest.mark.parametrize(
+    'policy, every',
+    [('nothing', 1), ('fock_and_density', 3), ('fock_build', 4)],
+    ids=['nothing', 'fock_and_density', 'fock_build'],
+)
+def test_checkpointing(policy, every, cycles: int = 7):
+    ert_type = ERTT.DENSITY_FITTED
+    xc_mod = fock.XCModule(Nagai2020(hidden_dim=8), DensityFeatures(True))
+    psys = examples.get_preloaded('water', 'sto-3g', ert_type=ert_type, alignment=1)
+    sys = System.from_preloaded(psys)
+    P_0 = psys.initial_density_matrix
+
+    def grad(**kwargs):
+        scf_solver = scf.SelfConsistentFieldSolver(xc_mod, cycles, ert_type, **kwargs)
+        params = scf_solver.init(random.PRNGKey(0), P_0, sys)
+
+        def loss_fn(params):
+            (e_hj, e_xc), density_matrices = scf_solver.apply(params, P_0, sys)
+            return (e_hj + e_xc).sum() + density_matrices.sum()
+
+        return ravel_pytree(jax.jit(jax.grad(loss_fn))(params))[0]
+
+    target = grad()
+    error = jnp.abs(grad(checkpoint_policy=policy, checkpoint_every=every) - target).max()
+    assert error < 1e-6 * jnp.abs(target).max(), f'Gradient mismatch: {error}'